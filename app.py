@@ -7,8 +7,10 @@ from application.ui import (
     show_instructions,
     create_text_input,
     create_audio_input,
+    create_locality_input,
     create_styled_radio_input,
     display_results,
+    display_debug_panel,
     create_search_button
 )
 
@@ -51,17 +53,19 @@ def main():
     if input_method == "✍️ Escribir":
         # Usar el componente de UI para entrada de texto
         sintomas_texto = create_text_input()
+        localidad = create_locality_input()
         
         if create_search_button(sintomas_texto):
             if sintomas_texto.strip():
-                procesar_sintomas(sintomas_texto.strip(), orchestrator)
+                procesar_sintomas(sintomas_texto.strip(), orchestrator, localidad)
         
     else:  # Grabación de audio
         # Usar el componente de UI para entrada de audio
+        localidad = create_locality_input()
         audio_bytes = create_audio_input()
         
         if audio_bytes:
-            procesar_audio(audio_bytes, orchestrator)
+            procesar_audio(audio_bytes, orchestrator, localidad)
     
     st.markdown('</div>', unsafe_allow_html=True)
     
@@ -72,24 +76,27 @@ def main():
     </div>
     """, unsafe_allow_html=True)
 
-def procesar_sintomas(texto_sintomas, orchestrator):
+def procesar_sintomas(texto_sintomas, orchestrator, localidad=None):
     """
     Procesa síntomas escritos usando el orquestador y muestra los resultados.
 
     :param texto_sintomas: Texto con la descripción de los síntomas del usuario
     :param orchestrator: Instancia de HealthOrchestrator para ejecutar el flujo
+    :param localidad: Localidad para priorizar prestadores cercanos (opcional)
     :return: None
     """
     with st.spinner("🔍 Analizando síntomas..."):
-        result = orchestrator.process_text_symptoms(texto_sintomas)
+        result = orchestrator.process_text_symptoms(texto_sintomas, locality=localidad)
         display_results(result)
+        display_debug_panel(result)
 
-def procesar_audio(audio_bytes, orchestrator):
+def procesar_audio(audio_bytes, orchestrator, localidad=None):
     """
     Procesa una grabación de audio: transcribe, analiza y muestra recomendaciones.
 
     :param audio_bytes: Datos de audio en formato bytes
     :param orchestrator: Instancia de HealthOrchestrator para ejecutar el flujo
+    :param localidad: Localidad para priorizar prestadores cercanos (opcional)
     :return: None
     """
     # 1) Transcribir y mostrar inmediatamente
@@ -103,11 +110,14 @@ def procesar_audio(audio_bytes, orchestrator):
     
     # 2) Continuar con el flujo completo para entidades y recomendaciones
     with st.spinner("🔍 Analizando y buscando prestadores..."):
-        result = orchestrator.process_audio_symptoms(audio_bytes, pretranscription=transcription)
+        result = orchestrator.process_audio_symptoms(
+            audio_bytes, pretranscription=transcription, locality=localidad
+        )
         # Ya mostramos la transcripción arriba; ocultarla en el bloque de resultados para no duplicar
         if transcription:
             result['transcription'] = None
         display_results(result)
+        display_debug_panel(result)
 
 if __name__ == "__main__":
     working_dir = os.path.dirname(os.path.abspath(__file__))
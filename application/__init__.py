@@ -1,9 +1,11 @@
 from .orchestration import HealthOrchestrator
+from .async_orchestration import AsyncHealthOrchestrator
 from .ui import (
     show_instructions, 
     with_status_message,
     create_text_input,
     create_audio_input,
+    create_locality_input,
     display_results,
     create_search_button,
     create_symptom_input_section
@@ -31,10 +33,12 @@ from .config import (
 
 __all__ = [
     'HealthOrchestrator',
+    'AsyncHealthOrchestrator',
     'show_instructions',
     'with_status_message',
     'create_text_input',
     'create_audio_input',
+    'create_locality_input',
     'display_results',
     'create_search_button',
     'create_symptom_input_section',
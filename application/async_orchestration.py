@@ -0,0 +1,120 @@
+import logging
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from functions.transcripcion import atranscribir_audio
+from functions.extraccion import adetectar_entidades_medicas
+from .config import APP_CONFIG
+from .pipeline import default_hooks
+from .orchestration import (
+    EXTRACTION_STAGE,
+    build_text_graph,
+    build_audio_graph,
+    text_result,
+    audio_result,
+    get_pipeline_hooks,
+    request_deadline
+)
+
+class AsyncHealthOrchestrator:
+    """
+    Variante asíncrona de HealthOrchestrator sobre los mismos grafos de etapas.
+
+    Las etapas de red (Whisper, endpoint de HF, embeddings y chat de OpenAI) usan
+    clientes asíncronos; las etapas CPU-bound (modelo local, spaCy, Chroma) se
+    delegan a executors. Un mismo event loop puede atender muchas solicitudes a la vez.
+    Comparte caché y hooks con la versión sincrónica y no muestra mensajes
+    de estado de Streamlit (pensado para workers y herramientas).
+    """
+    
+    def __init__(self, cache=None, model_executor=None, cpu_executor=None):
+        """
+        Inicializa el orquestador asíncrono.
+
+        :param cache: Caché del pipeline propio (por defecto se usan los hooks compartidos)
+        :param model_executor: Executor para la generación local (por defecto uno de APP_CONFIG)
+        :param cpu_executor: Executor para spaCy y etapas sin versión asíncrona (por defecto uno de APP_CONFIG)
+        :return: None
+        """
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        settings = APP_CONFIG["pipeline_async"]
+        self._owns_executors = (model_executor is None, cpu_executor is None)
+        self.model_executor = model_executor or ThreadPoolExecutor(
+            max_workers=settings["hilos_modelo_local"], thread_name_prefix="modelo-local"
+        )
+        self.cpu_executor = cpu_executor or ThreadPoolExecutor(
+            max_workers=settings["hilos_cpu"], thread_name_prefix="cpu"
+        )
+        self.hooks = default_hooks(cache) if cache is not None else get_pipeline_hooks()
+        extraction_stage = EXTRACTION_STAGE.derive(afn=partial(
+            adetectar_entidades_medicas, model_executor=self.model_executor, cpu_executor=self.cpu_executor
+        ))
+        self.text_graph = build_text_graph(self.hooks, extraction_stage=extraction_stage)
+        self.audio_graph = build_audio_graph(self.hooks, extraction_stage=extraction_stage)
+        self.text_graph.executor = self.audio_graph.executor = self.cpu_executor
+    
+    async def transcribe_audio(self, audio_bytes):
+        """
+        Transcribe audio a texto con el cliente asíncrono de Whisper.
+
+        :param audio_bytes: Datos de audio en bytes
+        :return: Texto transcrito o None en caso de fallo
+        """
+        try:
+            transcription = await atranscribir_audio(audio_bytes)
+            return transcription if transcription else None
+        except Exception as e:
+            self.logger.error(f"Fallo transcripción asíncrona: {e}")
+            return None
+    
+    async def process_text_symptoms(self, text_symptoms, locality=None):
+        """
+        Procesa síntomas escritos en texto y busca prestadores recomendados.
+
+        :param text_symptoms: Descripción textual de los síntomas
+        :param locality: Localidad para priorizar prestadores cercanos (opcional)
+        :return: Diccionario con claves: success, symptoms_text, entities, recommendations, error_message,
+                 timings, fallbacks, trace, usage
+        """
+        with request_deadline():
+            run = await self.text_graph.arun({"symptoms_text": text_symptoms, "locality": locality})
+        return text_result(run)
+    
+    async def process_audio_symptoms(self, audio_bytes, pretranscription=None, locality=None):
+        """
+        Procesa síntomas grabados en audio y busca prestadores recomendados.
+
+        :param audio_bytes: Datos de audio en formato bytes
+        :param pretranscription: Transcripción previa para reutilizar (opcional)
+        :param locality: Localidad para priorizar prestadores cercanos (opcional)
+        :return: Diccionario con claves: success, transcription, entities, recommendations, error_message,
+                 timings, fallbacks, trace, usage
+        """
+        with request_deadline():
+            run = await self.audio_graph.arun({
+                "audio_bytes": audio_bytes, "transcription": pretranscription, "locality": locality
+            })
+        return audio_result(run)
+    
+    async def process_many(self, texts, locality=None):
+        """
+        Procesa varios textos de síntomas en paralelo.
+
+        :param texts: Lista de descripciones textuales
+        :param locality: Localidad común (opcional)
+        :return: Lista de resultados en el mismo orden
+        """
+        return await asyncio.gather(*(self.process_text_symptoms(text, locality) for text in texts))
+    
+    def close(self):
+        """
+        Libera los executors creados por el orquestador (no los recibidos).
+
+        :return: None
+        """
+        owns_model, owns_cpu = self._owns_executors
+        if owns_model:
+            self.model_executor.shutdown(wait=False)
+        if owns_cpu:
+            self.cpu_executor.shutdown(wait=False)
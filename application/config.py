@@ -1,3 +1,5 @@
+import os
+
 # Configuraciones de la aplicación
 APP_CONFIG = {
     "titulo": "Buscador Inteligente de Prestadores de Salud",
@@ -6,7 +8,46 @@ APP_CONFIG = {
     "autor": "Equipo de Desarrollo",
     "max_segundos_audio": 60,
     "max_caracteres_texto": 1000,
-    "min_caracteres_texto": 10
+    "min_caracteres_texto": 10,
+    # Caché del pipeline por texto normalizado ("memory", "disk" o "none" para desactivarlo)
+    "cache_pipeline": {
+        "backend": os.getenv("PIPELINE_CACHE_BACKEND", "memory"),
+        "ttl_segundos": float(os.getenv("PIPELINE_CACHE_TTL_SECONDS", "3600")),
+        "max_entradas": int(os.getenv("PIPELINE_CACHE_MAX_ENTRIES", "512")),
+        "directorio": os.getenv("PIPELINE_CACHE_DIR", ".cache/pipeline")
+    },
+    # Panel de depuración con la cascada de spans (también con ?debug=1 en la URL)
+    "panel_depuracion": os.getenv("DEBUG_PANEL", "false").lower() == "true",
+    # Permite abrir el panel con ?debug=1 (expone trazas y métricas del proceso a cualquier usuario)
+    "panel_depuracion_url": os.getenv("DEBUG_PANEL_QUERY_PARAM", "false").lower() == "true",
+    # Recuperación especulativa: buscar prestadores mientras se genera la clasificación
+    "prefetch_especulativo": os.getenv("SPECULATIVE_PREFETCH", "false").lower() == "true",
+    # Presupuesto de latencia por solicitud: si lo que queda no alcanza el mínimo de una
+    # etapa, se usa su variante rápida (gazetteer en lugar del LLM, plantilla en lugar de GPT)
+    "presupuesto_latencia": {
+        "total_segundos": float(os.getenv("LATENCY_BUDGET_SECONDS", "90")),
+        "minimos_etapa": {"extraction": 20, "rag": 8}
+    },
+    # Hooks del pipeline por etapa ("transcription", "extraction", "rag")
+    "pipeline": {
+        "reintentos": {"transcription": 0, "extraction": 0, "rag": 0},
+        "espera_reintento_segundos": 0.5,
+        # Máximo de ejecuciones simultáneas por etapa (None = sin límite)
+        "limites_concurrencia": {"extraction": None}
+    },
+    # Pipeline asíncrono: hilos para el modelo local (1 = generaciones serializadas) y para spaCy
+    "pipeline_async": {
+        "hilos_modelo_local": 1,
+        "hilos_cpu": 4
+    },
+    # Servicio HTTP sin interfaz (worker.py): hilos que procesan solicitudes, solicitudes
+    # que pueden esperar un hilo libre (más allá se responde 503) y espera máxima por solicitud
+    "worker": {
+        "hilos": int(os.getenv("WORKER_THREADS", "4")),
+        "max_en_espera": int(os.getenv("WORKER_MAX_QUEUE", "16")),
+        "espera_maxima_segundos": float(os.getenv("WORKER_REQUEST_TIMEOUT_SECONDS", "120")),
+        "max_mb_audio": 25
+    }
 }
 
 # Mensajes de ayuda y sugerencias
@@ -21,6 +62,10 @@ HELP_MESSAGES = {
             "Incluya síntomas relacionados o asociados"
         ]
     },
+    "localidad": {
+        "placeholder": "Ejemplo: Posadas",
+        "ayuda": "Si la indica, se priorizan prestadores de esa localidad y los más cercanos"
+    },
     "audio_grabacion": {
         "instrucciones": [
             "Presione el micrófono para iniciar/detener",
@@ -1,23 +1,229 @@
 import logging
-from functions.transcripcion import transcribir_con_status
-from functions.extraccion import detectar_entidades_con_status
-from functions.rag import consultar_rag_con_status
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functions.transcripcion import transcribir_con_status, atranscribir_audio
+from functions.extraccion import (
+    detectar_entidades_con_status,
+    detectar_entidades_especulativo_con_status,
+    detectar_entidades_gazetteer,
+    detectar_entidades_lote,
+    adetectar_entidades_medicas
+)
+from functions.rag import consultar_rag_con_status, consultar_rag_plantilla, aconsultar_rag
+from utils.cache_utils import PipelineCache, create_cache_backend, ERROR_RESULT_PREFIX
+from utils.deadline_utils import deadline_scope
+from utils.rag_utils import get_health_service
+from utils.text_utils import normalize_text
 from .config import APP_CONFIG
+from .pipeline import Stage, StageGraph, default_hooks
+
+# Caché del pipeline compartido por todas las sesiones (el orquestador se crea en cada rerun)
+_pipeline_cache = None
+_pipeline_cache_lock = threading.Lock()
+
+# Hooks compartidos: la agrupación de solicitudes y los límites de concurrencia
+# solo tienen efecto si todas las sesiones usan las mismas instancias
+_pipeline_hooks = None
+
+def get_pipeline_cache():
+    """
+    Devuelve el caché del pipeline configurado en APP_CONFIG["cache_pipeline"].
+
+    :return: Instancia de PipelineCache o None si está desactivado
+    """
+    global _pipeline_cache
+    settings = APP_CONFIG["cache_pipeline"]
+    if settings["backend"] == "none":
+        return None
+    if _pipeline_cache is None:
+        with _pipeline_cache_lock:
+            if _pipeline_cache is None:
+                backend = create_cache_backend(
+                    settings["backend"],
+                    max_entries=settings["max_entradas"],
+                    ttl_seconds=settings["ttl_segundos"],
+                    directory=settings["directorio"]
+                )
+                _pipeline_cache = PipelineCache(backend)
+    return _pipeline_cache
+
+def get_pipeline_hooks():
+    """
+    Devuelve los hooks estándar compartidos (tiempos, caché, agrupación, límites y reintentos).
+
+    :return: Lista de StageHook
+    """
+    global _pipeline_hooks
+    if _pipeline_hooks is None:
+        cache = get_pipeline_cache()
+        with _pipeline_cache_lock:
+            if _pipeline_hooks is None:
+                _pipeline_hooks = default_hooks(cache)
+    return _pipeline_hooks
+
+def _extraction_key(args):
+    return normalize_text(args["symptoms_text"])
+
+def _rag_key(args):
+    # La versión del índice invalida las recomendaciones al recargar el dataset
+    return (
+        normalize_text(args["entities"]),
+        normalize_text(args["locality"] or ""),
+        get_health_service().index_version
+    )
+
+def _rag_cacheable(recommendations):
+    return bool(recommendations) and not recommendations.startswith(ERROR_RESULT_PREFIX)
+
+# Etapas compartidas por los flujos de texto y audio
+TRANSCRIPTION_STAGE = Stage(
+    "transcription",
+    inputs=["audio_bytes"],
+    outputs=["transcription"],
+    fn=transcribir_con_status,
+    afn=atranscribir_audio,
+    empty_message="No se pudo transcribir el audio. Verifica tu micrófono."
+)
+
+EXTRACTION_STAGE = Stage(
+    "extraction",
+    inputs=["symptoms_text"],
+    outputs=["entities"],
+    fn=detectar_entidades_con_status,
+    afn=adetectar_entidades_medicas,
+    cache_key=_extraction_key,
+    empty_message="No se pudieron identificar síntomas específicos. Intenta ser más descriptivo.",
+    fallback=detectar_entidades_gazetteer,
+    fallback_label="clasificación por palabras clave (sin modelo)"
+)
+
+# Variante que anticipa la recuperación RAG durante la generación (APP_CONFIG["prefetch_especulativo"])
+SPECULATIVE_EXTRACTION_STAGE = EXTRACTION_STAGE.derive(
+    optional=["locality"],
+    fn=detectar_entidades_especulativo_con_status,
+    afn=lambda texto, localidad=None: adetectar_entidades_medicas(texto)
+)
+
+RAG_STAGE = Stage(
+    "rag",
+    inputs=["entities"],
+    optional=["locality"],
+    outputs=["recommendations"],
+    fn=consultar_rag_con_status,
+    afn=aconsultar_rag,
+    cache_key=_rag_key,
+    cacheable=_rag_cacheable,
+    empty_message="No se encontraron prestadores para estos síntomas.",
+    fallback=consultar_rag_plantilla,
+    fallback_label="listado de prestadores sin redacción con GPT"
+)
+
+def build_text_graph(hooks, extraction_stage=EXTRACTION_STAGE, rag_stage=RAG_STAGE):
+    """
+    Grafo del flujo de texto: síntomas -> entidades -> recomendaciones.
+
+    :param hooks: Lista de StageHook
+    :param extraction_stage: Etapa de extracción (permite variantes, p. ej. con executors propios)
+    :param rag_stage: Etapa de consulta RAG
+    :return: Instancia de StageGraph
+    """
+    return StageGraph("texto", [extraction_stage, rag_stage], hooks)
+
+def build_audio_graph(hooks, transcription_stage=TRANSCRIPTION_STAGE, extraction_stage=EXTRACTION_STAGE,
+                      rag_stage=RAG_STAGE):
+    """
+    Grafo del flujo de audio: audio -> transcripción -> entidades -> recomendaciones.
+
+    La extracción es la misma etapa que en el flujo de texto, alimentada por la transcripción.
+
+    :param hooks: Lista de StageHook
+    :param transcription_stage: Etapa de transcripción
+    :param extraction_stage: Etapa de extracción
+    :param rag_stage: Etapa de consulta RAG
+    :return: Instancia de StageGraph
+    """
+    audio_extraction = extraction_stage.derive(
+        inputs=["transcription"],
+        cache_key=lambda args: normalize_text(args["transcription"]),
+        empty_message="No se pudieron identificar síntomas en la grabación. Intenta grabar nuevamente."
+    )
+    return StageGraph("audio", [transcription_stage, audio_extraction, rag_stage], hooks)
+
+def _error_message(run, prefix):
+    if run.exception is not None:
+        return f"{prefix}: {str(run.exception)}"
+    return run.error_message
+
+def request_deadline():
+    """
+    Abre el plazo de la solicitud con el presupuesto de APP_CONFIG["presupuesto_latencia"].
+
+    :return: Context manager (ver utils.deadline_utils.deadline_scope)
+    """
+    return deadline_scope(APP_CONFIG["presupuesto_latencia"]["total_segundos"])
+
+def text_result(run):
+    """
+    Convierte una ejecución del grafo de texto en el diccionario de resultado.
+
+    :param run: Instancia de PipelineRun
+    :return: Diccionario con claves: success, symptoms_text, entities, recommendations, error_message,
+             timings, fallbacks, trace, usage
+    """
+    return {
+        'success': run.success,
+        'symptoms_text': run.values.get("symptoms_text"),
+        'entities': run.values.get("entities"),
+        'recommendations': run.values.get("recommendations"),
+        'error_message': _error_message(run, "Error durante el procesamiento de síntomas"),
+        'timings': run.timings,
+        'fallbacks': run.fallbacks,
+        'trace': run.trace.waterfall() if run.trace is not None else [],
+        'usage': run.usage.summary() if run.usage is not None else None
+    }
+
+def audio_result(run):
+    """
+    Convierte una ejecución del grafo de audio en el diccionario de resultado.
+
+    :param run: Instancia de PipelineRun
+    :return: Diccionario con claves: success, transcription, entities, recommendations, error_message,
+             timings, fallbacks, trace, usage
+    """
+    return {
+        'success': run.success,
+        'transcription': run.values.get("transcription"),
+        'entities': run.values.get("entities"),
+        'recommendations': run.values.get("recommendations"),
+        'error_message': _error_message(run, "Error durante el procesamiento de audio"),
+        'timings': run.timings,
+        'fallbacks': run.fallbacks,
+        'trace': run.trace.waterfall() if run.trace is not None else [],
+        'usage': run.usage.summary() if run.usage is not None else None
+    }
 
 class HealthOrchestrator:
     """
     Orquestador principal que coordina el flujo de procesamiento de síntomas
     para la búsqueda de prestadores de salud.
+
+    Los flujos de texto y audio son dos grafos de etapas (ver application/pipeline.py)
+    sobre las mismas etapas de extracción y RAG.
     """
     
-    def __init__(self):
+    def __init__(self, cache=None):
         """
         Inicializa el orquestador con configuración básica.
 
+        :param cache: Caché del pipeline propio (por defecto se usan los hooks compartidos)
         :return: None
         """
         self.logger = logging.getLogger(__name__)
         self.logger.setLevel(logging.INFO)
+        self.hooks = default_hooks(cache) if cache is not None else get_pipeline_hooks()
+        extraction_stage = SPECULATIVE_EXTRACTION_STAGE if APP_CONFIG["prefetch_especulativo"] else EXTRACTION_STAGE
+        self.text_graph = build_text_graph(self.hooks, extraction_stage=extraction_stage)
+        self.audio_graph = build_audio_graph(self.hooks, extraction_stage=extraction_stage)
     
     def transcribe_audio(self, audio_bytes):
         """
@@ -34,117 +240,68 @@ class HealthOrchestrator:
             self.logger.error(f"Fallo transcripción rápida: {e}")
             return None
         
-    def process_text_symptoms(self, text_symptoms):
+    def process_text_symptoms(self, text_symptoms, locality=None):
         """
         Procesa síntomas escritos en texto y busca prestadores recomendados.
 
         :param text_symptoms: Descripción textual de los síntomas
-        :return: Diccionario con claves: success, symptoms_text, entities, recommendations, error_message
+        :param locality: Localidad para priorizar prestadores cercanos (opcional)
+        :return: Diccionario con claves: success, symptoms_text, entities, recommendations, error_message,
+                 timings, fallbacks, trace, usage
         """
         self.logger.info("Iniciando procesamiento de síntomas en texto")
-        
-        result = {
-            'success': False,
-            'symptoms_text': text_symptoms,
-            'entities': None,
-            'recommendations': None,
-            'error_message': None
-        }
-        
-        try:
-            # Paso 1: Extraer entidades médicas del texto
-            self.logger.info("Extrayendo entidades médicas")
-            entities = detectar_entidades_con_status(text_symptoms)
-            
-            if not entities:
-                result['error_message'] = "No se pudieron identificar síntomas específicos. Intenta ser más descriptivo."
-                self.logger.warning("No se encontraron entidades médicas en el texto")
-                return result
-                
-            result['entities'] = entities
-            
-            # Paso 2: Consultar prestadores usando RAG
-            self.logger.info("Consultando prestadores con RAG")
-            recommendations = consultar_rag_con_status(entities)
-            
-            if not recommendations:
-                result['error_message'] = "No se encontraron prestadores para estos síntomas."
-                self.logger.warning("No se encontraron recomendaciones de prestadores")
-                return result
-                
-            result['recommendations'] = recommendations
-            result['success'] = True
-            
-            self.logger.info("Procesamiento de síntomas completado exitosamente")
-            return result
-            
-        except Exception as e:
-            error_msg = f"Error durante el procesamiento de síntomas: {str(e)}"
-            result['error_message'] = error_msg
-            self.logger.error(error_msg, exc_info=True)
-            return result
+        with request_deadline():
+            run = self.text_graph.run({"symptoms_text": text_symptoms, "locality": locality})
+        return text_result(run)
     
-    def process_audio_symptoms(self, audio_bytes, pretranscription=None):
+    def process_audio_symptoms(self, audio_bytes, pretranscription=None, locality=None):
         """
         Procesa síntomas grabados en audio y busca prestadores recomendados.
 
         :param audio_bytes: Datos de audio en formato bytes
-        :param pretranscription: Transcripción previa para reutilizar (opcional)
-        :return: Diccionario con claves: success, transcription, entities, recommendations, error_message
+        :param pretranscription: Transcripción previa para reutilizar (opcional; omite la etapa de transcripción)
+        :param locality: Localidad para priorizar prestadores cercanos (opcional)
+        :return: Diccionario con claves: success, transcription, entities, recommendations, error_message,
+                 timings, fallbacks, trace, usage
         """
         self.logger.info("Iniciando procesamiento de síntomas en audio")
-        
-        result = {
-            'success': False,
-            'transcription': None,
-            'entities': None,
-            'recommendations': None,
-            'error_message': None
-        }
-        
+        with request_deadline():
+            run = self.audio_graph.run({
+                "audio_bytes": audio_bytes, "transcription": pretranscription, "locality": locality
+            })
+        return audio_result(run)
+    
+    def process_text_batch(self, texts, localities=None, max_workers=1):
+        """
+        Procesa un lote de descripciones de síntomas (modo fuera de línea).
+
+        La extracción corre por lotes (detectar_entidades_lote: generación y NER de
+        todo el lote a la vez); luego cada texto recorre el grafo de texto con sus
+        entidades ya calculadas, de modo que solo se ejecuta la etapa RAG con los
+        mismos hooks que en la UI. Si la extracción por lotes falla, cada texto la
+        hace individualmente dentro del grafo.
+
+        :param texts: Lista de descripciones de síntomas
+        :param localities: Lista de localidades alineada con texts (opcional)
+        :param max_workers: Textos del lote procesados en paralelo en la etapa RAG
+        :return: Lista de diccionarios como los de process_text_symptoms, en el mismo orden
+        """
+        localities = localities or [None] * len(texts)
         try:
-            # Paso 1: Transcribir el audio
-            self.logger.info("Transcribiendo audio")
-            transcription = pretranscription if pretranscription else transcribir_con_status(audio_bytes)
-            
-            if not transcription:
-                result['error_message'] = "No se pudo transcribir el audio. Verifica tu micrófono."
-                self.logger.warning("Fallo en la transcripción del audio")
-                return result
-                
-            result['transcription'] = transcription
-            
-            # Paso 2: Extraer entidades médicas de la transcripción
-            self.logger.info("Extrayendo entidades médicas de la transcripción")
-            entities = detectar_entidades_con_status(transcription)
-            
-            if not entities:
-                result['error_message'] = "No se pudieron identificar síntomas en la grabación. Intenta grabar nuevamente."
-                self.logger.warning("No se encontraron entidades médicas en la transcripción")
-                return result
-                
-            result['entities'] = entities
-            
-            # Paso 3: Consultar prestadores usando RAG
-            self.logger.info("Consultando prestadores con RAG")
-            recommendations = consultar_rag_con_status(entities)
-            
-            if not recommendations:
-                result['error_message'] = "No se encontraron prestadores para estos síntomas."
-                self.logger.warning("No se encontraron recomendaciones de prestadores")
-                return result
-                
-            result['recommendations'] = recommendations
-            result['success'] = True
-            
-            self.logger.info("Procesamiento de audio completado exitosamente")
-            return result
-            
+            entities = detectar_entidades_lote(texts)
         except Exception as e:
-            error_msg = f"Error durante el procesamiento de audio: {str(e)}"
-            result['error_message'] = error_msg
-            self.logger.error(error_msg, exc_info=True)
-            return result
+            self.logger.error(f"Falló la extracción por lotes, se procesa cada texto por separado: {e}")
+            entities = [None] * len(texts)
+
+        def process(index):
+            with request_deadline():
+                run = self.text_graph.run({
+                    "symptoms_text": texts[index], "entities": entities[index], "locality": localities[index]
+                })
+            return text_result(run)
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            return list(executor.map(process, range(len(texts))))
     
     def validate_input(self, input_data, min_length=None):
         """
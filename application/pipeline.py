@@ -0,0 +1,575 @@
+"""
+Motor de pipeline declarativo.
+
+Cada etapa (`Stage`) declara las entradas que consume y las salidas que produce;
+un grafo (`StageGraph`) las ordena según esas dependencias y las ejecuta en
+forma sincrónica (`run`) o asíncrona (`arun`, lanzando en paralelo las etapas
+independientes). Los hooks (`StageHook`) envuelven cada llamada y aplican de
+forma uniforme caché, presupuesto de latencia, agrupación de solicitudes,
+límites de concurrencia, reintentos y medición de tiempos.
+"""
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from .config import APP_CONFIG
+from utils.concurrency_utils import SingleFlight, AsyncSingleFlight
+from utils.deadline_utils import remaining_seconds
+from utils.metrics_utils import span, trace_scope
+from utils.usage_utils import usage_scope, stage_scope
+from utils.memory_utils import memory_checkpoint
+from utils.capture_utils import capture_scope, write_capture
+
+logger = logging.getLogger(__name__)
+
+class StageEmptyResult(Exception):
+    """
+    Una etapa obligatoria no produjo resultado; el grafo se detiene con su mensaje.
+    """
+    def __init__(self, stage, message):
+        super().__init__(message)
+        self.stage = stage
+        self.message = message
+
+async def _run_in_executor(executor, fn, *args):
+    # copy_context: el plazo de la solicitud (contextvar) debe llegar al hilo del executor
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, contextvars.copy_context().run, fn, *args)
+
+class Stage:
+    """
+    Etapa del pipeline.
+
+    :param name: Nombre único de la etapa (se usa en caché, métricas y configuración)
+    :param inputs: Nombres de las entradas requeridas, en el orden en que se pasan a la función
+    :param outputs: Nombres de las salidas (si hay una sola, la función devuelve el valor directamente)
+    :param fn: Función sincrónica
+    :param afn: Función asíncrona (opcional; si falta, `fn` se ejecuta en un executor)
+    :param optional: Entradas opcionales (None si no están disponibles), pasadas después de `inputs`
+    :param cache_key: Función args -> clave hashable (None desactiva el caché para esa llamada)
+    :param cacheable: Función resultado -> bool que decide si el resultado se guarda en caché
+    :param empty_message: Mensaje de error si la etapa no produce resultado (None = salida opcional)
+    :param retries: Reintentos ante excepciones (lo aplica RetryHook)
+    :param fallback: Función sincrónica degradada y rápida, con los mismos argumentos (la aplica DeadlineHook)
+    :param fallback_label: Descripción de la variante degradada para informar al usuario
+    """
+    def __init__(self, name, inputs, outputs, fn=None, afn=None, optional=(), cache_key=None,
+                 cacheable=None, empty_message=None, retries=0, fallback=None, fallback_label=None):
+        self.name = name
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.fn = fn
+        self.afn = afn
+        self.optional = list(optional)
+        self.cache_key = cache_key
+        self.cacheable = cacheable or (lambda value: bool(value))
+        self.empty_message = empty_message
+        self.retries = retries
+        self.fallback = fallback
+        self.fallback_label = fallback_label or name
+
+    def derive(self, **changes):
+        """
+        Crea una copia de la etapa con algunos atributos reemplazados
+        (p. ej. otra entrada u otro mensaje de error).
+
+        :param changes: Atributos a reemplazar
+        :return: Nueva instancia de Stage
+        """
+        attributes = {
+            "name": self.name, "inputs": self.inputs, "outputs": self.outputs, "fn": self.fn,
+            "afn": self.afn, "optional": self.optional, "cache_key": self.cache_key,
+            "cacheable": self.cacheable, "empty_message": self.empty_message, "retries": self.retries,
+            "fallback": self.fallback, "fallback_label": self.fallback_label,
+        }
+        attributes.update(changes)
+        return Stage(**attributes)
+
+    def arguments(self, values):
+        """
+        Toma de los valores disponibles los argumentos de la etapa.
+
+        :param values: Diccionario de valores del pipeline
+        :return: Diccionario nombre -> valor (entradas requeridas y opcionales)
+        """
+        args = {name: values[name] for name in self.inputs}
+        args.update({name: values.get(name) for name in self.optional})
+        return args
+
+    def invoke(self, args):
+        return self.fn(*args.values())
+
+    async def ainvoke(self, args, executor=None):
+        if self.afn is not None:
+            return await self.afn(*args.values())
+        return await _run_in_executor(executor, self.fn, *args.values())
+
+    def invoke_fallback(self, args):
+        return self.fallback(*args.values())
+
+    async def ainvoke_fallback(self, args, executor=None):
+        return await _run_in_executor(executor, self.fallback, *args.values())
+
+    def assign(self, values, result):
+        """
+        Guarda el resultado de la etapa en los valores del pipeline.
+
+        :param values: Diccionario de valores del pipeline
+        :param result: Valor devuelto por la función (o dict si hay varias salidas)
+        :return: None
+        """
+        if len(self.outputs) == 1:
+            values[self.outputs[0]] = result
+        else:
+            for name in self.outputs:
+                values[name] = (result or {}).get(name)
+
+    def is_empty(self, values):
+        return any(not values.get(name) for name in self.outputs)
+
+class PipelineRun:
+    """
+    Estado de una ejecución: valores producidos, tiempos por etapa, variantes
+    degradadas usadas y error (mensaje de etapa vacía o excepción, con la etapa que falló).
+
+    :param values: Valores iniciales (entradas externas)
+    """
+    def __init__(self, values):
+        self.values = dict(values)
+        self.timings = {}
+        self.cache_hits = []
+        self.skipped = []
+        self.fallbacks = {}
+        self.trace = None
+        self.usage = None
+        self.error_message = None
+        self.exception = None
+        self.failed_stage = None
+
+    @property
+    def success(self):
+        return self.error_message is None
+
+class StageHook:
+    """
+    Hook que envuelve la ejecución de cada etapa. Las subclases redefinen
+    `call` (sincrónico) y/o `acall` (asíncrono) y deben invocar `proceed`.
+    """
+    def call(self, run, stage, args, proceed):
+        return proceed()
+
+    async def acall(self, run, stage, args, proceed):
+        return await proceed()
+
+class TimingHook(StageHook):
+    """
+    Registra la duración de cada etapa en `run.timings` (segundos) y como span
+    `stage.<nombre>` en el histograma de latencias y en la traza de la solicitud.
+    """
+    def call(self, run, stage, args, proceed):
+        start = time.perf_counter()
+        try:
+            with span(f"stage.{stage.name}"):
+                return proceed()
+        finally:
+            run.timings[stage.name] = round(time.perf_counter() - start, 4)
+            logger.info(f"Etapa '{stage.name}' completada en {run.timings[stage.name]:.3f}s")
+
+    async def acall(self, run, stage, args, proceed):
+        start = time.perf_counter()
+        try:
+            with span(f"stage.{stage.name}"):
+                return await proceed()
+        finally:
+            run.timings[stage.name] = round(time.perf_counter() - start, 4)
+            logger.info(f"Etapa '{stage.name}' completada en {run.timings[stage.name]:.3f}s")
+
+class MemoryHook(StageHook):
+    """
+    Mide la memoria alrededor de cada etapa cuando MEMORY_PROFILING está activo
+    (ver utils/memory_utils.py); si no, no hace nada.
+    """
+    def call(self, run, stage, args, proceed):
+        with memory_checkpoint(f"stage.{stage.name}"):
+            return proceed()
+
+    async def acall(self, run, stage, args, proceed):
+        with memory_checkpoint(f"stage.{stage.name}"):
+            return await proceed()
+
+class CacheHook(StageHook):
+    """
+    Consulta y completa el caché del pipeline para las etapas con `cache_key`.
+
+    :param cache: Instancia de PipelineCache (None desactiva el hook)
+    """
+    def __init__(self, cache):
+        self.cache = cache
+
+    def _key(self, stage, args):
+        if self.cache is None or stage.cache_key is None:
+            return None
+        return stage.cache_key(args)
+
+    def _store(self, run, stage, key, result):
+        # Los resultados degradados no se guardan: la próxima consulta con presupuesto debe usar el modelo
+        if stage.name in run.fallbacks:
+            return
+        if result is not None and stage.cacheable(result):
+            self.cache.set(stage.name, key, result)
+
+    def call(self, run, stage, args, proceed):
+        key = self._key(stage, args)
+        if key is None:
+            return proceed()
+        cached = self.cache.get(stage.name, key)
+        if cached is not None:
+            run.cache_hits.append(stage.name)
+            return cached
+        result = proceed()
+        self._store(run, stage, key, result)
+        return result
+
+    async def acall(self, run, stage, args, proceed):
+        key = self._key(stage, args)
+        if key is None:
+            return await proceed()
+        cached = self.cache.get(stage.name, key)
+        if cached is not None:
+            run.cache_hits.append(stage.name)
+            return cached
+        result = await proceed()
+        self._store(run, stage, key, result)
+        return result
+
+class DeadlineHook(StageHook):
+    """
+    Aplica el presupuesto de latencia de la solicitud (ver utils/deadline_utils.py).
+
+    Si el tiempo restante no alcanza el mínimo de la etapa, o la etapa falla con
+    el plazo ya vencido, se usa su variante degradada (`Stage.fallback`) y se
+    registra en `run.fallbacks`.
+
+    :param minimums: Diccionario nombre de etapa -> segundos mínimos para ejecutar la versión completa
+    :param executor: Executor para las variantes degradadas en `acall` (opcional)
+    """
+    def __init__(self, minimums=None, executor=None):
+        self.minimums = minimums or {}
+        self.executor = executor
+
+    def _should_degrade(self, stage):
+        remaining = remaining_seconds()
+        if stage.fallback is None or remaining is None:
+            return False
+        return remaining < self.minimums.get(stage.name, 0)
+
+    def _exhausted(self, stage):
+        remaining = remaining_seconds()
+        return stage.fallback is not None and remaining is not None and remaining <= 0
+
+    def _mark(self, run, stage, reason):
+        run.fallbacks[stage.name] = stage.fallback_label
+        logger.warning(f"Etapa '{stage.name}' degradada a '{stage.fallback_label}' ({reason})")
+
+    def call(self, run, stage, args, proceed):
+        if self._should_degrade(stage):
+            self._mark(run, stage, f"quedan {remaining_seconds():.1f}s")
+            return stage.invoke_fallback(args)
+        try:
+            return proceed()
+        except Exception as e:
+            if not self._exhausted(stage):
+                raise
+            self._mark(run, stage, f"plazo vencido: {e}")
+            return stage.invoke_fallback(args)
+
+    async def acall(self, run, stage, args, proceed):
+        if self._should_degrade(stage):
+            self._mark(run, stage, f"quedan {remaining_seconds():.1f}s")
+            return await stage.ainvoke_fallback(args, self.executor)
+        try:
+            return await proceed()
+        except Exception as e:
+            if not self._exhausted(stage):
+                raise
+            self._mark(run, stage, f"plazo vencido: {e}")
+            return await stage.ainvoke_fallback(args, self.executor)
+
+class CoalesceHook(StageHook):
+    """
+    Agrupa llamadas idénticas en curso (misma etapa y misma clave de caché).
+    """
+    def __init__(self):
+        self._flight = SingleFlight()
+        self._async_flight = AsyncSingleFlight()
+
+    def call(self, run, stage, args, proceed):
+        if stage.cache_key is None:
+            return proceed()
+        return self._flight.do((stage.name, stage.cache_key(args)), proceed)
+
+    async def acall(self, run, stage, args, proceed):
+        if stage.cache_key is None:
+            return await proceed()
+        return await self._async_flight.do((stage.name, stage.cache_key(args)), proceed)
+
+class ConcurrencyLimitHook(StageHook):
+    """
+    Limita la cantidad de ejecuciones simultáneas por etapa.
+
+    :param limits: Diccionario nombre de etapa -> máximo de ejecuciones simultáneas
+    """
+    def __init__(self, limits):
+        self.limits = {name: limit for name, limit in (limits or {}).items() if limit}
+        self._semaphores = {name: threading.BoundedSemaphore(limit) for name, limit in self.limits.items()}
+        self._async_semaphores = {}
+
+    def call(self, run, stage, args, proceed):
+        semaphore = self._semaphores.get(stage.name)
+        if semaphore is None:
+            return proceed()
+        with semaphore:
+            return proceed()
+
+    async def acall(self, run, stage, args, proceed):
+        if stage.name not in self.limits:
+            return await proceed()
+        # Un semáforo asyncio pertenece a un único event loop
+        key = (id(asyncio.get_running_loop()), stage.name)
+        semaphore = self._async_semaphores.get(key)
+        if semaphore is None:
+            semaphore = self._async_semaphores.setdefault(key, asyncio.Semaphore(self.limits[stage.name]))
+        async with semaphore:
+            return await proceed()
+
+class RetryHook(StageHook):
+    """
+    Reintenta las etapas que lanzan excepciones, con espera exponencial.
+
+    :param retries: Reintentos por etapa (sobrescribe `Stage.retries`)
+    :param backoff_seconds: Espera base entre intentos
+    """
+    def __init__(self, retries=None, backoff_seconds=0.5):
+        self.retries = retries or {}
+        self.backoff_seconds = backoff_seconds
+
+    def _attempts(self, stage):
+        return 1 + max(0, self.retries.get(stage.name, stage.retries))
+
+    def _can_wait(self, delay):
+        remaining = remaining_seconds()
+        return remaining is None or remaining > delay
+
+    def call(self, run, stage, args, proceed):
+        attempts = self._attempts(stage)
+        for attempt in range(attempts):
+            try:
+                return proceed()
+            except Exception as e:
+                delay = self.backoff_seconds * (2 ** attempt)
+                if attempt == attempts - 1 or not self._can_wait(delay):
+                    raise
+                logger.warning(f"Etapa '{stage.name}' falló ({e}); reintento {attempt + 1}/{attempts - 1}")
+                time.sleep(delay)
+
+    async def acall(self, run, stage, args, proceed):
+        attempts = self._attempts(stage)
+        for attempt in range(attempts):
+            try:
+                return await proceed()
+            except Exception as e:
+                delay = self.backoff_seconds * (2 ** attempt)
+                if attempt == attempts - 1 or not self._can_wait(delay):
+                    raise
+                logger.warning(f"Etapa '{stage.name}' falló ({e}); reintento {attempt + 1}/{attempts - 1}")
+                await asyncio.sleep(delay)
+
+def default_hooks(cache=None):
+    """
+    Hooks estándar del pipeline, en orden de afuera hacia adentro.
+
+    :param cache: Instancia de PipelineCache (opcional)
+    :return: Lista de hooks configurados desde APP_CONFIG["pipeline"] y APP_CONFIG["presupuesto_latencia"]
+    """
+    settings = APP_CONFIG["pipeline"]
+    return [
+        TimingHook(),
+        MemoryHook(),
+        CacheHook(cache),
+        DeadlineHook(APP_CONFIG["presupuesto_latencia"]["minimos_etapa"]),
+        CoalesceHook(),
+        ConcurrencyLimitHook(settings["limites_concurrencia"]),
+        RetryHook(settings["reintentos"], settings["espera_reintento_segundos"]),
+    ]
+
+class StageGraph:
+    """
+    Grafo de etapas ordenado por sus dependencias de datos.
+
+    :param name: Nombre del flujo (p. ej. "texto", "audio")
+    :param stages: Lista de Stage
+    :param hooks: Lista de StageHook aplicados a cada etapa (el primero es el más externo)
+    :param executor: Executor para etapas sin versión asíncrona en `arun` (opcional)
+    """
+    def __init__(self, name, stages, hooks=(), executor=None):
+        self.name = name
+        self.stages = list(stages)
+        self.hooks = list(hooks)
+        self.executor = executor
+        self.order = self._topological_order()
+        produced = {output for stage in self.stages for output in stage.outputs}
+        self.external_inputs = sorted({
+            name for stage in self.stages for name in stage.inputs if name not in produced
+        })
+
+    def _producers(self):
+        producers = {}
+        for stage in self.stages:
+            for output in stage.outputs:
+                if output in producers:
+                    raise ValueError(f"La salida '{output}' la producen dos etapas")
+                producers[output] = stage
+        return producers
+
+    def _dependencies(self, stage, producers):
+        return {
+            producers[name].name for name in stage.inputs + stage.optional
+            if name in producers and producers[name] is not stage
+        }
+
+    def _topological_order(self):
+        """
+        Ordena las etapas de forma que cada una corra después de las que producen sus entradas.
+
+        :return: Lista de Stage
+        """
+        producers = self._producers()
+        pending = {stage.name: self._dependencies(stage, producers) for stage in self.stages}
+        by_name = {stage.name: stage for stage in self.stages}
+        order = []
+        while pending:
+            ready = [name for name, deps in pending.items() if not deps]
+            if not ready:
+                raise ValueError(f"Dependencias cíclicas en el grafo '{self.name}': {sorted(pending)}")
+            for name in ready:
+                order.append(by_name[name])
+                del pending[name]
+            for deps in pending.values():
+                deps.difference_update(ready)
+        return order
+
+    def _already_satisfied(self, stage, values):
+        return all(values.get(name) for name in stage.outputs)
+
+    def _check_inputs(self, values):
+        missing = [name for name in self.external_inputs if name not in values]
+        if missing:
+            raise ValueError(f"Faltan entradas para el grafo '{self.name}': {missing}")
+
+    def _finish_stage(self, run, stage, result):
+        stage.assign(run.values, result)
+        if stage.empty_message and stage.is_empty(run.values):
+            raise StageEmptyResult(stage.name, stage.empty_message)
+
+    def _call(self, run, stage, args):
+        proceed = lambda: stage.invoke(args)
+        for hook in reversed(self.hooks):
+            proceed = (lambda hook, inner: lambda: hook.call(run, stage, args, inner))(hook, proceed)
+        # Las llamadas a modelos dentro de la etapa se le atribuyen en el registro de uso
+        with stage_scope(stage.name):
+            return proceed()
+
+    async def _acall(self, run, stage, args):
+        proceed = lambda: stage.ainvoke(args, self.executor)
+        for hook in reversed(self.hooks):
+            proceed = (lambda hook, inner: lambda: hook.acall(run, stage, args, inner))(hook, proceed)
+        with stage_scope(stage.name):
+            return await proceed()
+
+    def run(self, values):
+        """
+        Ejecuta el grafo en orden topológico.
+
+        Las etapas cuyas salidas ya vienen en `values` se omiten (p. ej. una
+        transcripción previa). Si una etapa obligatoria no produce resultado o
+        lanza una excepción, la ejecución se detiene y el error queda en el resultado.
+
+        :param values: Entradas externas del grafo
+        :return: Instancia de PipelineRun
+        """
+        self._check_inputs(values)
+        run = PipelineRun(values)
+        stage = None
+        with trace_scope(self.name) as run.trace, usage_scope() as run.usage, capture_scope(self.name) as capture:
+            try:
+                for stage in self.order:
+                    if self._already_satisfied(stage, run.values):
+                        run.skipped.append(stage.name)
+                        continue
+                    result = self._call(run, stage, stage.arguments(run.values))
+                    self._finish_stage(run, stage, result)
+            except StageEmptyResult as e:
+                run.failed_stage, run.error_message = e.stage, e.message
+                logger.warning(f"[{self.name}] {e.message}")
+            except Exception as e:
+                self._record_exception(run, stage, e)
+        write_capture(capture, run)
+        return run
+
+    def _record_exception(self, run, stage, error):
+        run.failed_stage = stage.name if stage is not None else None
+        run.exception = error
+        run.error_message = str(error)
+        logger.error(f"[{self.name}] Error en la etapa '{run.failed_stage}': {error}", exc_info=error)
+
+    async def arun(self, values):
+        """
+        Ejecuta el grafo de forma asíncrona, lanzando cada etapa apenas
+        están disponibles sus entradas (las independientes corren en paralelo).
+
+        :param values: Entradas externas del grafo
+        :return: Instancia de PipelineRun
+        """
+        with trace_scope(self.name) as trace, usage_scope() as usage, capture_scope(self.name) as capture:
+            run = await self._arun(values)
+            run.trace, run.usage = trace, usage
+        write_capture(capture, run)
+        return run
+
+    async def _arun(self, values):
+        self._check_inputs(values)
+        run = PipelineRun(values)
+        stage = None
+        producers = self._producers()
+        pending = {stage.name: stage for stage in self.order}
+        done = set()
+        running = {}
+        try:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if not self._dependencies(stage, producers) <= done:
+                        continue
+                    del pending[name]
+                    if self._already_satisfied(stage, run.values):
+                        run.skipped.append(name)
+                        done.add(name)
+                        continue
+                    task = asyncio.ensure_future(self._acall(run, stage, stage.arguments(run.values)))
+                    running[task] = stage
+                if not running:
+                    continue
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    stage = running.pop(task)
+                    self._finish_stage(run, stage, task.result())
+                    done.add(stage.name)
+        except StageEmptyResult as e:
+            run.failed_stage, run.error_message = e.stage, e.message
+            logger.warning(f"[{self.name}] {e.message}")
+        except Exception as e:
+            self._record_exception(run, stage, e)
+        finally:
+            for task in running:
+                task.cancel()
+        return run
@@ -1,10 +1,26 @@
+import html
+import json
 import streamlit as st
 from functools import wraps
+from utils.metrics_utils import export_prometheus, export_json
 from .config import APP_CONFIG, HELP_MESSAGES
 
+def _has_streamlit_context():
+    """
+    Indica si el hilo actual ejecuta un script de Streamlit (y no, p. ej., worker.py o un hilo propio).
+
+    :return: bool
+    """
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return True
+    return get_script_run_ctx() is not None
+
 def with_status_message(message):
     """
     Decorador para mostrar un mensaje de estado mientras se ejecuta una función.
+    Fuera de una sesión de Streamlit (servicio HTTP, herramientas) solo ejecuta la función.
 
     :param message: Mensaje a mostrar durante la ejecución
     :return: Función decorada que muestra el mensaje de estado
@@ -12,6 +28,8 @@ def with_status_message(message):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
+            if not _has_streamlit_context():
+                return func(*args, **kwargs)
             status_placeholder = st.empty()
             with status_placeholder.container():
                 st.info(message)
@@ -127,6 +145,22 @@ def create_text_input():
     return sintomas_texto
 
 
+def create_locality_input(key="localidad"):
+    """
+    Crea el campo opcional de localidad para priorizar prestadores cercanos.
+
+    :param key: Clave única del widget
+    :return: Localidad ingresada o None si se dejó vacío
+    """
+    localidad = st.text_input(
+        "Localidad (opcional)",
+        placeholder=HELP_MESSAGES["localidad"]["placeholder"],
+        help=HELP_MESSAGES["localidad"]["ayuda"],
+        key=key
+    )
+    return localidad.strip() or None
+
+
 def create_audio_input():
     """
     Crea la interfaz de grabación de audio.
@@ -176,6 +210,11 @@ def display_results(result_data):
             st.markdown('<div class="result-box">', unsafe_allow_html=True)
             st.markdown(result_data['recommendations'])
             st.markdown('</div>', unsafe_allow_html=True)
+
+        # Avisar si por falta de tiempo se usaron variantes rápidas
+        if result_data.get('fallbacks'):
+            used = ", ".join(result_data['fallbacks'].values())
+            st.caption(f"⏱️ Para responder a tiempo se usó: {used}.")
             
         # Botón para nueva búsqueda
         col1, col2, col3 = st.columns([1, 2, 1])
@@ -206,6 +245,54 @@ def display_results(result_data):
             """)
 
 
+def debug_panel_enabled():
+    """
+    Indica si se muestra el panel de depuración (APP_CONFIG o, si
+    APP_CONFIG["panel_depuracion_url"] lo permite, parámetro ?debug=1 en la URL).
+
+    :return: True si está habilitado
+    """
+    if APP_CONFIG["panel_depuracion"]:
+        return True
+    return APP_CONFIG["panel_depuracion_url"] and st.query_params.get("debug") == "1"
+
+def display_debug_panel(result_data):
+    """
+    Muestra (oculto por defecto) la cascada de spans de la solicitud y la exportación de métricas.
+
+    :param result_data: Diccionario con los datos del resultado del procesamiento
+    :return: None
+    """
+    if not debug_panel_enabled():
+        return
+    trace = result_data.get('trace') or []
+    with st.expander("🛠️ Depuración: cascada de la solicitud"):
+        if trace:
+            total_ms = max(item["start_ms"] + item["duration_ms"] for item in trace) or 1
+            rows = []
+            for item in trace:
+                left = 100 * item["start_ms"] / total_ms
+                width = max(0.5, 100 * item["duration_ms"] / total_ms)
+                color = "#C0392B" if "error" in item["attributes"] else "#2E8B57"
+                rows.append(
+                    '<div style="display:flex;align-items:center;gap:8px;font-size:0.8rem">'
+                    f'<span style="width:30%;overflow:hidden">{html.escape(item["name"])}</span>'
+                    '<div style="flex:1;position:relative;height:12px;background:#f0f0f0">'
+                    f'<div style="position:absolute;left:{left:.1f}%;width:{width:.1f}%;height:100%;'
+                    f'background:{color}"></div></div>'
+                    f'<span style="width:80px;text-align:right">{item["duration_ms"]:.0f} ms</span></div>'
+                )
+            st.markdown("".join(rows), unsafe_allow_html=True)
+            st.code(json.dumps(trace, ensure_ascii=False, indent=2, default=str), language="json")
+        else:
+            st.caption("Sin spans registrados para esta solicitud.")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("Métricas (Prometheus)", export_prometheus(), file_name="metrics.prom")
+        with col2:
+            st.download_button("Métricas (JSON)", export_json(), file_name="metrics.json")
+
+
 def create_search_button(text_symptoms=None, disabled=False):
     """
     Crea el botón de búsqueda con validación.
@@ -1,13 +1,29 @@
 
+import json
+import asyncio
+import contextvars
 from utils import generate_with_hugging_face, extract_entities_with_spacy
 from application.ui import with_status_message
-    
-def detectar_entidades_medicas(texto):
+from utils.hf_utils import (
+    preload_model, agenerate_with_hugging_face, stream_with_hugging_face, generate_batch_with_hugging_face
+)
+from utils.rag_utils import get_health_service
+from utils.speculation_utils import SpeculativePrefetch
+from utils.specialty_utils import specialties_from_symptoms
+from utils.capture_utils import capture_value
+from utils.spacy_utils import preload_model as preload_spacy_model, extract_entities_batch_with_spacy
+
+# Carga de modelos al importar el módulo (solo una vez al inicio de la app)
+preload_model()
+preload_spacy_model()
+
+def detectar_entidades_medicas(texto, on_partial=None):
     """
     Extrae las entidades detectadas en el texto de la transcripción y
     las clasifica según la(s) especialidad(es) médica(s) asociada(s).
 
     :param texto: Texto obtenido de la transcripción o ingresado por el usuario
+    :param on_partial: Función que recibe la clasificación parcial mientras se genera (opcional; activa el streaming)
     :return: Descripción en español de la(s) especialidad(es) médica(s) detectada(s)
     """
     print(f"[DEBUG EXTRACCION] Input texto: {texto}")
@@ -15,17 +31,39 @@ def detectar_entidades_medicas(texto):
     # Buscar casos de estos sintomas con modelo de Hugging Face
     busqueda_resultados = generate_with_hugging_face(texto, "es", "en")
     print(f"[DEBUG EXTRACCION] Resultado HF (es->en): {busqueda_resultados}")
+    capture_value("hf.es_en", busqueda_resultados)
     
     # Extraer entidades con NER de spaCy
     entidades = extract_entities_with_spacy(busqueda_resultados)
     print(f"[DEBUG EXTRACCION] Entidades spaCy: {entidades}")
+    capture_value("spacy.entities", entidades)
     
     # Clasificar entidades con modelo de Hugging Face
-    clasificacion_resultados = generate_with_hugging_face(entidades, "en", "es")
+    if on_partial is None:
+        clasificacion_resultados = generate_with_hugging_face(entidades, "en", "es")
+    else:
+        clasificacion_resultados = ""
+        for fragmento in stream_with_hugging_face(entidades, "en", "es"):
+            clasificacion_resultados += fragmento
+            on_partial(clasificacion_resultados)
     print(f"[DEBUG EXTRACCION] Resultado final (en->es): {clasificacion_resultados}")
     
     return clasificacion_resultados
 
+def detectar_entidades_lote(textos):
+    """
+    Versión por lotes de detectar_entidades_medicas (procesamiento fuera de línea).
+
+    Cada paso (traducción, NER y clasificación) procesa todo el lote a la vez.
+
+    :param textos: Lista de textos de síntomas
+    :return: Lista de clasificaciones en español, en el mismo orden
+    """
+    print(f"[DEBUG EXTRACCION] Lote de {len(textos)} textos")
+    busquedas = generate_batch_with_hugging_face(textos, "es", "en")
+    entidades = extract_entities_batch_with_spacy(busquedas)
+    return generate_batch_with_hugging_face(entidades, "en", "es")
+
 @with_status_message("Detectando entidades médicas...")
 def detectar_entidades_con_status(transcripcion):
     """
@@ -34,4 +72,62 @@ def detectar_entidades_con_status(transcripcion):
     :param transcripcion: Texto de entrada sobre el cual se identificarán entidades médicas
     :return: Descripción en español de la(s) especialidad(es) médica(s) detectada(s)
     """
-    return detectar_entidades_medicas(transcripcion)
\ No newline at end of file
+    return detectar_entidades_medicas(transcripcion)
+
+@with_status_message("Detectando entidades médicas...")
+def detectar_entidades_especulativo_con_status(transcripcion, localidad=None):
+    """
+    Detecta entidades médicas iniciando la búsqueda de prestadores en cuanto la
+    clasificación parcial contiene una especialidad (recuperación especulativa).
+
+    :param transcripcion: Texto de entrada sobre el cual se identificarán entidades médicas
+    :param localidad: Localidad de la búsqueda posterior (opcional)
+    :return: Descripción en español de la(s) especialidad(es) médica(s) detectada(s)
+    """
+    prefetch = SpeculativePrefetch(get_health_service(), localidad)
+    resultado = None
+    try:
+        resultado = detectar_entidades_medicas(transcripcion, on_partial=prefetch.feed)
+        return resultado
+    finally:
+        prefetch.settle(resultado)
+
+def detectar_entidades_gazetteer(texto, localidad=None):
+    """
+    Clasifica los síntomas por palabras clave, sin LLM (modo degradado por presupuesto de latencia).
+
+    :param texto: Texto obtenido de la transcripción o ingresado por el usuario
+    :param localidad: No se usa; mantiene la firma de las demás variantes
+    :return: JSON con el campo medical_specialty
+    """
+    especialidades = specialties_from_symptoms(texto, normalizer=get_health_service().specialty_normalizer)
+    print(f"[DEBUG EXTRACCION] Gazetteer: {especialidades}")
+    capture_value("gazetteer.specialties", especialidades)
+    return json.dumps({"medical_specialty": especialidades}, ensure_ascii=False)
+
+async def adetectar_entidades_medicas(texto, model_executor=None, cpu_executor=None):
+    """
+    Versión asíncrona de detectar_entidades_medicas.
+
+    Las generaciones usan el endpoint remoto de forma asíncrona (o el modelo
+    local en `model_executor`) y el NER de spaCy corre en `cpu_executor`.
+
+    :param texto: Texto obtenido de la transcripción o ingresado por el usuario
+    :param model_executor: Executor para la generación local (opcional)
+    :param cpu_executor: Executor para spaCy (opcional, por defecto el del event loop)
+    :return: Descripción en español de la(s) especialidad(es) médica(s) detectada(s)
+    """
+    print(f"[DEBUG EXTRACCION] Input texto (async): {texto}")
+    busqueda_resultados = await agenerate_with_hugging_face(texto, "es", "en", executor=model_executor)
+    capture_value("hf.es_en", busqueda_resultados)
+    
+    loop = asyncio.get_running_loop()
+    entidades = await loop.run_in_executor(
+        cpu_executor, contextvars.copy_context().run, extract_entities_with_spacy, busqueda_resultados
+    )
+    print(f"[DEBUG EXTRACCION] Entidades spaCy (async): {entidades}")
+    capture_value("spacy.entities", entidades)
+    
+    clasificacion_resultados = await agenerate_with_hugging_face(entidades, "en", "es", executor=model_executor)
+    print(f"[DEBUG EXTRACCION] Resultado final (async): {clasificacion_resultados}")
+    return clasificacion_resultados
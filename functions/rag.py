@@ -1,32 +1,71 @@
 from utils import query_contacts_with_langchain
 from application.ui import with_status_message
 from utils.rag_utils import get_health_service
+from utils.deadline_utils import deadline_expired
+from utils.reload_utils import start_dataset_watcher
 
 # Inicialización de RAG al cargar el módulo (solo una vez al inicio de la app)
 get_health_service()
+# Recarga en caliente del índice cuando cambia el dataset o aparece un snapshot nuevo
+start_dataset_watcher()
 
-def consultar_rag(text):
+def consultar_rag(text, localidad=None):
     """
     Realiza una consulta al sistema RAG para obtener prestadores de salud.
 
     :param text: Texto o JSON con la(s) especialidad(es) a buscar
+    :param localidad: Localidad para restringir la búsqueda (opcional)
     :return: Respuesta formateada con la lista de contactos o mensaje de error
     """
     try:
-        print(f"[DEBUG RAG] Input recibido: {text}")
-        result = query_contacts_with_langchain(text)
+        print(f"[DEBUG RAG] Input recibido: {text} (localidad: {localidad})")
+        result = query_contacts_with_langchain(text, locality=localidad)
         print(f"[DEBUG RAG] Resultado: {result[:200]}...")
         return result
     except Exception as e:
+        if deadline_expired():
+            # Plazo vencido: DeadlineHook responde con la variante por plantilla
+            raise
         print(f"[DEBUG RAG] Error: {str(e)}")
         return f"Error en consulta RAG: {str(e)}"
     
 @with_status_message("Buscando contactos de prestadores...")
-def consultar_rag_con_status(entidades_medicas):
+def consultar_rag_con_status(entidades_medicas, localidad=None):
     """
     Consulta el sistema RAG mostrando un mensaje de estado durante el proceso.
 
     :param entidades_medicas: Texto o JSON con especialidades médicas a buscar
+    :param localidad: Localidad para restringir la búsqueda (opcional)
     :return: Respuesta formateada con la lista de contactos o mensaje de error
     """
-    return consultar_rag(entidades_medicas)
\ No newline at end of file
+    return consultar_rag(entidades_medicas, localidad)
+
+def consultar_rag_plantilla(text, localidad=None):
+    """
+    Consulta el sistema RAG sin LLM: arma la respuesta con una plantilla (modo degradado).
+
+    :param text: Texto o JSON con la(s) especialidad(es) a buscar
+    :param localidad: Localidad para restringir la búsqueda (opcional)
+    :return: Respuesta formateada con la lista de contactos o mensaje de error
+    """
+    try:
+        return query_contacts_with_langchain(text, locality=localidad, render="template")
+    except Exception as e:
+        print(f"[DEBUG RAG] Error: {str(e)}")
+        return f"Error en consulta RAG: {str(e)}"
+
+async def aconsultar_rag(text, localidad=None):
+    """
+    Versión asíncrona de consultar_rag.
+
+    :param text: Texto o JSON con la(s) especialidad(es) a buscar
+    :param localidad: Localidad para restringir la búsqueda (opcional)
+    :return: Respuesta formateada con la lista de contactos o mensaje de error
+    """
+    try:
+        return await get_health_service().asearch(text, locality=localidad)
+    except Exception as e:
+        if deadline_expired():
+            raise
+        print(f"[DEBUG RAG] Error: {str(e)}")
+        return f"Error en consulta RAG: {str(e)}"
@@ -1,4 +1,5 @@
 from utils import transcribe_audio_with_whisper
+from utils.whisper_utils import atranscribe_audio_with_whisper
 from application.ui import with_status_message
 
 def transcribir_audio(audio_bytes):
@@ -22,4 +23,17 @@ def transcribir_con_status(audio_bytes):
     :param audio_bytes: Bytes con los datos del audio a transcribir
     :return: Texto obtenido en la transcripción o mensaje de error
     """
-    return transcribir_audio(audio_bytes)
\ No newline at end of file
+    return transcribir_audio(audio_bytes)
+
+async def atranscribir_audio(audio_bytes):
+    """
+    Versión asíncrona de transcribir_audio.
+
+    :param audio_bytes: Bytes con los datos del audio a transcribir
+    :return: Texto obtenido en la transcripción o mensaje de error
+    """
+    try:
+        return await atranscribe_audio_with_whisper(audio_bytes)
+    except Exception as e:
+        print(f"[DEBUG TRANSCRIPCION] Error: {str(e)}")
+        return f"Error en transcripción: {str(e)}"
@@ -0,0 +1,254 @@
+"""
+Servidor de modelos compartido entre procesos.
+
+Carga una sola vez Sam_Diagnostic (generación local) y scispaCy (NER) y los
+atiende por un socket local para varias réplicas de la app de Streamlit o de
+worker.py: los clientes configuran MODEL_SERVER_ADDRESS y
+`generate_with_hugging_face`/`extract_entities_with_spacy` (y sus variantes por
+lotes y en streaming) envían las solicitudes aquí en lugar de cargar los pesos
+(ver utils/model_client.py). La memoria de los modelos deja de multiplicarse
+por la cantidad de procesos.
+
+Protocolo (`multiprocessing.connection`, un objeto JSON por mensaje; nunca pickle):
+    {"op": "generate", "input_text": ...}             -> {"result": texto, "usage": {...}}
+    {"op": "generate_batch", "input_texts": [...]}    -> {"result": [textos], "usage": {...}}
+    {"op": "stream", "input_text": ...}               -> {"fragment": ...}* y {"done": True, "usage": {...}}
+    {"op": "entities", "text": ...}                   -> {"result": entidades}
+    {"op": "entities_batch", "texts": [...]}          -> {"result": [entidades]}
+    {"op": "ping"}                                    -> {"result": {"models": [...], "pid": ...}}
+Cada solicitud lleva "deadline" (segundos restantes del plazo o None); los errores
+se responden como {"error": mensaje, "timeout": bool}. En una dirección TCP que no
+sea de loopback el servidor no inicia sin MODEL_SERVER_AUTHKEY.
+
+Uso:
+    python model_server.py --address /tmp/buscador-modelos.sock
+    MODEL_SERVER_AUTHKEY=... python model_server.py --address 0.0.0.0:7070 --generation-slots 1
+    python model_server.py --address 127.0.0.1:7070 --check
+"""
+import os
+import sys
+import time
+import signal
+import logging
+import argparse
+import threading
+from multiprocessing.connection import Listener, Client
+
+logger = logging.getLogger("model_server")
+
+class ModelServer:
+    """
+    Atiende solicitudes de generación y NER con los modelos cargados en este proceso.
+
+    :param address: "host:puerto" o ruta del socket Unix
+    :param generation_slots: Generaciones simultáneas con el modelo local
+    """
+    def __init__(self, address, generation_slots=1):
+        self.address = address
+        self.generation_slots = threading.BoundedSemaphore(max(1, generation_slots))
+        self.listener = None
+        self.models = []
+        self._stopping = threading.Event()
+
+    def load(self):
+        """
+        Carga los modelos (antes de aceptar conexiones).
+
+        :return: None
+        """
+        from utils import hf_utils, spacy_utils, model_client
+
+        # Aunque .env defina MODEL_SERVER_ADDRESS, este proceso no se consulta a sí mismo
+        model_client.MODEL_SERVER_ADDRESS = None
+        hf_utils.load_model()
+        self.models.append(hf_utils.MODEL_ID)
+        spacy_utils.load_model()
+        self.models.append("en_core_sci_sm")
+
+    def _usage(self, ledger):
+        total = ledger.summary()["total"]
+        return {"prompt_tokens": total["prompt_tokens"], "completion_tokens": total["completion_tokens"]}
+
+    def _generate(self, request):
+        from utils import hf_utils
+        from utils.usage_utils import usage_scope
+
+        with self.generation_slots, usage_scope() as ledger:
+            if request["op"] == "generate":
+                result = hf_utils._generate_locally(request["input_text"])
+            else:
+                result = hf_utils._generate_batch_locally(request["input_texts"])
+        return {"result": result, "usage": self._usage(ledger)}
+
+    def _stream(self, connection, request):
+        from utils import hf_utils
+        from utils.model_client import send_message
+        from utils.usage_utils import usage_scope
+
+        with self.generation_slots, usage_scope() as ledger:
+            fragments = hf_utils._stream_locally(request["input_text"])
+            # close() detiene la generación y espera su hilo: el lugar se libera recién entonces
+            try:
+                for fragment in fragments:
+                    send_message(connection, {"fragment": fragment})
+            finally:
+                fragments.close()
+        send_message(connection, {"done": True, "usage": self._usage(ledger)})
+
+    def _entities(self, request):
+        from utils import spacy_utils
+
+        nlp = spacy_utils.load_model()
+        if request["op"] == "entities":
+            return {"result": spacy_utils._format_entities(nlp(request["text"]))}
+        docs = nlp.pipe(request["texts"], batch_size=request.get("batch_size", 32))
+        return {"result": [spacy_utils._format_entities(doc) for doc in docs]}
+
+    def handle(self, connection, request):
+        """
+        Ejecuta una solicitud y envía su respuesta.
+
+        :param connection: Conexión del cliente
+        :param request: Diccionario de la solicitud
+        :return: None
+        """
+        from utils.deadline_utils import deadline_scope
+        from utils.model_client import send_message
+
+        op = request.get("op")
+        try:
+            with deadline_scope(request.get("deadline")):
+                if op in ("generate", "generate_batch"):
+                    send_message(connection, self._generate(request))
+                elif op == "stream":
+                    self._stream(connection, request)
+                elif op in ("entities", "entities_batch"):
+                    send_message(connection, self._entities(request))
+                elif op == "ping":
+                    send_message(connection, {"result": {"models": self.models, "pid": os.getpid()}})
+                else:
+                    send_message(connection, {"error": f"Operación desconocida: {op}", "timeout": False})
+        except (ConnectionError, EOFError):
+            # El cliente cerró la conexión (p. ej. dejó de leer un streaming)
+            raise
+        except TimeoutError as e:
+            logger.warning(f"Plazo vencido atendiendo {op}: {e}")
+            send_message(connection, {"error": str(e), "timeout": True})
+        except Exception as e:
+            logger.error(f"Error atendiendo {op}: {e}", exc_info=e)
+            send_message(connection, {"error": str(e), "timeout": False})
+
+    def _serve_connection(self, connection):
+        from utils.model_client import recv_message
+
+        try:
+            while not self._stopping.is_set():
+                try:
+                    request = recv_message(connection)
+                except (OSError, EOFError, ValueError):
+                    # Conexión cerrada o mensaje que no es un objeto JSON: se corta la conexión
+                    return
+                self.handle(connection, request)
+        except (OSError, EOFError):
+            return
+        finally:
+            connection.close()
+
+    def serve_forever(self):
+        """
+        Acepta conexiones (un hilo por conexión de cliente) hasta stop().
+
+        :return: None
+        """
+        from utils.model_client import parse_address, authkey, is_local_address
+
+        if authkey() is None and not is_local_address(self.address):
+            raise ValueError(
+                f"{self.address} es accesible desde otras máquinas: configure MODEL_SERVER_AUTHKEY "
+                "o use un socket Unix o una dirección de loopback"
+            )
+        self.listener = Listener(parse_address(self.address), authkey=authkey())
+        logger.info(f"Servidor de modelos escuchando en {self.address} (modelos: {', '.join(self.models)})")
+        try:
+            while True:
+                try:
+                    connection = self.listener.accept()
+                except Exception as e:
+                    if self._stopping.is_set():
+                        return
+                    # Cliente con clave incorrecta o conexión cortada durante la autenticación
+                    logger.warning(f"Conexión rechazada: {e}")
+                    continue
+                if self._stopping.is_set():
+                    connection.close()
+                    return
+                threading.Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+        finally:
+            self.listener.close()
+
+    def stop(self):
+        """
+        Deja de aceptar conexiones; una conexión propia despierta a accept().
+
+        :return: None
+        """
+        from utils.model_client import parse_address, authkey
+
+        self._stopping.set()
+        try:
+            Client(parse_address(self.address), authkey=authkey()).close()
+        except Exception:
+            pass
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor de modelos compartido (Sam_Diagnostic y scispaCy)")
+    parser.add_argument("--address", default=os.getenv("MODEL_SERVER_LISTEN", "127.0.0.1:7070"),
+                        help="host:puerto o ruta de socket Unix (MODEL_SERVER_LISTEN)")
+    parser.add_argument("--generation-slots", type=int, default=int(os.getenv("MODEL_SERVER_GENERATION_SLOTS", "1")),
+                        help="Generaciones simultáneas con el modelo (MODEL_SERVER_GENERATION_SLOTS)")
+    parser.add_argument("--check", action="store_true", help="Verificar que un servidor responde en --address y salir")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        from utils.model_client import ping
+        try:
+            print(ping(args.address))
+        except Exception as e:
+            print(f"El servidor de modelos no responde en {args.address}: {e}")
+            return 1
+        return 0
+
+    # Antes de cargar los modelos: sin clave, solo direcciones locales
+    from utils.model_client import parse_address, authkey, is_local_address
+    if authkey() is None and not is_local_address(args.address):
+        print(f"{args.address} es accesible desde otras máquinas: configure MODEL_SERVER_AUTHKEY "
+              "o use un socket Unix o una dirección de loopback")
+        return 2
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    server = ModelServer(args.address, args.generation_slots)
+    start = time.perf_counter()
+    try:
+        server.load()
+    except Exception as e:
+        print(f"Error cargando los modelos: {e}")
+        return 1
+    print(f"Modelos cargados en {time.perf_counter() - start:.1f}s", flush=True)
+
+    if isinstance(parse_address(args.address), str) and os.path.exists(args.address):
+        # Socket Unix de una ejecución anterior
+        os.remove(args.address)
+    serving = threading.Thread(target=server.serve_forever, name="model-server", daemon=True)
+    serving.start()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    stop.wait()
+    print("Deteniendo el servidor de modelos...", flush=True)
+    server.stop()
+    serving.join(timeout=5)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,32 @@
+"""
+Pruebas de la anonimización de textos de utils/capture_utils.py.
+
+    python -m pytest tests
+"""
+import unittest
+from utils.capture_utils import anonymize_text
+
+class AnonymizeTextTest(unittest.TestCase):
+    def test_declared_names_are_redacted(self):
+        self.assertEqual(anonymize_text("me llamo ana pérez y tengo fiebre"), "me llamo <nombre> y tengo fiebre")
+        self.assertEqual(anonymize_text("Soy Juan"), "Soy <nombre>")
+
+    def test_conditions_after_soy_are_kept(self):
+        self.assertEqual(anonymize_text("soy diabético desde hace años"), "soy diabético desde hace años")
+
+    def test_name_after_a_condition_is_redacted(self):
+        self.assertEqual(
+            anonymize_text("soy hipertenso y mi nombre es Pedro Gómez"),
+            "soy hipertenso y mi nombre es <nombre>"
+        )
+        self.assertEqual(anonymize_text("Soy diabético y me llamo ana"), "Soy diabético y me llamo <nombre>")
+
+    def test_trigger_words_are_not_taken_as_names(self):
+        self.assertEqual(anonymize_text("hola soy yo me llamo Laura"), "hola soy yo me llamo <nombre>")
+
+    def test_personal_data(self):
+        text = anonymize_text("vivo en Av. 18 de Julio 1234, nací el 12 de marzo de 1980, mail ana@correo.com")
+        self.assertEqual(text, "vivo en <direccion>, nací el <fecha>, mail <email>")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+"""
+Pruebas de SingleFlight (utils/concurrency_utils.py).
+
+    python -m pytest tests
+"""
+import time
+import threading
+import unittest
+from utils.concurrency_utils import SingleFlight
+from utils.deadline_utils import deadline_scope
+
+class SingleFlightTest(unittest.TestCase):
+    def follow(self, flight, key, fn, budget=None):
+        """
+        Llama a flight.do en otro hilo (con su propio plazo) y guarda el resultado o el error.
+
+        :return: Tupla (hilo, diccionario con "result" o "error")
+        """
+        outcome = {}
+
+        def run():
+            with deadline_scope(budget):
+                try:
+                    outcome["result"] = flight.do(key, fn)
+                except BaseException as e:
+                    outcome["error"] = e
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread, outcome
+
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            release.wait(5)
+            return "ok"
+
+        leader, leader_outcome = self.follow(flight, "k", fn)
+        time.sleep(0.05)
+        followers = [self.follow(flight, "k", fn) for _ in range(3)]
+        time.sleep(0.05)
+        release.set()
+        for thread, _ in [(leader, leader_outcome)] + followers:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([outcome.get("result") for _, outcome in followers], ["ok"] * 3)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_errors_are_shared(self):
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def fn():
+            release.wait(5)
+            raise ValueError("falla")
+
+        leader, leader_outcome = self.follow(flight, "k", fn)
+        time.sleep(0.05)
+        follower, outcome = self.follow(flight, "k", fn)
+        time.sleep(0.05)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+
+        self.assertIsInstance(leader_outcome["error"], ValueError)
+        self.assertIsInstance(outcome["error"], ValueError)
+
+    def test_follower_wait_is_bounded_by_its_deadline(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        leader, _ = self.follow(flight, "k", lambda: release.wait(5))
+        time.sleep(0.05)
+
+        start = time.monotonic()
+        follower, outcome = self.follow(flight, "k", lambda: "propio", budget=0.1)
+        follower.join(5)
+        release.set()
+        leader.join(5)
+
+        self.assertIsInstance(outcome["error"], TimeoutError)
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_follower_with_budget_runs_after_leader_deadline_failure(self):
+        flight = SingleFlight()
+
+        def leader_fn():
+            time.sleep(0.2)
+            raise RuntimeError("plazo del líder vencido")
+
+        leader, leader_outcome = self.follow(flight, "k", leader_fn, budget=0.1)
+        time.sleep(0.05)
+        follower, outcome = self.follow(flight, "k", lambda: "propio", budget=5)
+        leader.join(5)
+        follower.join(5)
+
+        self.assertIsInstance(leader_outcome["error"], RuntimeError)
+        self.assertEqual(outcome.get("result"), "propio")
+
+    def test_leader_interruption_is_not_shared(self):
+        flight = SingleFlight()
+
+        def leader_fn():
+            time.sleep(0.1)
+            raise KeyboardInterrupt()
+
+        leader, leader_outcome = self.follow(flight, "k", leader_fn)
+        time.sleep(0.05)
+        follower, outcome = self.follow(flight, "k", lambda: "propio")
+        leader.join(5)
+        follower.join(5)
+
+        self.assertIsInstance(leader_outcome["error"], KeyboardInterrupt)
+        self.assertEqual(outcome.get("result"), "propio")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+Pruebas de ConcurrentEmbeddingBuilder contra tools/fake_embeddings_server.py.
+
+    python -m pytest tests
+"""
+import json
+import types
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+from tools.fake_embeddings_server import start_server, fake_embedding
+from utils.embedding_utils import ConcurrentEmbeddingBuilder
+
+DIMENSIONS = 16
+
+class HttpEmbeddings:
+    """
+    Cliente mínimo de /v1/embeddings con los errores en la forma de openai
+    (status_code y response con headers).
+
+    :param base_url: URL base del servidor (termina en /v1)
+    """
+    def __init__(self, base_url):
+        self.url = f"{base_url}/embeddings"
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({"input": texts, "model": "fake"}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                payload = json.load(response)
+        except urllib.error.HTTPError as e:
+            e.status_code = e.code
+            e.response = types.SimpleNamespace(status_code=e.code, headers=e.headers)
+            raise
+        return [item["embedding"] for item in sorted(payload["data"], key=lambda item: item["index"])]
+
+class ConcurrentEmbeddingBuilderTest(unittest.TestCase):
+    def start(self, **options):
+        server, state = start_server(port=0, dimensions=DIMENSIONS, **options)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        host, port = server.server_address
+        return HttpEmbeddings(f"http://{host}:{port}/v1"), state
+
+    def builder(self, embeddings, **options):
+        settings = dict(
+            embeddings=embeddings, model_name="fake", batch_size=2, max_concurrency=3,
+            requests_per_minute=60000, tokens_per_minute=10000000, max_retries=3,
+        )
+        settings.update(options)
+        return ConcurrentEmbeddingBuilder(**settings)
+
+    def test_preserves_order_and_retries_rate_limits(self):
+        embeddings, state = self.start(rate_limit_every=3)
+        texts = [f"prestador {index}" for index in range(11)]
+
+        vectors = self.builder(embeddings).embed_documents(texts)
+
+        self.assertEqual(len(vectors), len(texts))
+        for text, vector in zip(texts, vectors):
+            self.assertEqual([round(v, 5) for v in vector], [round(v, 5) for v in fake_embedding(text, DIMENSIONS)])
+        self.assertGreater(state.requests, state.served)
+
+    def test_client_errors_are_not_retried(self):
+        embeddings, _ = self.start()
+        embeddings.url += "/inexistente"
+
+        with self.assertRaises(Exception):
+            self.builder(embeddings, max_concurrency=1).embed_documents(["a", "b"])
+
+        self.assertEqual(embeddings.calls, 1)
+
+    def test_resumes_from_checkpoint_after_outage(self):
+        texts = [f"prestador {index}" for index in range(6)]
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            embeddings, _ = self.start(fail_after=2)
+            with self.assertRaises(Exception):
+                self.builder(embeddings, max_concurrency=1, max_retries=0,
+                             checkpoint_dir=checkpoint_dir).embed_documents(texts)
+
+            embeddings, state = self.start()
+            vectors = self.builder(embeddings, checkpoint_dir=checkpoint_dir).embed_documents(texts)
+
+        self.assertEqual(len(vectors), len(texts))
+        self.assertEqual(state.requests, 1)
+
+if __name__ == "__main__":
+    unittest.main()
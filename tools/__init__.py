@@ -0,0 +1,3 @@
+"""
+Herramientas de línea de comandos y servicios auxiliares para desarrollo y operación
+"""
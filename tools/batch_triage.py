@@ -0,0 +1,207 @@
+"""
+Triage fuera de línea de un CSV o JSONL de descripciones de síntomas.
+
+Lee la entrada en streaming, procesa lotes con `HealthOrchestrator.process_text_batch`
+(generación y NER por lotes, consulta RAG en paralelo) y agrega una línea JSON por
+registro al terminar cada lote. La salida es el checkpoint: al relanzar con el
+mismo `--output` se omiten los registros ya escritos (por id o número de fila).
+
+Uso:
+    python -m tools.batch_triage historico.csv --output triage.jsonl --text-column sintomas
+    python -m tools.batch_triage historico.jsonl --output triage.jsonl --batch-size 32 --concurrency 8
+    python -m tools.batch_triage historico.csv --output triage.jsonl --retry-failed
+"""
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+from itertools import islice
+
+def detect_format(path, declared=None):
+    """
+    Formato de la entrada según --format o la extensión.
+
+    :param path: Ruta de la entrada
+    :param declared: "csv", "jsonl" o None
+    :return: "csv" o "jsonl"
+    """
+    if declared:
+        return declared
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson")) else "csv"
+
+def iter_records(path, input_format, text_column, locality_column=None, id_column=None):
+    """
+    Recorre la entrada sin cargarla completa en memoria.
+
+    :param path: Ruta del CSV o JSONL
+    :param input_format: "csv" o "jsonl"
+    :param text_column: Campo con la descripción de síntomas
+    :param locality_column: Campo con la localidad (opcional)
+    :param id_column: Campo con el identificador (opcional; por defecto el número de fila)
+    :return: Generador de diccionarios con id, row, text y locality
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        rows = csv.DictReader(f) if input_format == "csv" else (json.loads(line) for line in f if line.strip())
+        for row_number, row in enumerate(rows, start=1):
+            record_id = row.get(id_column) if id_column else None
+            yield {
+                "id": str(record_id) if record_id not in (None, "") else str(row_number),
+                "row": row_number,
+                "text": str(row.get(text_column) or "").strip(),
+                "locality": (str(row.get(locality_column) or "").strip() or None) if locality_column else None,
+            }
+
+def load_checkpoint(output_path, retry_failed=False):
+    """
+    Lee la salida existente para reanudar: ids ya procesados y descarte de una línea cortada.
+
+    :param output_path: Ruta del JSONL de salida
+    :param retry_failed: True para volver a procesar los registros fallidos
+    :return: Tupla (ids procesados, cantidad de exitosos, cantidad de fallidos)
+    """
+    done, succeeded, failed = set(), 0, 0
+    if not os.path.exists(output_path):
+        return done, succeeded, failed
+    valid_bytes = 0
+    with open(output_path, "rb") as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                # Línea incompleta de una ejecución interrumpida: se descarta
+                break
+            if not line.endswith(b"\n"):
+                break
+            valid_bytes += len(line)
+            if item.get("success"):
+                succeeded += 1
+                done.add(item["id"])
+            elif not retry_failed:
+                failed += 1
+                done.add(item["id"])
+    if valid_bytes < os.path.getsize(output_path):
+        with open(output_path, "r+b") as f:
+            f.truncate(valid_bytes)
+    return done, succeeded, failed
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+def output_line(record, result):
+    """
+    Línea de salida de un registro.
+
+    :param record: Registro de la entrada
+    :param result: Diccionario de process_text_batch (o con success/error_message si no se procesó)
+    :return: Diccionario serializable
+    """
+    usage = result.get("usage") or {}
+    return {
+        "id": record["id"],
+        "row": record["row"],
+        "symptoms_text": record["text"],
+        "locality": record["locality"],
+        "success": bool(result.get("success")),
+        "entities": result.get("entities"),
+        "recommendations": result.get("recommendations"),
+        "error_message": result.get("error_message"),
+        "fallbacks": result.get("fallbacks") or {},
+        "timings": result.get("timings") or {},
+        "usage": usage.get("total"),
+        "processed_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+def process_batch(orchestrator, batch, concurrency):
+    """
+    Valida y procesa un lote de registros.
+
+    :return: Lista de líneas de salida, en el orden del lote
+    """
+    # Resultados por posición en el lote: dos filas con el mismo id no se pisan
+    results = [None] * len(batch)
+    valid = []
+    for position, record in enumerate(batch):
+        is_valid, message = orchestrator.validate_input(record["text"])
+        if is_valid:
+            valid.append(position)
+        else:
+            results[position] = {"success": False, "error_message": message}
+    if valid:
+        processed = orchestrator.process_text_batch(
+            [batch[position]["text"] for position in valid],
+            localities=[batch[position]["locality"] for position in valid],
+            max_workers=concurrency
+        )
+        for position, result in zip(valid, processed):
+            results[position] = result
+    return [output_line(record, result) for record, result in zip(batch, results)]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Triage por lotes de descripciones de síntomas")
+    parser.add_argument("input", help="CSV o JSONL de entrada")
+    parser.add_argument("--output", required=True, help="JSONL de salida (también es el checkpoint)")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None, help="Formato (por defecto según extensión)")
+    parser.add_argument("--text-column", default="sintomas", help="Campo con la descripción de síntomas")
+    parser.add_argument("--locality-column", default=None, help="Campo con la localidad (opcional)")
+    parser.add_argument("--id-column", default=None, help="Campo identificador (por defecto el número de fila)")
+    parser.add_argument("--batch-size", type=int, default=16, help="Registros por lote de generación y NER")
+    parser.add_argument("--concurrency", type=int, default=4, help="Consultas RAG simultáneas por lote")
+    parser.add_argument("--limit", type=int, default=None, help="Procesar como máximo N registros pendientes")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Volver a procesar los registros fallidos (la última línea de cada id es la vigente)")
+    parser.add_argument("--restart", action="store_true", help="Ignorar la salida existente y empezar de cero")
+    args = parser.parse_args(argv)
+
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    done, succeeded, failed = load_checkpoint(args.output, args.retry_failed)
+    if done:
+        print(f"Reanudando: {len(done)} registros ya procesados en {args.output}")
+
+    records = iter_records(
+        args.input, detect_format(args.input, args.format), args.text_column, args.locality_column, args.id_column
+    )
+    pending = (record for record in records if record["id"] not in done)
+    if args.limit is not None:
+        pending = islice(pending, args.limit)
+
+    # Importación diferida: carga los modelos y el índice (igual que la app)
+    from application.orchestration import HealthOrchestrator
+    orchestrator = HealthOrchestrator()
+
+    processed = 0
+    start = time.perf_counter()
+    try:
+        with open(args.output, "a", encoding="utf-8") as out:
+            for batch in batched(pending, max(1, args.batch_size)):
+                for line in process_batch(orchestrator, batch, args.concurrency):
+                    out.write(json.dumps(line, ensure_ascii=False) + "\n")
+                    if line["success"]:
+                        succeeded += 1
+                    else:
+                        failed += 1
+                # Checkpoint: el lote queda en disco antes de empezar el siguiente
+                out.flush()
+                os.fsync(out.fileno())
+                processed += len(batch)
+                rate = processed / (time.perf_counter() - start)
+                print(f"{processed} registros procesados ({rate:.2f}/s) | exitosos: {succeeded} | fallidos: {failed}",
+                      flush=True)
+    except KeyboardInterrupt:
+        print(f"Interrumpido; relance el mismo comando para continuar desde {args.output}")
+        return 130
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error procesando la entrada: {e}")
+        return 1
+    print(f"Listo: {processed} registros en esta ejecución | exitosos: {succeeded} | fallidos: {failed}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+"""
+Benchmark fuera de línea del pipeline con modelos falsos (ver tools/fakes.py).
+
+Ejecuta una carga con guion (benchmarks/workloads/*.json) contra
+`HealthOrchestrator` (o `AsyncHealthOrchestrator`) y `SearchService` sobre un
+índice sintético, sin OpenAI, sin endpoint de HF y sin el modelo de varios GB.
+Reporta p50/p95/p99 por etapa, por span y por tipo de solicitud, y el throughput;
+termina con código 1 si algún valor empeora respecto de la línea base guardada
+y con código 3 si el escenario no tiene línea base (salvo con
+--allow-missing-baseline), para que una línea base ausente no pase como éxito.
+
+Uso:
+    python -m tools.benchmark --repeat 5 --concurrency 4
+    python -m tools.benchmark --generator tiny-lm --save-baseline
+    python -m tools.benchmark --mode async --concurrency 16 --tolerance 0.25 --output reporte.json
+"""
+import io
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from tools.fakes import Latency, install_fakes, write_synthetic_dataset
+
+DEFAULT_WORKLOAD = "benchmarks/workloads/default.json"
+DEFAULT_BASELINES = "benchmarks/baselines.json"
+# Percentiles comparados contra la línea base (p99 es demasiado ruidoso con pocas muestras)
+COMPARED_PERCENTILES = ("p50_ms", "p95_ms")
+
+def percentile(samples, q):
+    """
+    Percentil por rango más cercano.
+
+    :param samples: Lista de valores
+    :param q: Percentil entre 0 y 1
+    :return: Valor o None si no hay muestras
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+    return ordered[index]
+
+def summarize(seconds):
+    """
+    Resumen de una serie de duraciones.
+
+    :param seconds: Lista de duraciones en segundos
+    :return: Diccionario con count, mean_ms, p50_ms, p95_ms, p99_ms y max_ms
+    """
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+    return {
+        "count": len(seconds),
+        "mean_ms": ms(sum(seconds) / len(seconds)) if seconds else None,
+        "p50_ms": ms(percentile(seconds, 0.50)),
+        "p95_ms": ms(percentile(seconds, 0.95)),
+        "p99_ms": ms(percentile(seconds, 0.99)),
+        "max_ms": ms(max(seconds)) if seconds else None,
+    }
+
+class Samples:
+    """
+    Duraciones por métrica, acumuladas desde varios hilos.
+    """
+    def __init__(self):
+        self.values = {}
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.values.setdefault(name, []).append(seconds)
+
+    def add_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def record(self, request, result, seconds):
+        """
+        Registra una solicitud: total, etapas del pipeline y spans de la traza.
+
+        :param request: Solicitud de la carga
+        :param result: Diccionario de process_* o texto de SearchService.search
+        :param seconds: Duración total
+        :return: None
+        """
+        self.add(f"request.{request['kind']}", seconds)
+        if isinstance(result, dict):
+            if not result.get("success"):
+                self.add_error()
+            for stage, stage_seconds in (result.get("timings") or {}).items():
+                self.add(f"stage.{stage}", stage_seconds)
+            for item in result.get("trace") or []:
+                # Las etapas ya se cuentan por sus tiempos
+                if not item["name"].startswith("stage."):
+                    self.add(f"span.{item['name']}", item["duration_ms"] / 1000)
+        elif not result or str(result).startswith("Error en"):
+            self.add_error()
+
+def configure_environment(args):
+    """
+    Fija la configuración del proceso antes de importar la aplicación.
+
+    :param args: Argumentos de la línea de comandos
+    :return: None
+    """
+    # El cliente de OpenAI exige una clave al construirse aunque no se use
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ["ALLOW_RUNTIME_INDEX_BUILD"] = "true"
+    os.environ["DATASET_HOT_RELOAD"] = "false"
+    if not args.warm_cache:
+        # Cada solicitud recorre el pipeline completo: sin caché de etapas ni de respuestas
+        os.environ["PIPELINE_CACHE_BACKEND"] = "none"
+        os.environ["ANSWER_CACHE_TTL_SECONDS"] = "0"
+
+def add_fake_arguments(parser):
+    """
+    Agrega los argumentos de los modelos falsos y del dataset sintético.
+
+    :param parser: ArgumentParser de la herramienta
+    :return: None
+    """
+    parser.add_argument("--generator", choices=["scripted", "tiny-lm"], default="scripted",
+                        help="Respuestas con guion o modelo diminuto con pesos aleatorios")
+    parser.add_argument("--tiny-lm-tokens", type=int, default=32, help="Tokens por generación del modelo diminuto")
+    parser.add_argument("--whisper-latency", type=float, default=0.3, help="Segundos por transcripción")
+    parser.add_argument("--generator-latency", type=float, default=0.05, help="Segundos por generación (scripted)")
+    parser.add_argument("--generator-token-latency", type=float, default=0.01,
+                        help="Segundos por token generado (scripted)")
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="Segundos por llamada de embeddings")
+    parser.add_argument("--chat-latency", type=float, default=0.3, help="Segundos por llamada al chat")
+    parser.add_argument("--chat-token-latency", type=float, default=0.005, help="Segundos por token de salida del chat")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Variación relativa de las latencias")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de latencias, dataset y modelo diminuto")
+    parser.add_argument("--rows", type=int, default=500, help="Prestadores del dataset sintético")
+
+def install_fakes_from_args(args):
+    """
+    Instala los modelos falsos con las latencias de la línea de comandos.
+
+    :param args: Argumentos (ver add_fake_arguments)
+    :return: Diccionario de install_fakes
+    """
+    return install_fakes(
+        whisper=Latency(args.whisper_latency, jitter=args.jitter, seed=args.seed),
+        generator=Latency(args.generator_latency, args.generator_token_latency, args.jitter, args.seed + 1),
+        embeddings=Latency(args.embedding_latency, jitter=args.jitter, seed=args.seed + 2),
+        chat=Latency(args.chat_latency, args.chat_token_latency, args.jitter, args.seed + 3),
+        generator_kind=args.generator,
+        tiny_lm_tokens=args.tiny_lm_tokens,
+        seed=args.seed
+    )
+
+def load_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def prepare_search_service(workdir, rows, seed, excel_path=None):
+    """
+    Construye el índice sobre un dataset sintético y lo publica como servicio activo.
+
+    :param workdir: Directorio temporal del benchmark
+    :param rows: Cantidad de prestadores sintéticos
+    :param seed: Semilla del dataset
+    :param excel_path: Dataset propio a indexar en lugar del sintético (opcional)
+    :return: Tupla (SearchService, segundos de construcción)
+    """
+    from utils.rag_utils import SearchService, set_health_service
+
+    if excel_path is None:
+        excel_path = write_synthetic_dataset(os.path.join(workdir, "prestadores.xlsx"), rows=rows, seed=seed)
+    start = time.perf_counter()
+    service = SearchService(
+        excel_path=excel_path,
+        persist_directory=os.path.join(workdir, "chroma_db"),
+        snapshots_dir=os.path.join(workdir, "indexes")
+    )
+    set_health_service(service)
+    return service, time.perf_counter() - start
+
+def run_request(orchestrator, service, request):
+    """
+    Ejecuta una solicitud de la carga (versión sincrónica).
+
+    :return: Tupla (resultado, segundos)
+    """
+    start = time.perf_counter()
+    if request["kind"] == "text":
+        result = orchestrator.process_text_symptoms(request["text"], locality=request.get("locality"))
+    elif request["kind"] == "audio":
+        result = orchestrator.process_audio_symptoms(request["text"].encode("utf-8"), locality=request.get("locality"))
+    else:
+        result = service.search(request["query"], locality=request.get("locality"))
+    return result, time.perf_counter() - start
+
+async def arun_request(orchestrator, service, request):
+    """
+    Ejecuta una solicitud de la carga (versión asíncrona).
+
+    :return: Tupla (resultado, segundos)
+    """
+    start = time.perf_counter()
+    if request["kind"] == "text":
+        result = await orchestrator.process_text_symptoms(request["text"], locality=request.get("locality"))
+    elif request["kind"] == "audio":
+        result = await orchestrator.process_audio_symptoms(
+            request["text"].encode("utf-8"), locality=request.get("locality")
+        )
+    else:
+        result = await service.asearch(request["query"], locality=request.get("locality"))
+    return result, time.perf_counter() - start
+
+def run_sync(requests, service, concurrency, samples):
+    from application.orchestration import HealthOrchestrator
+
+    orchestrator = HealthOrchestrator()
+
+    def execute(request):
+        result, seconds = run_request(orchestrator, service, request)
+        if samples is not None:
+            samples.record(request, result, seconds)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(execute, requests))
+
+def run_async(requests, service, concurrency, samples):
+    from application.async_orchestration import AsyncHealthOrchestrator
+
+    async def main():
+        orchestrator = AsyncHealthOrchestrator()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def execute(request):
+            async with semaphore:
+                result, seconds = await arun_request(orchestrator, service, request)
+            if samples is not None:
+                samples.record(request, result, seconds)
+
+        try:
+            await asyncio.gather(*(execute(request) for request in requests))
+        finally:
+            orchestrator.close()
+
+    asyncio.run(main())
+
+def compare_with_baseline(report, baseline, tolerance, min_delta_ms):
+    """
+    Compara un reporte con su línea base.
+
+    Una métrica empeora si su p50 o p95 supera la base en más de `tolerance`
+    (relativo) y de `min_delta_ms` (absoluto); el throughput, si cae más de `tolerance`.
+
+    :param report: Reporte actual
+    :param baseline: Reporte guardado del mismo escenario
+    :param tolerance: Tolerancia relativa (0.2 = 20 %)
+    :param min_delta_ms: Diferencia absoluta mínima para considerar una regresión
+    :return: Lista de mensajes de regresión
+    """
+    regressions = []
+    for name, current in report["metrics"].items():
+        reference = baseline.get("metrics", {}).get(name)
+        if reference is None:
+            continue
+        for key in COMPARED_PERCENTILES:
+            before, after = reference.get(key), current.get(key)
+            if before is None or after is None:
+                continue
+            if after > before * (1 + tolerance) and after - before > min_delta_ms:
+                regressions.append(f"{name} {key}: {before} -> {after} ms")
+    before_rps, after_rps = baseline.get("throughput_rps"), report["throughput_rps"]
+    if before_rps and after_rps < before_rps * (1 - tolerance):
+        regressions.append(f"throughput: {before_rps} -> {after_rps} solicitudes/s")
+    if report["errors"] > baseline.get("errors", 0):
+        regressions.append(f"errores: {baseline.get('errors', 0)} -> {report['errors']}")
+    return regressions
+
+def print_report(report):
+    print(f"\nEscenario {report['scenario']}: {report['requests']} solicitudes en {report['wall_seconds']} s "
+          f"({report['throughput_rps']} solicitudes/s, {report['errors']} errores)")
+    print(f"Índice sintético construido en {report['index_build_seconds']} s")
+    print(f"{'métrica':<28} {'n':>5} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'máx ms':>10}")
+    for name, summary in report["metrics"].items():
+        print(f"{name:<28} {summary['count']:>5} {summary['p50_ms']:>10} {summary['p95_ms']:>10} "
+              f"{summary['p99_ms']:>10} {summary['max_ms']:>10}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline con modelos falsos")
+    parser.add_argument("--workload", default=DEFAULT_WORKLOAD, help="Carga con guion (JSON)")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones de la carga")
+    parser.add_argument("--warmup", type=int, default=1, help="Repeticiones previas sin medir")
+    parser.add_argument("--concurrency", type=int, default=1, help="Solicitudes simultáneas")
+    parser.add_argument("--mode", choices=["sync", "async"], default="sync", help="Orquestador a usar")
+    add_fake_arguments(parser)
+    parser.add_argument("--warm-cache", action="store_true", help="Mantener los cachés del pipeline y de respuestas")
+    parser.add_argument("--scenario", default=None, help="Nombre del escenario en el archivo de líneas base")
+    parser.add_argument("--baselines", default=DEFAULT_BASELINES, help="Archivo de líneas base")
+    parser.add_argument("--save-baseline", action="store_true", help="Guardar el resultado como línea base")
+    parser.add_argument("--allow-missing-baseline", action="store_true",
+                        help="Terminar con código 0 si el escenario no tiene línea base")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Empeoramiento relativo tolerado")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Empeoramiento absoluto mínimo (ms)")
+    parser.add_argument("--output", default=None, help="Ruta para guardar el reporte JSON")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar los mensajes de depuración del pipeline")
+    args = parser.parse_args(argv)
+
+    configure_environment(args)
+    workload = load_json(args.workload)
+    scenario = args.scenario or f"{workload['name']}-{args.generator}-{args.mode}-c{args.concurrency}"
+    install_fakes_from_args(args)
+
+    runner = run_async if args.mode == "async" else run_sync
+    workdir = tempfile.mkdtemp(prefix="benchmark-")
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with quiet:
+            service, index_seconds = prepare_search_service(workdir, args.rows, args.seed)
+            if args.warmup:
+                runner(workload["requests"] * args.warmup, service, args.concurrency, None)
+            samples = Samples()
+            requests = workload["requests"] * args.repeat
+            start = time.perf_counter()
+            runner(requests, service, args.concurrency, samples)
+            wall_seconds = time.perf_counter() - start
+    except Exception as e:
+        print(f"Error ejecutando el benchmark: {e}")
+        return 2
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "scenario": scenario,
+        "config": {key: value for key, value in vars(args).items()
+                   if key not in ("baselines", "save_baseline", "allow_missing_baseline", "output", "verbose")},
+        "requests": len(requests),
+        "errors": samples.errors,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(requests) / wall_seconds, 3) if wall_seconds else None,
+        "index_build_seconds": round(index_seconds, 3),
+        "metrics": {name: summarize(values) for name, values in sorted(samples.values.items())},
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    baselines = load_json(args.baselines) if os.path.exists(args.baselines) else {}
+    if args.save_baseline:
+        baselines[scenario] = report
+        directory = os.path.dirname(args.baselines)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.baselines, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"Línea base guardada: {args.baselines} [{scenario}]")
+        return 0
+    if scenario not in baselines:
+        print(f"Sin línea base para '{scenario}' en {args.baselines} (use --save-baseline)")
+        return 0 if args.allow_missing_baseline else 3
+    regressions = compare_with_baseline(report, baselines[scenario], args.tolerance, args.min_delta_ms)
+    if regressions:
+        print(f"Regresiones respecto de la línea base (tolerancia {args.tolerance:.0%}):")
+        for message in regressions:
+            print(f"  - {message}")
+        return 1
+    print("Sin regresiones respecto de la línea base")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
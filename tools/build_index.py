@@ -0,0 +1,40 @@
+"""
+Construcción fuera de línea del índice RAG en snapshots versionados.
+
+Genera un directorio `<salida>/<version>/` con vectores, mapas de especialidades,
+copia del dataset y un manifest. Las réplicas de la aplicación abren el snapshot
+completo más reciente en modo solo lectura y no construyen nada al iniciar.
+
+Uso:
+    python -m tools.build_index --excel datasets/dataset_ejemplo.xlsx --output ./indexes
+"""
+import sys
+import argparse
+from utils.rag_utils import Config, build_index_snapshot
+from utils.index_utils import prune_snapshots, read_manifest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Construye un snapshot versionado del índice RAG")
+    parser.add_argument("--excel", default=Config.EXCEL_PATH, help="Ruta al .xlsx de prestadores")
+    parser.add_argument("--output", default=Config.INDEX_SNAPSHOTS_DIR, help="Directorio raíz de snapshots")
+    parser.add_argument("--version", default=None, help="Versión a asignar (por defecto fecha + hash del dataset)")
+    parser.add_argument("--keep", type=int, default=Config.SNAPSHOTS_TO_KEEP,
+                        help="Cantidad de snapshots completos a conservar")
+    args = parser.parse_args(argv)
+
+    try:
+        snapshot_dir = build_index_snapshot(args.excel, args.output, version=args.version)
+    except Exception as e:
+        print(f"Error construyendo el índice: {e}")
+        return 1
+
+    manifest = read_manifest(snapshot_dir)
+    print(f"Snapshot publicado: {snapshot_dir}")
+    print(f"  versión: {manifest['version']}")
+    print(f"  filas: {manifest['dataset']['rows']} | chunks: {manifest['index']['chunks']}")
+    for removed in prune_snapshots(args.output, args.keep):
+        print(f"Snapshot antiguo eliminado: {removed}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
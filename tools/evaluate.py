@@ -0,0 +1,319 @@
+"""
+Evaluación de precisión contra latencia de los modos rápidos de extracción y búsqueda.
+
+Cada atajo (extracción por gazetteer, respuesta por plantilla, caché de
+respuestas, ...) puede cambiar qué prestadores se devuelven. Este arnés ejecuta
+un conjunto de evaluación etiquetado (benchmarks/evalsets/*.json: texto de
+síntomas -> especialidades esperadas -> filas de prestadores esperadas) con cada
+combinación de modo de extracción (`detectar_entidades_medicas` y variantes) y
+de búsqueda (`SearchService.search`), y reporta por configuración la exactitud
+de especialidades, el recall de prestadores y la latencia, marcando las
+configuraciones de la frontera de Pareto.
+
+Formato del conjunto de evaluación:
+    {
+      "name": "default",
+      "dataset": {"kind": "synthetic", "rows": 500, "seed": 0} | {"kind": "excel", "path": "datasets/x.xlsx"},
+      "cases": [
+        {"id": "cardio-01", "text": "Tengo dolor de pecho...", "locality": "Montevideo",
+         "expected_specialties": ["Cardiología"],
+         "expected_providers": [{"Nombre": "Dr/a. Prestador 0235", "Teléfono": "096455002"}]}
+      ]
+    }
+
+Una fila esperada cuenta como devuelta si todos sus valores aparecen en la respuesta.
+
+Uso:
+    python -m tools.evaluate
+    python -m tools.evaluate --backend fake --extraction llm,gazetteer,oracle --render llm,template --cache cold,warm
+    python -m tools.evaluate --evalset benchmarks/evalsets/default.json --output evaluacion.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import itertools
+import contextlib
+from tools.benchmark import add_fake_arguments, install_fakes_from_args, load_json, prepare_search_service, summarize
+
+DEFAULT_EVALSET = "benchmarks/evalsets/default.json"
+EXTRACTION_MODES = ("llm", "streaming", "gazetteer", "oracle")
+RENDER_MODES = ("llm", "template")
+CACHE_MODES = ("cold", "warm")
+
+def extraction_runner(mode):
+    """
+    Función de extracción de un modo.
+
+    - llm: detectar_entidades_medicas (HF es->en, spaCy, HF en->es)
+    - streaming: igual, con la clasificación en streaming (como la recuperación especulativa)
+    - gazetteer: detectar_entidades_gazetteer (sin LLM, modo degradado)
+    - oracle: las especialidades esperadas (aísla la calidad de la búsqueda)
+
+    :param mode: Uno de EXTRACTION_MODES
+    :return: Función (caso) -> texto con el JSON de medical_specialty
+    """
+    if mode == "oracle":
+        return lambda case: json.dumps({"medical_specialty": case["expected_specialties"]}, ensure_ascii=False)
+    # Importación diferida: carga los modelos al importarse
+    from functions.extraccion import detectar_entidades_medicas, detectar_entidades_gazetteer
+    if mode == "gazetteer":
+        return lambda case: detectar_entidades_gazetteer(case["text"], case.get("locality"))
+    if mode == "streaming":
+        return lambda case: detectar_entidades_medicas(case["text"], on_partial=lambda partial: None)
+    return lambda case: detectar_entidades_medicas(case["text"])
+
+def canonical_specialties(service, value):
+    """
+    Especialidades de una salida de extracción (o de una lista), normalizadas a los valores del dataset.
+
+    :param service: SearchService con el normalizador de especialidades
+    :param value: Texto con el JSON de medical_specialty o lista de especialidades
+    :return: Conjunto de especialidades (canónicas o, si no se reconocen, el texto normalizado)
+    """
+    from utils.text_utils import normalize_text
+
+    if isinstance(value, list):
+        specialties = value
+    else:
+        specialties = service._parse_specialties(value or "") or []
+    canonical, unresolved = service.specialty_normalizer.normalize_many(specialties)
+    return set(canonical) | {normalize_text(spec) for spec in unresolved}
+
+def provider_found(row, answer):
+    """
+    Indica si una fila esperada aparece en la respuesta (todos sus valores, sin tildes ni mayúsculas).
+
+    :param row: Diccionario columna -> valor de la fila esperada
+    :param answer: Texto de la respuesta de la búsqueda
+    :return: bool
+    """
+    from utils.text_utils import normalize_text
+
+    folded = normalize_text(answer)
+    return all(normalize_text(value) in folded for value in row.values() if str(value).strip())
+
+def score_case(service, case, extraction, answer):
+    """
+    Puntaje de un caso.
+
+    :param service: SearchService (para normalizar especialidades)
+    :param case: Caso del conjunto de evaluación
+    :param extraction: Salida de la extracción (None si falló)
+    :param answer: Respuesta de la búsqueda (None si no se ejecutó)
+    :return: Diccionario con specialty_exact, specialty_recall y provider_recall (None si no hay filas esperadas)
+    """
+    expected = canonical_specialties(service, case["expected_specialties"])
+    predicted = canonical_specialties(service, extraction) if extraction else set()
+    rows = case.get("expected_providers") or []
+    found = sum(provider_found(row, answer) for row in rows) if answer else 0
+    return {
+        "predicted_specialties": sorted(predicted),
+        "specialty_exact": predicted == expected,
+        "specialty_recall": len(predicted & expected) / len(expected) if expected else 1.0,
+        "providers_found": found,
+        "provider_recall": found / len(rows) if rows else None,
+    }
+
+def run_extractions(cases, modes):
+    """
+    Ejecuta cada modo de extracción una vez por caso (se reutiliza en todas las configuraciones de búsqueda).
+
+    :param cases: Casos del conjunto de evaluación
+    :param modes: Modos de extracción a evaluar
+    :return: Diccionario modo -> lista de tuplas (salida o None, segundos, error o None)
+    """
+    outputs = {}
+    for mode in modes:
+        runner = extraction_runner(mode)
+        results = []
+        for case in cases:
+            start = time.perf_counter()
+            try:
+                output, error = runner(case), None
+            except Exception as e:
+                output, error = None, str(e)
+            results.append((output, time.perf_counter() - start, error))
+        outputs[mode] = results
+    return outputs
+
+def run_search(service, query, locality, render, cache):
+    """
+    Ejecuta y mide una búsqueda.
+
+    :param cache: "cold" (caché de respuestas vacío) o "warm" (respuesta ya calculada una vez)
+    :return: Tupla (respuesta, segundos)
+    """
+    from utils.rag_utils import get_answer_cache
+
+    if cache == "warm":
+        service.search(query, locality=locality, render=render)
+    else:
+        get_answer_cache().clear()
+    start = time.perf_counter()
+    answer = service.search(query, locality=locality, render=render)
+    return answer, time.perf_counter() - start
+
+def evaluate_configuration(service, cases, extractions, render, cache):
+    """
+    Evalúa una configuración sobre todos los casos.
+
+    :param extractions: Resultados de run_extractions para el modo de extracción de la configuración
+    :return: Tupla (resumen, detalle por caso)
+    """
+    details = []
+    extraction_seconds, search_seconds, total_seconds = [], [], []
+    errors = 0
+    for case, (extraction, seconds, error) in zip(cases, extractions):
+        answer, searched = None, 0.0
+        if extraction is not None:
+            answer, searched = run_search(service, extraction, case.get("locality"), render, cache)
+            if answer.startswith("Error en"):
+                error = answer
+        if error:
+            errors += 1
+        extraction_seconds.append(seconds)
+        search_seconds.append(searched)
+        total_seconds.append(seconds + searched)
+        details.append({
+            "id": case["id"],
+            "extraction": extraction,
+            "answer": answer,
+            "error": error,
+            "extraction_ms": round(seconds * 1000, 2),
+            "search_ms": round(searched * 1000, 2),
+            **score_case(service, case, extraction, answer),
+        })
+    recalls = [item["provider_recall"] for item in details if item["provider_recall"] is not None]
+    summary = {
+        "cases": len(details),
+        "errors": errors,
+        "specialty_accuracy": round(sum(item["specialty_exact"] for item in details) / len(details), 3),
+        "specialty_recall": round(sum(item["specialty_recall"] for item in details) / len(details), 3),
+        "provider_recall": round(sum(recalls) / len(recalls), 3) if recalls else None,
+        "extraction": summarize(extraction_seconds),
+        "search": summarize(search_seconds),
+        "total": summarize(total_seconds),
+    }
+    return summary, details
+
+def pareto_front(results):
+    """
+    Configuraciones no dominadas: ninguna otra tiene exactitud y recall mayores o
+    iguales con p50 total menor o igual (y alguna mejora estricta).
+
+    :param results: Diccionario configuración -> resumen
+    :return: Conjunto de nombres de configuración
+    """
+    def point(summary):
+        return (summary["specialty_accuracy"], summary["provider_recall"] or 0.0, -summary["total"]["p50_ms"])
+
+    front = set()
+    for name, summary in results.items():
+        mine = point(summary)
+        dominated = any(
+            all(a >= b for a, b in zip(point(other), mine)) and point(other) != mine
+            for other_name, other in results.items() if other_name != name
+        )
+        if not dominated:
+            front.add(name)
+    return front
+
+def print_table(results, front):
+    print(f"\n{'configuración':<28} {'esp. exacta':>11} {'recall esp.':>11} {'recall prest.':>13} "
+          f"{'extr. p50':>10} {'búsq. p50':>10} {'total p50':>10} {'total p95':>10} {'errores':>7}  pareto")
+    for name, summary in sorted(results.items(), key=lambda item: item[1]["total"]["p50_ms"]):
+        recall = "-" if summary["provider_recall"] is None else summary["provider_recall"]
+        print(f"{name:<28} {summary['specialty_accuracy']:>11} {summary['specialty_recall']:>11} {recall:>13} "
+              f"{summary['extraction']['p50_ms']:>10} {summary['search']['p50_ms']:>10} "
+              f"{summary['total']['p50_ms']:>10} {summary['total']['p95_ms']:>10} {summary['errors']:>7}  "
+              f"{'*' if name in front else ''}")
+
+def parse_modes(value, allowed, option):
+    modes = [mode.strip() for mode in value.split(",") if mode.strip()]
+    invalid = [mode for mode in modes if mode not in allowed]
+    if invalid or not modes:
+        raise ValueError(f"{option}: valores inválidos {invalid or value!r} (opciones: {', '.join(allowed)})")
+    return modes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluación de precisión contra latencia de los modos rápidos")
+    parser.add_argument("--evalset", default=DEFAULT_EVALSET, help="Conjunto de evaluación etiquetado (JSON)")
+    parser.add_argument("--backend", choices=["real", "fake"], default="real",
+                        help="Modelos reales o los falsos de tools/fakes.py (prueba del arnés)")
+    parser.add_argument("--extraction", default="llm,gazetteer,oracle",
+                        help=f"Modos de extracción (coma; {', '.join(EXTRACTION_MODES)})")
+    parser.add_argument("--render", default="llm,template", help=f"Respuesta de la búsqueda ({', '.join(RENDER_MODES)})")
+    parser.add_argument("--cache", default="cold", help=f"Caché de respuestas ({', '.join(CACHE_MODES)})")
+    add_fake_arguments(parser)
+    parser.add_argument("--output", default=None, help="Ruta para guardar el reporte JSON (con el detalle por caso)")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar los mensajes de depuración del pipeline")
+    args = parser.parse_args(argv)
+
+    try:
+        extraction_modes = parse_modes(args.extraction, EXTRACTION_MODES, "--extraction")
+        render_modes = parse_modes(args.render, RENDER_MODES, "--render")
+        cache_modes = parse_modes(args.cache, CACHE_MODES, "--cache")
+        evalset = load_json(args.evalset)
+    except (OSError, ValueError) as e:
+        print(f"Error en los argumentos: {e}")
+        return 2
+    cases = evalset["cases"]
+    dataset = evalset.get("dataset") or {"kind": "synthetic"}
+
+    os.environ["ALLOW_RUNTIME_INDEX_BUILD"] = "true"
+    os.environ["DATASET_HOT_RELOAD"] = "false"
+    # Se mide cada etapa: sin caché del pipeline (el de respuestas se controla con --cache)
+    os.environ["PIPELINE_CACHE_BACKEND"] = "none"
+    if args.backend == "fake":
+        os.environ.setdefault("OPENAI_API_KEY", "evaluate")
+        install_fakes_from_args(args)
+
+    results, details = {}, {}
+    workdir = tempfile.mkdtemp(prefix="evaluate-")
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with quiet:
+            service, _ = prepare_search_service(
+                workdir, dataset.get("rows", 500), dataset.get("seed", 0),
+                excel_path=dataset["path"] if dataset["kind"] == "excel" else None
+            )
+        print(f"Evaluando {len(cases)} casos de {evalset.get('name', args.evalset)} (backend {args.backend})...",
+              flush=True)
+        with quiet:
+            extractions = run_extractions(cases, extraction_modes)
+        for extraction, render, cache in itertools.product(extraction_modes, render_modes, cache_modes):
+            name = f"{extraction}+{render}" + ("+cache" if cache == "warm" else "")
+            with quiet:
+                results[name], details[name] = evaluate_configuration(
+                    service, cases, extractions[extraction], render, cache
+                )
+            print(f"  {name}: exactitud {results[name]['specialty_accuracy']}, "
+                  f"recall {results[name]['provider_recall']}, p50 {results[name]['total']['p50_ms']} ms", flush=True)
+    except Exception as e:
+        print(f"Error ejecutando la evaluación: {e}")
+        return 2
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    front = pareto_front(results)
+    print_table(results, front)
+    print("* frontera de Pareto (exactitud de especialidades, recall de prestadores, latencia total p50)")
+    if args.output:
+        report = {
+            "evalset": evalset.get("name", args.evalset),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "verbose")},
+            "results": results,
+            "pareto": sorted(front),
+            "cases": details,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""
+Servidor local de embeddings falso, compatible con la API de OpenAI.
+
+Sirve para probar la construcción del índice sin consumir la API real y para
+simular latencia, límites de tasa (HTTP 429) y cortes de red.
+
+Uso:
+    python -m tools.fake_embeddings_server --port 8089 --latency 0.05 --rate-limit-every 7
+
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=fake streamlit run app.py
+"""
+import sys
+import json
+import math
+import time
+import base64
+import struct
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def fake_embedding(content, dimensions=256):
+    """
+    Genera un vector determinístico y normalizado a partir del contenido.
+
+    :param content: Texto o lista de ids de tokens
+    :param dimensions: Dimensión del vector
+    :return: Lista de floats de norma 1
+    """
+    if not isinstance(content, str):
+        content = " ".join(str(token) for token in content)
+    values = []
+    counter = 0
+    while len(values) < dimensions:
+        digest = hashlib.sha256(f"{counter}:{content}".encode("utf-8")).digest()
+        values.extend((byte / 127.5) - 1.0 for byte in digest)
+        counter += 1
+    values = values[:dimensions]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [v / norm for v in values]
+
+class FakeEmbeddingsState:
+    """
+    Estado compartido del servidor: contadores y reglas de fallos simulados.
+
+    :param dimensions: Dimensión de los vectores devueltos
+    :param latency: Latencia artificial por solicitud (segundos)
+    :param rate_limit_every: Devuelve 429 cada N solicitudes (0 desactiva)
+    :param fail_after: Corta todas las solicitudes tras N exitosas (0 desactiva)
+    """
+    def __init__(self, dimensions, latency, rate_limit_every, fail_after):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.fail_after = fail_after
+        self.requests = 0
+        self.served = 0
+        self.lock = threading.Lock()
+
+    def next_outcome(self):
+        """
+        Decide el resultado de la próxima solicitud.
+
+        :return: "ok", "rate_limited" o "unavailable"
+        """
+        with self.lock:
+            self.requests += 1
+            if self.fail_after and self.served >= self.fail_after:
+                return "unavailable"
+            if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+                return "rate_limited"
+            self.served += 1
+            return "ok"
+
+def _encode_base64(vector):
+    return base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode("ascii")
+
+def make_handler(state):
+    """
+    Construye la clase manejadora HTTP ligada a un estado.
+
+    :param state: Instancia de FakeEmbeddingsState
+    :return: Subclase de BaseHTTPRequestHandler
+    """
+    class FakeEmbeddingsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/embeddings"):
+                self._send_json(404, {"error": {"message": "Not found"}})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if state.latency:
+                time.sleep(state.latency)
+
+            outcome = state.next_outcome()
+            if outcome == "rate_limited":
+                self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                headers={"Retry-After": "0.2"})
+                return
+            if outcome == "unavailable":
+                self._send_json(503, {"error": {"message": "Service unavailable"}})
+                return
+
+            inputs = request.get("input", [])
+            if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                inputs = [inputs]
+            encoding = request.get("encoding_format", "float")
+            data = []
+            prompt_tokens = 0
+            for index, item in enumerate(inputs):
+                vector = fake_embedding(item, state.dimensions)
+                prompt_tokens += len(item) if not isinstance(item, str) else len(item) // 4 + 1
+                data.append({
+                    "object": "embedding",
+                    "index": index,
+                    "embedding": _encode_base64(vector) if encoding == "base64" else vector,
+                })
+            self._send_json(200, {
+                "object": "list",
+                "data": data,
+                "model": request.get("model", "fake-embeddings"),
+                "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+            })
+
+    return FakeEmbeddingsHandler
+
+def start_server(host="127.0.0.1", port=8089, dimensions=256, latency=0.0,
+                 rate_limit_every=0, fail_after=0):
+    """
+    Inicia el servidor en un hilo en segundo plano.
+
+    :return: Tupla (servidor, estado); detener con servidor.shutdown()
+    """
+    state = FakeEmbeddingsState(dimensions, latency, rate_limit_every, fail_after)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, state
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor de embeddings falso compatible con OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--latency", type=float, default=0.0, help="Latencia por solicitud (segundos)")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Devolver 429 cada N solicitudes")
+    parser.add_argument("--fail-after", type=int, default=0, help="Devolver 503 tras N solicitudes exitosas")
+    args = parser.parse_args(argv)
+
+    server, _ = start_server(args.host, args.port, args.dimensions, args.latency,
+                             args.rate_limit_every, args.fail_after)
+    print(f"Servidor de embeddings falso en http://{args.host}:{args.port}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,440 @@
+"""
+Reemplazos determinísticos de los modelos externos para pruebas y benchmarks.
+
+`install_fakes` sustituye en el proceso, sin tocar la red ni descargar modelos:
+- Whisper: clientes síncrono y asíncrono que devuelven el audio decodificado como texto.
+- Generador de HF: respuestas con guion (`scripted`) o un modelo causal diminuto
+  con pesos aleatorios (`tiny-lm`, requiere torch y transformers) en lugar de
+  `somosnlp/Sam_Diagnostic`.
+- Embeddings: vectores determinísticos (los mismos que tools/fake_embeddings_server.py).
+- Chat: modelo de LangChain que responde con los prestadores del contexto.
+
+Cada reemplazo tiene latencia configurable (`Latency`). Debe llamarse antes de
+importar `functions.*` / `application.orchestration`, que cargan los modelos al importarse.
+"""
+import io
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import threading
+from types import SimpleNamespace
+from tools.fake_embeddings_server import fake_embedding
+
+# Columnas y valores del dataset sintético de prestadores
+SYNTHETIC_LOCALITIES = ["Montevideo", "Canelones", "Maldonado", "Salto", "Paysandú", "Rivera", "Colonia", "Tacuarembó"]
+SYNTHETIC_STREETS = ["Av. Italia", "18 de Julio", "Bulevar Artigas", "Av. Rivera", "Rambla", "Av. Brasil"]
+
+class Latency:
+    """
+    Latencia simulada: base más un costo por token, con variación aleatoria reproducible.
+
+    :param base: Segundos fijos por llamada
+    :param per_token: Segundos adicionales por token generado o procesado
+    :param jitter: Variación relativa máxima (0.1 = ±10 %)
+    :param seed: Semilla del generador aleatorio
+    """
+    def __init__(self, base=0.0, per_token=0.0, jitter=0.0, seed=0):
+        self.base = base
+        self.per_token = per_token
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def seconds(self, tokens=0):
+        value = self.base + self.per_token * tokens
+        if self.jitter:
+            with self._lock:
+                value *= 1 + self._random.uniform(-self.jitter, self.jitter)
+        return max(value, 0.0)
+
+    def sleep(self, tokens=0):
+        time.sleep(self.seconds(tokens))
+
+    async def asleep(self, tokens=0):
+        await asyncio.sleep(self.seconds(tokens))
+
+def _tokens(text):
+    return max(1, len(text) // 4)
+
+# ---------------------------------------------------------------- Whisper
+
+def fake_transcription(audio_bytes):
+    """
+    Transcripción determinística: el "audio" de los benchmarks es el texto en UTF-8.
+
+    :param audio_bytes: Bytes del audio
+    :return: Texto transcripto
+    """
+    text = audio_bytes.decode("utf-8", errors="ignore").strip()
+    return text or "audio sin voz reconocible"
+
+class _FakeTranscriptions:
+    def __init__(self, latency, asynchronous):
+        self.latency = latency
+        self.asynchronous = asynchronous
+
+    def _text(self, file):
+        data = file.getvalue() if isinstance(file, io.BytesIO) else file.read()
+        return SimpleNamespace(text=fake_transcription(data))
+
+    def create(self, model=None, file=None, **kwargs):
+        if self.asynchronous:
+            return self._acreate(file)
+        self.latency.sleep()
+        return self._text(file)
+
+    async def _acreate(self, file):
+        await self.latency.asleep()
+        return self._text(file)
+
+class FakeWhisperClient:
+    """
+    Cliente con la forma de `OpenAI` / `AsyncOpenAI` para `audio.transcriptions.create`.
+
+    :param latency: Instancia de Latency
+    :param asynchronous: True para imitar a AsyncOpenAI (create devuelve una corrutina)
+    """
+    def __init__(self, latency, asynchronous=False):
+        self.audio = SimpleNamespace(transcriptions=_FakeTranscriptions(latency, asynchronous))
+
+# ---------------------------------------------------------------- Generador
+
+_LANGS_PATTERN = re.compile(r'codigos linguisticos disponibles: \["(\w+)", "(\w+)"\]')
+_USER_PATTERN = re.compile(r"<start_of_turn>user (.*?)<end_of_turn>", re.S)
+
+def scripted_reply(input_text):
+    """
+    Respuesta con guion del modelo de clasificación para un prompt de `build_prompt`.
+
+    es->en devuelve los síntomas sin cambios; en->es devuelve el JSON con las
+    especialidades del gazetteer de síntomas.
+
+    :param input_text: Prompt ya formateado
+    :return: Texto de la respuesta (sin el prompt)
+    """
+    from utils.specialty_utils import specialties_from_symptoms
+
+    langs = _LANGS_PATTERN.search(input_text)
+    user = _USER_PATTERN.search(input_text)
+    content = user.group(1).strip() if user else ""
+    if langs and langs.group(2) == "es":
+        return json.dumps({"medical_specialty": specialties_from_symptoms(content)}, ensure_ascii=False)
+    return content
+
+class ScriptedGenerator:
+    """
+    Reemplazo de la generación local de hf_utils con respuestas con guion.
+
+    :param latency: Latencia por llamada y por token generado
+    :param model_id: Modelo con el que se registra el uso
+    """
+    def __init__(self, latency, model_id="fake-generator"):
+        self.latency = latency
+        self.model_id = model_id
+
+    def generate(self, input_text):
+        from utils.usage_utils import model_call
+
+        reply = scripted_reply(input_text)
+        with model_call("hf_local", self.model_id) as usage:
+            usage["prompt_tokens"] = _tokens(input_text)
+            usage["completion_tokens"] = _tokens(reply)
+            usage["estimated"] = True
+            self.latency.sleep(usage["completion_tokens"])
+        return f"{input_text}{reply}<end_of_turn>"
+
+    def stream(self, input_text):
+        from utils.usage_utils import model_call
+
+        reply = scripted_reply(input_text) + "<end_of_turn>"
+        fragments = re.findall(r"\S+\s*", reply) or [reply]
+        with model_call("hf_local", self.model_id) as usage:
+            usage["prompt_tokens"] = _tokens(input_text)
+            usage["estimated"] = True
+            for fragment in fragments:
+                self.latency.sleep(1)
+                usage["completion_tokens"] += 1
+                yield fragment
+
+class ByteTokenizer:
+    """
+    Tokenizador por bytes con los tokens especiales del formato de chat (para el modelo diminuto).
+
+    Implementa lo que usan hf_utils y TextIteratorStreamer: encode, decode y,
+    para la generación por lotes, la llamada con padding.
+    """
+    SPECIAL_TOKENS = ["<bos>", "<start_of_turn>", "<end_of_turn>", "<eos>"]
+
+    def __init__(self):
+        self.special_ids = {token: 256 + index for index, token in enumerate(self.SPECIAL_TOKENS)}
+        self.id_to_special = {index: token for token, index in self.special_ids.items()}
+        self.vocab_size = 256 + len(self.SPECIAL_TOKENS)
+        self.eos_token_id = self.special_ids["<eos>"]
+        self.eos_token = self.pad_token = "<eos>"
+        self.pad_token_id = self.eos_token_id
+        self.padding_side = "right"
+        self._split = re.compile("(" + "|".join(re.escape(token) for token in self.SPECIAL_TOKENS) + ")")
+
+    def encode(self, text, return_tensors=None, add_special_tokens=False, **kwargs):
+        ids = []
+        for part in self._split.split(text):
+            if part in self.special_ids:
+                ids.append(self.special_ids[part])
+            elif part:
+                ids.extend(part.encode("utf-8"))
+        if return_tensors == "pt":
+            import torch
+            return torch.tensor([ids], dtype=torch.long)
+        return ids
+
+    def convert_tokens_to_ids(self, token):
+        return self.special_ids[token]
+
+    def __call__(self, texts, return_tensors=None, padding=False, add_special_tokens=False, **kwargs):
+        import torch
+        rows = [self.encode(text) for text in texts]
+        width = max(len(row) for row in rows)
+        input_ids, attention_mask = [], []
+        for row in rows:
+            fill = [self.pad_token_id] * (width - len(row))
+            mask = [1] * len(row)
+            if self.padding_side == "left":
+                input_ids.append(fill + row)
+                attention_mask.append([0] * len(fill) + mask)
+            else:
+                input_ids.append(row + fill)
+                attention_mask.append(mask + [0] * len(fill))
+        return {"input_ids": torch.tensor(input_ids), "attention_mask": torch.tensor(attention_mask)}
+
+    def decode(self, ids, skip_special_tokens=False, **kwargs):
+        if hasattr(ids, "tolist"):
+            ids = ids.tolist()
+        text = ""
+        buffer = bytearray()
+        for token_id in ids:
+            if token_id < 256:
+                buffer.append(token_id)
+                continue
+            text += buffer.decode("utf-8", errors="replace")
+            buffer = bytearray()
+            if not skip_special_tokens:
+                text += self.id_to_special.get(token_id, "")
+        return text + buffer.decode("utf-8", errors="replace")
+
+def build_tiny_causal_lm(seed=0, max_new_tokens=32, layers=2, hidden_size=64):
+    """
+    Modelo causal diminuto con pesos aleatorios (GPT-2 de 2 capas) y tokenizador por bytes.
+
+    Produce texto sin sentido pero ejercita el camino real de transformers
+    (generate, criterios de parada, streaming) con un costo por token medible.
+
+    :param seed: Semilla de torch para los pesos
+    :param max_new_tokens: Tokens generados por llamada
+    :param layers: Capas del transformer
+    :param hidden_size: Dimensión oculta
+    :return: Tupla con la misma forma que hf_utils.load_model()
+    """
+    import torch
+    import transformers
+
+    tokenizer = ByteTokenizer()
+    end_id = tokenizer.special_ids["<end_of_turn>"]
+
+    class EndOfTurnStoppingCriteria(transformers.StoppingCriteria):
+        """Detiene la generación al producir <end_of_turn>."""
+        def __call__(self, input_ids, scores, **kwargs):
+            return input_ids[0, -1].item() == end_id
+
+    torch.manual_seed(seed)
+    config = transformers.GPT2Config(
+        vocab_size=tokenizer.vocab_size, n_positions=4096, n_embd=hidden_size, n_layer=layers, n_head=2,
+        bos_token_id=tokenizer.special_ids["<bos>"], eos_token_id=tokenizer.eos_token_id
+    )
+    model = transformers.GPT2LMHeadModel(config).eval()
+    generation_config = transformers.GenerationConfig(
+        max_new_tokens=max_new_tokens, do_sample=False,
+        pad_token_id=tokenizer.eos_token_id, eos_token_id=tokenizer.eos_token_id
+    )
+    stopping_criteria = EndOfTurnStoppingCriteria()
+    stopping_criteria_list = transformers.StoppingCriteriaList([stopping_criteria])
+    return tokenizer, model, generation_config, stopping_criteria, stopping_criteria_list
+
+# ---------------------------------------------------------------- Embeddings y chat
+
+def fake_embeddings_class():
+    """
+    Clase de embeddings de LangChain con vectores determinísticos.
+
+    Se arma de forma diferida para no importar LangChain al cargar este módulo.
+
+    :return: Subclase de langchain_core.embeddings.Embeddings
+    """
+    from langchain_core.embeddings import Embeddings
+
+    class FakeEmbeddings(Embeddings):
+        """
+        Embeddings determinísticos con latencia simulada.
+
+        :param latency: Latencia por llamada y por texto
+        :param dimensions: Dimensión de los vectores
+        """
+        def __init__(self, latency, dimensions=256):
+            self.latency = latency
+            self.dimensions = dimensions
+
+        def embed_documents(self, texts):
+            self.latency.sleep(len(texts))
+            return [fake_embedding(text, self.dimensions) for text in texts]
+
+        def embed_query(self, text):
+            self.latency.sleep(1)
+            return fake_embedding(text, self.dimensions)
+
+    return FakeEmbeddings
+
+def fake_answer(prompt, max_providers=5):
+    """
+    Respuesta determinística del chat: los primeros prestadores del contexto del prompt.
+
+    :param prompt: Prompt enviado al chat
+    :param max_providers: Cantidad máxima de líneas de prestadores
+    :return: Texto de la respuesta
+    """
+    lines = [line.strip() for line in str(prompt).splitlines() if "Nombre" in line or "|" in line]
+    if not lines:
+        return "No se encontraron prestadores para la consulta."
+    return "Prestadores recomendados:\n" + "\n".join(f"- {line}" for line in lines[:max_providers])
+
+def fake_chat_class():
+    """
+    Modelo de chat de LangChain que responde con fake_answer (compatible con RetrievalQA).
+
+    :return: Subclase de BaseChatModel
+    """
+    from typing import Any
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    class FakeChatModel(BaseChatModel):
+        """
+        Chat con latencia simulada e informe de tokens como el de OpenAI.
+        """
+        latency: Any = None
+
+        @property
+        def _llm_type(self):
+            return "fake-chat"
+
+        def _result(self, messages):
+            prompt = "\n".join(str(message.content) for message in messages)
+            content = fake_answer(prompt)
+            token_usage = {"prompt_tokens": _tokens(prompt), "completion_tokens": _tokens(content)}
+            token_usage["total_tokens"] = token_usage["prompt_tokens"] + token_usage["completion_tokens"]
+            message = AIMessage(content=content, response_metadata={"token_usage": token_usage})
+            return ChatResult(generations=[ChatGeneration(message=message)]), token_usage["completion_tokens"]
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            result, completion_tokens = self._result(messages)
+            self.latency.sleep(completion_tokens)
+            return result
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            result, completion_tokens = self._result(messages)
+            await self.latency.asleep(completion_tokens)
+            return result
+
+    return FakeChatModel
+
+# ---------------------------------------------------------------- Dataset sintético
+
+def synthetic_providers(rows=500, seed=0):
+    """
+    Filas del dataset sintético de prestadores (las mismas para igual semilla).
+
+    :param rows: Cantidad de prestadores
+    :param seed: Semilla del generador aleatorio
+    :return: Lista de diccionarios con las columnas del dataset
+    """
+    from utils.specialty_utils import SYMPTOM_GAZETTEER, DEFAULT_SPECIALTY
+
+    rng = random.Random(seed)
+    specialties = sorted(set(SYMPTOM_GAZETTEER.values()) | {DEFAULT_SPECIALTY})
+    records = []
+    for index in range(rows):
+        specialty = specialties[index % len(specialties)]
+        records.append({
+            "Nombre": f"Dr/a. Prestador {index:04d}",
+            "Especialidad": specialty,
+            "Teléfono": f"09{rng.randint(1000000, 9999999)}",
+            "Dirección": f"{rng.choice(SYNTHETIC_STREETS)} {rng.randint(100, 4000)}",
+            "Email": f"prestador{index:04d}@ejemplo.uy",
+            "Localidad": rng.choice(SYNTHETIC_LOCALITIES),
+        })
+    return records
+
+def write_synthetic_dataset(path, rows=500, seed=0):
+    """
+    Escribe un Excel de prestadores sintéticos con las especialidades del gazetteer.
+
+    :param path: Ruta del .xlsx a crear
+    :param rows: Cantidad de prestadores
+    :param seed: Semilla para reproducir el mismo dataset
+    :return: Ruta escrita
+    """
+    import pandas as pd
+
+    pd.DataFrame(synthetic_providers(rows, seed)).to_excel(path, index=False)
+    return path
+
+# ---------------------------------------------------------------- Instalación
+
+def install_fakes(whisper=None, generator=None, embeddings=None, chat=None, generator_kind="scripted",
+                  tiny_lm_tokens=32, seed=0):
+    """
+    Reemplaza los modelos externos del proceso por los falsos.
+
+    :param whisper: Latency de Whisper
+    :param generator: Latency del generador con guion (por llamada y por token)
+    :param embeddings: Latency de embeddings (por llamada y por texto)
+    :param chat: Latency del chat (por llamada y por token de salida)
+    :param generator_kind: "scripted" o "tiny-lm"
+    :param tiny_lm_tokens: Tokens por generación del modelo diminuto
+    :param seed: Semilla del modelo diminuto
+    :return: Diccionario con los objetos instalados
+    """
+    from utils import hf_utils, whisper_utils, rag_utils, model_client
+
+    whisper = whisper or Latency()
+    embeddings = embeddings or Latency()
+    chat = chat or Latency()
+
+    os.environ.pop("HF_ENDPOINT_URL", None)
+    # Los falsos reemplazan la generación local: no se usa el servidor de modelos compartido
+    os.environ.pop("MODEL_SERVER_ADDRESS", None)
+    model_client.MODEL_SERVER_ADDRESS = None
+    whisper_utils.client = FakeWhisperClient(whisper)
+    whisper_utils.async_client = FakeWhisperClient(whisper, asynchronous=True)
+
+    installed = {}
+    if generator_kind == "tiny-lm":
+        bundle = build_tiny_causal_lm(seed=seed, max_new_tokens=tiny_lm_tokens)
+        hf_utils.load_model = lambda: bundle
+        installed["generator"] = bundle[1]
+    else:
+        scripted = ScriptedGenerator(generator or Latency())
+        hf_utils.load_model = lambda: None
+        hf_utils._generate_locally = scripted.generate
+        hf_utils._stream_locally = scripted.stream
+        hf_utils._generate_batch_locally = lambda input_texts: [scripted.generate(text) for text in input_texts]
+        installed["generator"] = scripted
+
+    FakeEmbeddings = fake_embeddings_class()
+    FakeChatModel = fake_chat_class()
+    rag_utils.OpenAIEmbeddings = lambda model=None, **kwargs: FakeEmbeddings(embeddings)
+    rag_utils.ChatOpenAI = lambda model=None, **kwargs: FakeChatModel(latency=chat)
+    installed.update(whisper=whisper_utils.client, embeddings=FakeEmbeddings, chat=FakeChatModel)
+    return installed
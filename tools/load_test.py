@@ -0,0 +1,238 @@
+"""
+Prueba de carga con sesiones concurrentes contra el orquestador.
+
+Simula N usuarios simultáneos: cada sesión es un hilo (como en Streamlit) que
+envía una consulta de la carga con guion a `HealthOrchestrator`
+(`process_text_symptoms` o `process_audio_symptoms`), espera la respuesta y
+"piensa" un tiempo exponencial antes de la siguiente. Los modelos externos
+son los falsos de tools/fakes.py. Para cada nivel de sesiones se mide el
+throughput y la latencia (p50/p95/p99); la curva indica el punto de
+saturación (el throughput deja de crecer) y el máximo de sesiones que cumple
+un objetivo de p95.
+
+Uso:
+    python -m tools.load_test --sessions 1,2,4,8,16,32 --duration 60 --think-time 5
+    python -m tools.load_test --sessions 4,8,16 --slo-p95-ms 8000 --csv curva.csv --output carga.json
+"""
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import contextlib
+from tools.benchmark import (
+    DEFAULT_WORKLOAD, add_fake_arguments, configure_environment, install_fakes_from_args, load_json,
+    prepare_search_service, summarize
+)
+
+# El nivel satura si sumar sesiones aumenta el throughput menos que esta proporción
+DEFAULT_SATURATION_GAIN = 0.1
+
+class LevelRecorder:
+    """
+    Solicitudes completadas durante la ventana de medición de un nivel.
+
+    :param window_start: Instante (perf_counter) en que termina la rampa y empieza la medición
+    """
+    def __init__(self, window_start):
+        self.window_start = window_start
+        self.latencies = []
+        self.errors = 0
+        self.in_window = 0
+        self._lock = threading.Lock()
+
+    def record(self, started_at, seconds, success):
+        # Solo cuentan las solicitudes iniciadas después de la rampa
+        if started_at < self.window_start:
+            return
+        with self._lock:
+            self.in_window += 1
+            self.latencies.append(seconds)
+            if not success:
+                self.errors += 1
+
+def session_loop(orchestrator, requests, think_time, rng, stop, recorder):
+    """
+    Bucle de una sesión: consulta, espera la respuesta y piensa.
+
+    :param orchestrator: HealthOrchestrator compartido
+    :param requests: Solicitudes de texto/audio de la carga
+    :param think_time: Media del tiempo de espera entre consultas (segundos, exponencial)
+    :param rng: random.Random propio de la sesión
+    :param stop: threading.Event que termina la sesión
+    :param recorder: LevelRecorder del nivel
+    :return: None
+    """
+    # Las sesiones no arrancan todas a la vez
+    if stop.wait(rng.uniform(0, think_time)):
+        return
+    while not stop.is_set():
+        request = rng.choice(requests)
+        started_at = time.perf_counter()
+        try:
+            if request["kind"] == "audio":
+                result = orchestrator.process_audio_symptoms(
+                    request["text"].encode("utf-8"), locality=request.get("locality")
+                )
+            else:
+                result = orchestrator.process_text_symptoms(request["text"], locality=request.get("locality"))
+            success = bool(result.get("success"))
+        except Exception:
+            success = False
+        recorder.record(started_at, time.perf_counter() - started_at, success)
+        if think_time > 0 and stop.wait(rng.expovariate(1 / think_time)):
+            return
+
+def run_level(orchestrator, requests, sessions, duration, ramp, think_time, seed):
+    """
+    Ejecuta un nivel de carga con `sessions` sesiones concurrentes.
+
+    :return: Diccionario con sessions, completed, errors, throughput_rps y percentiles
+    """
+    stop = threading.Event()
+    window_start = time.perf_counter() + ramp
+    recorder = LevelRecorder(window_start)
+    threads = [
+        threading.Thread(
+            target=session_loop,
+            args=(orchestrator, requests, think_time, random.Random(seed * 1000 + index), stop, recorder),
+            name=f"sesion-{index}", daemon=True
+        )
+        for index in range(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(ramp + duration)
+    stop.set()
+    # Las solicitudes en curso terminan y se cuentan (iniciaron dentro de la ventana)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - window_start
+    summary = summarize(recorder.latencies)
+    return {
+        "sessions": sessions,
+        "completed": recorder.in_window,
+        "errors": recorder.errors,
+        "throughput_rps": round(recorder.in_window / elapsed, 3) if elapsed > 0 else 0.0,
+        "p50_ms": summary["p50_ms"],
+        "p95_ms": summary["p95_ms"],
+        "p99_ms": summary["p99_ms"],
+    }
+
+def find_saturation(curve, min_gain=DEFAULT_SATURATION_GAIN):
+    """
+    Primer nivel en que agregar sesiones deja de aumentar el throughput.
+
+    :param curve: Lista de niveles (ordenados por sesiones)
+    :param min_gain: Aumento relativo mínimo de throughput para no considerarlo saturado
+    :return: Sesiones del último nivel antes de saturar (o None si no saturó)
+    """
+    for previous, current in zip(curve, curve[1:]):
+        if not previous["throughput_rps"]:
+            continue
+        gain = current["throughput_rps"] / previous["throughput_rps"] - 1
+        if gain < min_gain:
+            return previous["sessions"]
+    return None
+
+def max_sessions_within_slo(curve, slo_p95_ms):
+    """
+    Mayor nivel cuyo p95 cumple el objetivo (y sin errores).
+
+    :param curve: Lista de niveles
+    :param slo_p95_ms: Objetivo de p95 en milisegundos
+    :return: Sesiones o None si ningún nivel lo cumple
+    """
+    within = [level["sessions"] for level in curve
+              if level["p95_ms"] is not None and level["p95_ms"] <= slo_p95_ms and not level["errors"]]
+    return max(within) if within else None
+
+def print_curve(curve):
+    print(f"\n{'sesiones':>8} {'completadas':>11} {'errores':>7} {'sol/s':>8} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for level in curve:
+        print(f"{level['sessions']:>8} {level['completed']:>11} {level['errors']:>7} {level['throughput_rps']:>8} "
+              f"{str(level['p50_ms']):>10} {str(level['p95_ms']):>10} {str(level['p99_ms']):>10}")
+
+def write_csv(path, curve):
+    columns = ["sessions", "completed", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms"]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(",".join(columns) + "\n")
+        for level in curve:
+            f.write(",".join("" if level[column] is None else str(level[column]) for column in columns) + "\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga con sesiones concurrentes")
+    parser.add_argument("--workload", default=DEFAULT_WORKLOAD, help="Carga con guion (JSON; usa text y audio)")
+    parser.add_argument("--sessions", default="1,2,4,8,16", help="Niveles de sesiones concurrentes (coma)")
+    parser.add_argument("--duration", type=float, default=60.0, help="Segundos medidos por nivel")
+    parser.add_argument("--ramp", type=float, default=10.0, help="Segundos de rampa sin medir por nivel")
+    parser.add_argument("--think-time", type=float, default=5.0, help="Media del tiempo entre consultas (s)")
+    parser.add_argument("--slo-p95-ms", type=float, default=None, help="Objetivo de p95 para el máximo de sesiones")
+    parser.add_argument("--saturation-gain", type=float, default=DEFAULT_SATURATION_GAIN,
+                        help="Aumento relativo mínimo de throughput entre niveles antes de considerar saturación")
+    add_fake_arguments(parser)
+    parser.add_argument("--warm-cache", action="store_true", help="Mantener los cachés del pipeline y de respuestas")
+    parser.add_argument("--csv", default=None, help="Ruta para guardar la curva en CSV")
+    parser.add_argument("--output", default=None, help="Ruta para guardar el reporte JSON")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar los mensajes de depuración del pipeline")
+    args = parser.parse_args(argv)
+
+    try:
+        levels = sorted({int(value) for value in args.sessions.split(",") if value.strip()})
+    except ValueError:
+        print(f"Niveles de sesiones inválidos: {args.sessions}")
+        return 2
+    configure_environment(args)
+    requests = [request for request in load_json(args.workload)["requests"] if request["kind"] in ("text", "audio")]
+    if not requests:
+        print(f"La carga {args.workload} no tiene solicitudes de texto ni de audio")
+        return 2
+    install_fakes_from_args(args)
+
+    curve = []
+    workdir = tempfile.mkdtemp(prefix="load-test-")
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with quiet:
+            prepare_search_service(workdir, args.rows, args.seed)
+            from application.orchestration import HealthOrchestrator
+            orchestrator = HealthOrchestrator()
+        for sessions in levels:
+            print(f"Nivel {sessions} sesiones ({args.ramp:g} s de rampa + {args.duration:g} s)...", flush=True)
+            with quiet:
+                level = run_level(orchestrator, requests, sessions, args.duration, args.ramp, args.think_time, args.seed)
+            curve.append(level)
+            print(f"  {level['throughput_rps']} sol/s, p95 {level['p95_ms']} ms, {level['errors']} errores")
+    except Exception as e:
+        print(f"Error ejecutando la prueba de carga: {e}")
+        return 2
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    saturation = find_saturation(curve, args.saturation_gain)
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("csv", "output", "verbose")},
+        "curve": curve,
+        "saturation_sessions": saturation,
+        "max_sessions_within_slo": max_sessions_within_slo(curve, args.slo_p95_ms) if args.slo_p95_ms else None,
+    }
+    print_curve(curve)
+    if saturation is not None:
+        print(f"Saturación: el throughput deja de crecer a partir de {saturation} sesiones")
+    else:
+        print("Sin saturación en los niveles probados")
+    if args.slo_p95_ms:
+        print(f"Máximo de sesiones con p95 <= {args.slo_p95_ms:g} ms: {report['max_sessions_within_slo']}")
+    if args.csv:
+        write_csv(args.csv, curve)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Lectura y comparación de reportes de memoria (MEMORY_PROFILING=true).
+
+Uso:
+    python -m tools.memory_report show .cache/memory/memory_report.json
+    python -m tools.memory_report diff reporte_anterior.json reporte_nuevo.json --threshold-mb 50
+
+`diff` compara por etiqueta el delta de RSS (máximo para cargas e índice, medio
+para etapas) y termina con código 1 si alguno crece más que el umbral.
+"""
+import sys
+import json
+import argparse
+
+def load_report(path):
+    """
+    Lee un reporte JSON generado por utils.memory_utils.
+
+    :param path: Ruta del reporte
+    :return: Diccionario del reporte
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def label_metric(summary):
+    """
+    Métrica comparable de una etiqueta.
+
+    :param summary: Resumen de la etiqueta en el reporte
+    :return: MB (o None si no hay medición)
+    """
+    if summary.get("kind") == "stage":
+        return summary.get("rss_delta_mb_mean")
+    return summary.get("rss_delta_mb_max")
+
+def show(report):
+    current = report.get("current", {})
+    print(f"Reporte {report.get('created_at')} | release: {report.get('release')} | python {report.get('python')}")
+    print(f"RSS actual: {current.get('rss_mb')} MB | tracemalloc: {current.get('traced_mb')} MB "
+          f"(pico {current.get('traced_peak_mb')} MB)")
+    print(f"{'etiqueta':<32} {'tipo':<6} {'n':>5} {'delta RSS MB':>13} {'RSS después':>12}")
+    for label, summary in report.get("labels", {}).items():
+        print(f"{label:<32} {summary.get('kind', ''):<6} {summary.get('count', 0):>5} "
+              f"{str(label_metric(summary)):>13} {str(summary.get('rss_after_mb_last')):>12}")
+    for label, allocations in report.get("top_allocations", {}).items():
+        print(f"\nMayores asignaciones (Python) después de {label}:")
+        for allocation in allocations[:5]:
+            print(f"  {allocation['size_mb']:>8} MB  {allocation['file']}")
+
+def diff(old, new, threshold_mb):
+    """
+    Compara dos reportes por etiqueta.
+
+    :param old: Reporte de referencia
+    :param new: Reporte nuevo
+    :param threshold_mb: Crecimiento máximo permitido por etiqueta
+    :return: Lista de etiquetas que superan el umbral
+    """
+    regressions = []
+    old_labels, new_labels = old.get("labels", {}), new.get("labels", {})
+    print(f"{'etiqueta':<32} {'anterior':>10} {'nuevo':>10} {'diferencia':>11}")
+    for label in sorted(set(old_labels) | set(new_labels)):
+        before = label_metric(old_labels[label]) if label in old_labels else None
+        after = label_metric(new_labels[label]) if label in new_labels else None
+        change = round(after - before, 2) if before is not None and after is not None else None
+        flag = ""
+        if change is not None and change > threshold_mb:
+            regressions.append(label)
+            flag = "  <-- regresión"
+        print(f"{label:<32} {str(before):>10} {str(after):>10} {str(change):>11}{flag}")
+    old_rss = old.get("current", {}).get("rss_mb")
+    new_rss = new.get("current", {}).get("rss_mb")
+    print(f"\nRSS final: {old_rss} MB -> {new_rss} MB")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Muestra o compara reportes de memoria")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    show_parser = subparsers.add_parser("show", help="Muestra un reporte")
+    show_parser.add_argument("report")
+    diff_parser = subparsers.add_parser("diff", help="Compara dos reportes")
+    diff_parser.add_argument("old")
+    diff_parser.add_argument("new")
+    diff_parser.add_argument("--threshold-mb", type=float, default=50.0,
+                             help="Crecimiento máximo permitido por etiqueta (MB)")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "show":
+            show(load_report(args.report))
+            return 0
+        regressions = diff(load_report(args.old), load_report(args.new), args.threshold_mb)
+    except (OSError, ValueError) as e:
+        print(f"Error leyendo el reporte: {e}")
+        return 2
+    if regressions:
+        print(f"Regresiones de memoria (> {args.threshold_mb} MB): {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""
+Reproducción fuera de línea de trazas capturadas en producción (ver utils/capture_utils.py).
+
+Vuelve a ejecutar cada traza (texto de síntomas o transcripción anonimizados y
+localidad) con el código actual a través del grafo de texto de
+`HealthOrchestrator`, y compara contra lo capturado: éxito, especialidades
+consultadas, filas del índice recuperadas y tiempos por etapa. Las trazas de
+audio se reproducen desde su transcripción (el audio no se captura).
+
+Con `--backend fake` se usan los modelos falsos de tools/fakes.py y un índice
+sintético: sirve para comparar tiempos del código, no filas recuperadas.
+
+Uso:
+    python -m tools.replay .cache/capture/traces.jsonl
+    python -m tools.replay traces.jsonl --limit 200 --concurrency 4 --output replay.json
+    python -m tools.replay traces.jsonl --backend fake --rows 500
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from tools.benchmark import add_fake_arguments, install_fakes_from_args, prepare_search_service, summarize
+
+DEFAULT_CAPTURE_PATH = os.getenv("TRACE_CAPTURE_PATH", ".cache/capture/traces.jsonl")
+
+def trace_input(trace):
+    """
+    Entrada reproducible de una traza.
+
+    :param trace: Traza capturada
+    :return: Tupla (texto de síntomas o None, localidad)
+    """
+    values = trace.get("values") or {}
+    return values.get("symptoms_text") or values.get("transcription"), values.get("locality")
+
+def replay_trace(orchestrator, trace):
+    """
+    Ejecuta una traza con el código actual y captura el resultado (sin escribirlo).
+
+    :param orchestrator: HealthOrchestrator
+    :param trace: Traza capturada
+    :return: Traza nueva con el mismo formato (o None si la traza no tiene texto)
+    """
+    from application.orchestration import request_deadline
+    from utils.capture_utils import capture_scope
+
+    text, locality = trace_input(trace)
+    if not text:
+        return None
+    with request_deadline(), capture_scope("texto", force=True) as capture:
+        run = orchestrator.text_graph.run({"symptoms_text": text, "locality": locality})
+    return capture.record(run)
+
+def _rows(trace):
+    return set((trace.get("intermediate") or {}).get("rag.rows") or [])
+
+def compare(captured, replayed):
+    """
+    Diferencias entre la traza capturada y la reproducida.
+
+    :return: Diccionario con success, same_specialties, rows_jaccard (None si ninguna recuperó filas),
+             tiempos por etapa y total
+    """
+    before, after = _rows(captured), _rows(replayed)
+    old_specialties = (captured.get("intermediate") or {}).get("rag.specialties")
+    new_specialties = (replayed.get("intermediate") or {}).get("rag.specialties")
+    # Las etapas omitidas en la captura (transcripción previa, caché) no se comparan
+    stages = set(captured.get("timings") or {}) & set(replayed.get("timings") or {})
+    return {
+        "id": captured.get("id"),
+        "graph": captured.get("graph"),
+        "success": [captured.get("success"), replayed.get("success")],
+        "same_specialties": sorted(old_specialties or []) == sorted(new_specialties or []),
+        "specialties": [old_specialties, new_specialties],
+        "rows_jaccard": round(len(before & after) / len(before | after), 3) if before | after else None,
+        "rows_lost": sorted(before - after, key=str),
+        "rows_new": sorted(after - before, key=str),
+        "fallbacks": [captured.get("fallbacks") or {}, replayed.get("fallbacks") or {}],
+        "timings": {stage: [captured["timings"][stage], replayed["timings"][stage]] for stage in sorted(stages)},
+        "total_seconds": [
+            sum(captured["timings"][stage] for stage in stages), sum(replayed["timings"][stage] for stage in stages)
+        ],
+    }
+
+def build_report(diffs):
+    """
+    Resumen de las comparaciones.
+
+    :param diffs: Lista de resultados de compare
+    :return: Diccionario con conteos, concordancia y percentiles antes/después
+    """
+    if not diffs:
+        return {"traces": 0}
+    jaccards = [diff["rows_jaccard"] for diff in diffs if diff["rows_jaccard"] is not None]
+    latency = {}
+    for name in sorted({stage for diff in diffs for stage in diff["timings"]}):
+        latency[name] = {
+            "before": summarize([diff["timings"][name][0] for diff in diffs if name in diff["timings"]]),
+            "after": summarize([diff["timings"][name][1] for diff in diffs if name in diff["timings"]]),
+        }
+    latency["total"] = {
+        "before": summarize([diff["total_seconds"][0] for diff in diffs]),
+        "after": summarize([diff["total_seconds"][1] for diff in diffs]),
+    }
+    return {
+        "traces": len(diffs),
+        "success_before": sum(bool(diff["success"][0]) for diff in diffs),
+        "success_after": sum(bool(diff["success"][1]) for diff in diffs),
+        "regressions": sum(bool(diff["success"][0]) and not diff["success"][1] for diff in diffs),
+        "same_specialties": round(sum(diff["same_specialties"] for diff in diffs) / len(diffs), 3),
+        "rows_jaccard_mean": round(sum(jaccards) / len(jaccards), 3) if jaccards else None,
+        "latency": latency,
+    }
+
+def print_report(report):
+    print(f"\n{report['traces']} trazas reproducidas | éxito antes/después: {report['success_before']}/"
+          f"{report['success_after']} ({report['regressions']} regresiones)")
+    print(f"Mismas especialidades: {report['same_specialties']:.1%} | "
+          f"Jaccard medio de filas recuperadas: {report['rows_jaccard_mean']}")
+    print(f"{'etapa':<14} {'n':>5} {'p50 antes':>10} {'p50 ahora':>10} {'p95 antes':>10} {'p95 ahora':>10}")
+    for name, latency in report["latency"].items():
+        before, after = latency["before"], latency["after"]
+        print(f"{name:<14} {before['count']:>5} {before['p50_ms']:>10} {after['p50_ms']:>10} "
+              f"{before['p95_ms']:>10} {after['p95_ms']:>10}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reproduce trazas capturadas con el código actual")
+    parser.add_argument("captures", nargs="?", default=DEFAULT_CAPTURE_PATH,
+                        help="Archivo de captura (se leen también sus rotaciones .1, .2, ...)")
+    parser.add_argument("--backend", choices=["real", "fake"], default="real",
+                        help="Modelos configurados o los falsos de tools/fakes.py")
+    parser.add_argument("--graph", choices=["texto", "audio", "all"], default="all", help="Trazas a reproducir")
+    parser.add_argument("--limit", type=int, default=None, help="Reproducir como máximo N trazas (las más recientes)")
+    parser.add_argument("--concurrency", type=int, default=1, help="Trazas reproducidas en paralelo")
+    parser.add_argument("--warm-cache", action="store_true", help="Mantener los cachés del pipeline y de respuestas")
+    add_fake_arguments(parser)
+    parser.add_argument("--output", default=None, help="Ruta para guardar el reporte JSON (con el detalle por traza)")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar los mensajes de depuración del pipeline")
+    args = parser.parse_args(argv)
+
+    # La reproducción no escribe nuevas trazas en el archivo de captura
+    os.environ["TRACE_CAPTURE"] = "false"
+    os.environ["DATASET_HOT_RELOAD"] = "false"
+    if not args.warm_cache:
+        os.environ["PIPELINE_CACHE_BACKEND"] = "none"
+        os.environ["ANSWER_CACHE_TTL_SECONDS"] = "0"
+    if args.backend == "fake":
+        os.environ.setdefault("OPENAI_API_KEY", "replay")
+        os.environ["ALLOW_RUNTIME_INDEX_BUILD"] = "true"
+
+    from utils.capture_utils import read_captures
+    traces = [trace for trace in read_captures(args.captures)
+              if args.graph == "all" or trace.get("graph") == args.graph]
+    traces = [trace for trace in traces if trace_input(trace)[0]]
+    if args.limit is not None:
+        traces = traces[-args.limit:]
+    if not traces:
+        print(f"No hay trazas reproducibles en {args.captures}")
+        return 2
+
+    workdir = tempfile.mkdtemp(prefix="replay-")
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with quiet:
+            if args.backend == "fake":
+                install_fakes_from_args(args)
+                prepare_search_service(workdir, args.rows, args.seed)
+            from application.orchestration import HealthOrchestrator
+            orchestrator = HealthOrchestrator()
+        print(f"Reproduciendo {len(traces)} trazas (backend {args.backend}, concurrencia {args.concurrency})...",
+              flush=True)
+        start = time.perf_counter()
+        with quiet, ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+            replayed = list(executor.map(lambda trace: replay_trace(orchestrator, trace), traces))
+        wall_seconds = time.perf_counter() - start
+    except Exception as e:
+        print(f"Error reproduciendo las trazas: {e}")
+        return 2
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    diffs = [compare(captured, new) for captured, new in zip(traces, replayed) if new is not None]
+    report = build_report(diffs)
+    report["wall_seconds"] = round(wall_seconds, 3)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(dict(report, config=vars(args), diffs=diffs), f, ensure_ascii=False, indent=2)
+    return 1 if report["regressions"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+"""
+Cachés con expiración (TTL) y límite de entradas (LRU), y caché por etapas
+del pipeline con backends intercambiables (memoria o disco).
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+# Prefijo de los mensajes de error que devuelven las funciones del pipeline
+# ("Error en búsqueda: ...", "Error en consulta RAG: ..."); nunca se cachean
+ERROR_RESULT_PREFIX = "Error en"
+
+class TTLLRUCache:
+    """
+    Caché seguro para múltiples hilos con expiración por tiempo y desalojo LRU.
+
+    :param max_entries: Cantidad máxima de entradas
+    :param ttl_seconds: Tiempo de vida de cada entrada en segundos
+    """
+    def __init__(self, max_entries=256, ttl_seconds=3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """
+        Obtiene un valor si existe y no expiró (y lo marca como usado recientemente).
+
+        :param key: Clave (hashable)
+        :param default: Valor a devolver si no hay entrada válida
+        :return: Valor almacenado o default
+        """
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """
+        Guarda un valor, desalojando la entrada menos usada si se supera el límite.
+
+        :param key: Clave (hashable)
+        :param value: Valor a almacenar
+        :return: None
+        """
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """
+        Elimina todas las entradas.
+
+        :return: None
+        """
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        """
+        Devuelve estadísticas de uso del caché.
+
+        :return: Diccionario con entries, hits y misses
+        """
+        with self._lock:
+            return {"entries": len(self._data), "hits": self.hits, "misses": self.misses}
+
+class MemoryCacheBackend:
+    """
+    Backend en memoria del proceso (TTL + LRU).
+
+    :param max_entries: Cantidad máxima de entradas
+    :param ttl_seconds: Tiempo de vida de cada entrada en segundos
+    """
+    def __init__(self, max_entries=512, ttl_seconds=3600, **_):
+        self._cache = TTLLRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+
+    def clear(self):
+        self._cache.clear()
+
+class DiskCacheBackend:
+    """
+    Backend en disco (un JSON por entrada), compartido entre procesos y reinicios.
+
+    Los valores deben ser serializables a JSON. Las entradas vencidas se borran
+    al leerlas, y al guardar se poda el directorio: primero las vencidas y luego
+    las más antiguas hasta quedar en max_entries.
+
+    :param directory: Directorio donde se guardan las entradas
+    :param max_entries: Cantidad máxima de entradas en el directorio
+    :param ttl_seconds: Tiempo de vida de cada entrada en segundos
+    """
+    def __init__(self, directory=".cache/pipeline", max_entries=512, ttl_seconds=3600, **_):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires_at", 0) <= time.time():
+            self._remove(path)
+            return None
+        return entry.get("value")
+
+    def set(self, key, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"expires_at": time.time() + self.ttl_seconds, "value": value}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._prune()
+
+    def _prune(self):
+        # La fecha de modificación es la de escritura: vence a los ttl_seconds
+        entries = []
+        expired_before = time.time() - self.ttl_seconds
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if not entry.name.endswith(".json"):
+                        continue
+                    try:
+                        mtime = entry.stat().st_mtime
+                    except OSError:
+                        continue
+                    if mtime <= expired_before:
+                        self._remove(entry.path)
+                    else:
+                        entries.append((mtime, entry.path))
+        except OSError:
+            return
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_entries]:
+            self._remove(path)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                self._remove(os.path.join(self.directory, name))
+
+# Registro de backends disponibles para PipelineCache (extensible con register_cache_backend)
+CACHE_BACKENDS = {
+    "memory": MemoryCacheBackend,
+    "disk": DiskCacheBackend,
+}
+
+def register_cache_backend(name, factory):
+    """
+    Registra un backend de caché adicional (p. ej. Redis).
+
+    :param name: Nombre con el que se selecciona en la configuración
+    :param factory: Clase o función que recibe las opciones y devuelve un objeto con get/set/clear
+    :return: None
+    """
+    CACHE_BACKENDS[name] = factory
+
+def create_cache_backend(name, **options):
+    """
+    Crea un backend de caché registrado.
+
+    :param name: Nombre del backend ("memory", "disk" u otro registrado)
+    :param options: Opciones del backend (max_entries, ttl_seconds, directory...)
+    :return: Instancia del backend
+    """
+    if name not in CACHE_BACKENDS:
+        raise ValueError(f"Backend de caché desconocido: {name}")
+    return CACHE_BACKENDS[name](**options)
+
+class PipelineCache:
+    """
+    Caché por etapa del pipeline con contadores de aciertos y fallos.
+
+    :param backend: Objeto con métodos get(key), set(key, value) y clear()
+    """
+    def __init__(self, backend):
+        self.backend = backend
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _count(self, stage, outcome):
+        with self._lock:
+            counters = self._counters.setdefault(stage, {"hits": 0, "misses": 0})
+            counters[outcome] += 1
+
+    def get(self, stage, key):
+        """
+        Busca el resultado de una etapa.
+
+        :param stage: Nombre de la etapa (p. ej. "extraction", "rag")
+        :param key: Clave hashable de la entrada de la etapa
+        :return: Resultado almacenado o None
+        """
+        value = self.backend.get((stage, key))
+        self._count(stage, "hits" if value is not None else "misses")
+        return value
+
+    def set(self, stage, key, value):
+        """
+        Guarda el resultado de una etapa.
+
+        :param stage: Nombre de la etapa
+        :param key: Clave hashable de la entrada de la etapa
+        :param value: Resultado (no None); los textos de error no se guardan
+        :return: None
+        """
+        if isinstance(value, str) and value.startswith(ERROR_RESULT_PREFIX):
+            return
+        self.backend.set((stage, key), value)
+
+    def clear(self):
+        """
+        Vacía el backend (los contadores se conservan).
+
+        :return: None
+        """
+        self.backend.clear()
+
+    def stats(self):
+        """
+        Devuelve los contadores por etapa.
+
+        :return: Diccionario etapa -> {"hits": n, "misses": n}
+        """
+        with self._lock:
+            return {stage: dict(counters) for stage, counters in self._counters.items()}
@@ -0,0 +1,301 @@
+"""
+Captura de trazas de producción (opcional, TRACE_CAPTURE=true).
+
+Cada ejecución de un grafo del pipeline se guarda como una línea JSON en un
+archivo local con rotación (TRACE_CAPTURE_PATH): entradas, salidas intermedias
+(textos de los LLM, entidades de spaCy, filas recuperadas del índice), tiempos
+por etapa, variantes degradadas y uso de modelos. Los textos se anonimizan
+(correos, URLs, documentos, fechas, direcciones, teléfonos y nombres declarados)
+o, con TRACE_CAPTURE_TEXT=hash, los textos libres se guardan solo como sha256;
+el audio no se guarda. `tools/replay.py` vuelve a ejecutar las trazas con el código actual.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from .text_utils import fold_accents
+
+TRACE_CAPTURE = os.getenv("TRACE_CAPTURE", "false").lower() in ("1", "true", "yes")
+TRACE_CAPTURE_PATH = os.getenv("TRACE_CAPTURE_PATH", ".cache/capture/traces.jsonl")
+TRACE_CAPTURE_MAX_MB = float(os.getenv("TRACE_CAPTURE_MAX_MB", "20"))
+TRACE_CAPTURE_BACKUPS = int(os.getenv("TRACE_CAPTURE_BACKUPS", "5"))
+TRACE_CAPTURE_SAMPLE_RATE = float(os.getenv("TRACE_CAPTURE_SAMPLE_RATE", "1.0"))
+
+# Valores del grafo que se guardan (el audio nunca se guarda)
+CAPTURED_VALUES = ("symptoms_text", "transcription", "locality", "entities", "recommendations")
+
+# Textos libres del usuario (y su traducción); con TRACE_CAPTURE_TEXT=hash solo se guarda su sha256
+TRACE_CAPTURE_TEXT = os.getenv("TRACE_CAPTURE_TEXT", "anonymized").lower()
+FREE_TEXT_FIELDS = ("symptoms_text", "transcription", "hf.es_en")
+
+_MONTHS = "enero|febrero|marzo|abril|mayo|junio|julio|agosto|septiembre|setiembre|octubre|noviembre|diciembre"
+
+# Patrones de datos personales, en orden de aplicación
+_REDACTIONS = [
+    (re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"), "<email>"),
+    (re.compile(r"https?://\S+|www\.\S+", re.IGNORECASE), "<url>"),
+    # Cédula uruguaya: 1.234.567-8 o 1234567-8
+    (re.compile(r"\b\d{1,2}\.?\d{3}\.?\d{3}-\d\b"), "<documento>"),
+    # Direcciones: tipo de vía, hasta cuatro palabras y número de puerta ("Av. 18 de Julio 1234";
+    # antes que las fechas)
+    (re.compile(
+        r"\b(?:calle|avenida|avda\.?|av\.?|bulevar|boulevard|bv\.?|camino|ruta|pasaje|rambla)\s+"
+        r"(?:[\w.]+\s+){0,4}(?:n[°º.]?\s*)?\d{1,5}\b(?:\s+(?:apto|apartamento|esq\.?|esquina)\.?\s*\w+)?",
+        re.IGNORECASE
+    ), "<direccion>"),
+    (re.compile(r"\b((?:vivo en|mi direcci[oó]n es|domicilio en)\s+)(?:[\w.]+\s+){0,4}\d{1,5}\b", re.IGNORECASE),
+     r"\1<direccion>"),
+    # Fechas: 12/03/1980, 12-3-80, "12 de marzo de 1980"
+    (re.compile(r"\b\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}\b"), "<fecha>"),
+    (re.compile(rf"\b\d{{1,2}}\s+de\s+(?:{_MONTHS})(?:\s+(?:de|del)\s+\d{{4}})?\b", re.IGNORECASE), "<fecha>"),
+    (re.compile(r"\+?\d[\d\s().-]{6,}\d"), "<telefono>"),
+]
+
+# Nombres declarados ("me llamo ana pérez", "soy Juan"): hasta tres palabras, en
+# mayúsculas o minúsculas, cortando en la primera palabra de _NAME_STOPWORDS; la
+# búsqueda sigue desde el corte ("soy hipertenso y mi nombre es Pedro")
+_DECLARED_NAME = re.compile(r"\b(me llamo|mi nombre es|soy)((?:\s+[^\W\d_]+){1,3})", re.IGNORECASE)
+
+# Condiciones, vínculos y palabras frecuentes después de "soy" que no son nombres (sin tildes, minúsculas)
+_NAME_STOPWORDS = {
+    "diabetico", "diabetica", "hipertenso", "hipertensa", "asmatico", "asmatica", "alergico", "alergica",
+    "celiaco", "celiaca", "epileptico", "epileptica", "obeso", "obesa", "fumador", "fumadora",
+    "insulinodependiente", "cardiaco", "cardiaca", "renal", "oncologico", "oncologica", "trasplantado",
+    "trasplantada", "operado", "operada", "embarazada", "sordo", "sorda", "ciego", "ciega", "discapacitado",
+    "discapacitada", "vegetariano", "vegetariana", "deportista", "paciente", "madre", "padre", "mama", "papa",
+    "hijo", "hija", "abuelo", "abuela", "esposo", "esposa", "medico", "medica", "enfermero", "enfermera",
+    "mayor", "menor", "nuevo", "nueva", "muy", "bastante", "un", "una", "el", "la", "los", "las", "de", "del",
+    "y", "e", "o", "u", "con", "sin", "que", "en", "por", "para", "pero", "porque", "tengo", "estoy", "hace",
+    "desde", "a", "al", "yo", "me", "mi", "llamo", "nombre", "es", "soy", "se", "su", "tu", "mujer", "hombre", "varon", "nino", "nina", "adulto", "adulta", "jubilado", "jubilada",
+}
+_current_capture = contextvars.ContextVar("trace_capture", default=None)
+_writer = None
+_writer_lock = threading.Lock()
+
+def anonymize_text(text):
+    """
+    Reemplaza los datos personales de un texto por marcadores.
+
+    :param text: Texto de entrada (o None)
+    :return: Texto anonimizado (None si la entrada es None)
+    """
+    if text is None:
+        return None
+    text = str(text)
+    for pattern, replacement in _REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return _redact_names(text)
+
+def _redact_names(text):
+    """
+    Reemplaza los nombres declarados por <nombre>.
+
+    Las palabras del nombre se toman hasta la primera de _NAME_STOPWORDS y la
+    búsqueda continúa desde allí, de modo que una frase posterior ("me llamo",
+    "mi nombre es") no queda absorbida por una anterior ("soy").
+
+    :param text: Texto de entrada
+    :return: Texto con los nombres reemplazados
+    """
+    parts = []
+    pos = 0
+    while True:
+        match = _DECLARED_NAME.search(text, pos)
+        if match is None:
+            break
+        taken = ""
+        for word in re.findall(r"\s+[^\W\d_]+", match.group(2)):
+            if fold_accents(word.strip()).lower() in _NAME_STOPWORDS:
+                break
+            taken += word
+        parts.append(text[pos:match.end(1)])
+        if taken:
+            parts.append(" <nombre>")
+        pos = match.end(1) + len(taken)
+    parts.append(text[pos:])
+    return "".join(parts)
+
+def _hash_free_text(fields):
+    """
+    Reemplaza los textos libres por su sha256 (TRACE_CAPTURE_TEXT=hash).
+
+    :param fields: Diccionario de valores o salidas intermedias
+    :return: Diccionario con "<campo>_sha256" en lugar de cada texto libre
+    """
+    hashed = {}
+    for name, value in fields.items():
+        if name in FREE_TEXT_FIELDS and isinstance(value, str):
+            hashed[f"{name}_sha256"] = hashlib.sha256(value.encode("utf-8")).hexdigest()
+        else:
+            hashed[name] = value
+    return hashed
+
+def _anonymize(value):
+    if isinstance(value, str):
+        return anonymize_text(value)
+    if isinstance(value, dict):
+        return {key: _anonymize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_anonymize(item) for item in value]
+    return value
+
+def _get_writer():
+    """
+    Logger dedicado que escribe en TRACE_CAPTURE_PATH con rotación por tamaño.
+
+    :return: logging.Logger
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                directory = os.path.dirname(TRACE_CAPTURE_PATH)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                handler = RotatingFileHandler(
+                    TRACE_CAPTURE_PATH,
+                    maxBytes=int(TRACE_CAPTURE_MAX_MB * 1024 * 1024),
+                    backupCount=TRACE_CAPTURE_BACKUPS,
+                    encoding="utf-8"
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                writer = logging.getLogger("buscador.trace_capture")
+                writer.setLevel(logging.INFO)
+                writer.propagate = False
+                writer.addHandler(handler)
+                _writer = writer
+    return _writer
+
+class TraceCapture:
+    """
+    Traza capturada de una ejecución de un grafo.
+
+    :param graph: Nombre del grafo ("texto" o "audio")
+    """
+    def __init__(self, graph):
+        self.id = uuid.uuid4().hex[:16]
+        self.graph = graph
+        self.captured_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.intermediate = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, value):
+        """
+        Guarda una salida intermedia (si la etapa se reintenta, queda la última).
+
+        :param name: Nombre de la salida (p. ej. "hf.es_en", "spacy.entities", "rag.rows")
+        :param value: Valor serializable en JSON
+        :return: None
+        """
+        with self._lock:
+            self.intermediate[name] = value
+
+    def record(self, run):
+        """
+        Línea de la traza a partir del resultado de la ejecución.
+
+        :param run: PipelineRun terminado
+        :return: Diccionario anonimizado
+        """
+        with self._lock:
+            intermediate = dict(self.intermediate)
+        values = {name: run.values.get(name) for name in CAPTURED_VALUES if name in run.values}
+        if TRACE_CAPTURE_TEXT == "hash":
+            values, intermediate = _hash_free_text(values), _hash_free_text(intermediate)
+        audio = run.values.get("audio_bytes")
+        return {
+            "id": self.id,
+            "graph": self.graph,
+            "captured_at": self.captured_at,
+            "values": _anonymize(values),
+            "audio_bytes": len(audio) if audio else None,
+            "intermediate": _anonymize(intermediate),
+            "success": run.success,
+            "error_message": anonymize_text(run.error_message),
+            "failed_stage": run.failed_stage,
+            "timings": run.timings,
+            "skipped": run.skipped,
+            "cache_hits": run.cache_hits,
+            "fallbacks": run.fallbacks,
+            "usage": run.usage.summary()["total"] if run.usage is not None else None,
+        }
+
+@contextmanager
+def capture_scope(graph, force=False):
+    """
+    Abre la captura de una ejecución si TRACE_CAPTURE está activo (y la muestra
+    la incluye). Dentro de otra captura no abre una nueva: las salidas
+    intermedias se agregan a la exterior.
+
+    :param graph: Nombre del grafo
+    :param force: True para capturar aunque TRACE_CAPTURE esté desactivado (p. ej. en tools/replay.py)
+    :return: Context manager que entrega el TraceCapture nuevo o None
+    """
+    if _current_capture.get() is not None:
+        yield None
+        return
+    if not force and (not TRACE_CAPTURE or random.random() >= TRACE_CAPTURE_SAMPLE_RATE):
+        yield None
+        return
+    capture = TraceCapture(graph)
+    token = _current_capture.set(capture)
+    try:
+        yield capture
+    finally:
+        _current_capture.reset(token)
+
+def capture_value(name, value):
+    """
+    Agrega una salida intermedia a la captura activa (no hace nada si no hay una).
+
+    :param name: Nombre de la salida
+    :param value: Valor serializable en JSON
+    :return: None
+    """
+    capture = _current_capture.get()
+    if capture is not None:
+        capture.add(name, value)
+
+def write_capture(capture, run):
+    """
+    Escribe la traza de una ejecución terminada. Los errores de escritura no afectan la solicitud.
+
+    :param capture: TraceCapture de capture_scope (None si no se captura)
+    :param run: PipelineRun terminado
+    :return: None
+    """
+    if capture is None:
+        return
+    try:
+        _get_writer().info(json.dumps(capture.record(run), ensure_ascii=False, default=str))
+    except Exception as e:
+        print(f"Error guardando la traza capturada: {e}")
+
+def read_captures(path):
+    """
+    Lee las trazas de un archivo de captura y de sus rotaciones (de la más antigua a la más nueva).
+
+    :param path: Ruta del archivo de captura (TRACE_CAPTURE_PATH)
+    :return: Generador de diccionarios
+    """
+    rotated = []
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        rotated.append(f"{path}.{index}")
+        index += 1
+    for file_path in list(reversed(rotated)) + ([path] if os.path.exists(path) else []):
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
@@ -0,0 +1,145 @@
+"""
+Utilidades de concurrencia compartidas por el pipeline.
+"""
+import asyncio
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from .deadline_utils import remaining_seconds, deadline_expired
+
+# En Python 3.10 los timeouts de futures y asyncio no son subclases de TimeoutError
+_TIMEOUT_ERRORS = (TimeoutError, FutureTimeoutError, asyncio.TimeoutError)
+
+class _Call:
+    __slots__ = ("done", "result", "error", "aborted", "deadline_failure")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.aborted = False
+        self.deadline_failure = False
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes con la misma clave en una sola ejecución.
+
+    El primer hilo que llega ejecuta la función; los que llegan mientras está
+    en curso esperan y reciben el mismo resultado (o la misma Exception).
+    Una vez terminada, la clave se libera y la siguiente llamada vuelve a ejecutar.
+
+    Cada hilo que espera respeta su propio plazo (deadline_utils): si vence
+    antes de que termine la ejecución compartida, recibe TimeoutError. Si la
+    ejecución falla por el plazo de quien la ejecutaba (o por un timeout) y al
+    que espera todavía le queda tiempo, este vuelve a intentar en lugar de
+    recibir ese error. Lo mismo ocurre si se interrumpe con un BaseException
+    que no es Exception (KeyboardInterrupt, SystemExit, GeneratorExit): solo lo
+    recibe el hilo que ejecutaba.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        Ejecuta fn una sola vez por clave entre las llamadas simultáneas.
+
+        :param key: Clave hashable que identifica la operación
+        :param fn: Función sin argumentos a ejecutar
+        :return: Resultado de fn (compartido entre las llamadas agrupadas)
+        :raises TimeoutError: Si vence el plazo propio mientras espera a otra ejecución
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = _Call()
+                    self._calls[key] = call
+            if leader:
+                break
+            if not call.done.wait(remaining_seconds()):
+                raise TimeoutError("Plazo vencido esperando una ejecución agrupada")
+            if call.aborted or (call.deadline_failure and not deadline_expired()):
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            call.deadline_failure = deadline_expired() or isinstance(e, _TIMEOUT_ERRORS)
+            raise
+        except BaseException:
+            # Interrupción del hilo que ejecutaba: no se propaga a los demás
+            call.aborted = True
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def in_flight(self):
+        """
+        Cantidad de operaciones distintas en curso.
+
+        :return: Entero
+        """
+        with self._lock:
+            return len(self._calls)
+
+class _AsyncCall:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+class AsyncSingleFlight:
+    """
+    Equivalente de SingleFlight para corutinas dentro de un event loop.
+
+    La corutina corre en una tarea compartida que todas las llamadas esperan
+    con shield: cancelar a cualquiera de ellas (también a la primera) no
+    cancela a las demás. La tarea se cancela solo cuando no queda nadie
+    esperándola. Las claves se separan por event loop, ya que una tarea solo
+    puede esperarse desde el loop que la creó.
+    """
+    def __init__(self):
+        self._calls = {}
+        self.coalesced = 0
+
+    async def do(self, key, coro_fn):
+        """
+        Ejecuta coro_fn una sola vez por clave entre las llamadas simultáneas.
+
+        :param key: Clave hashable que identifica la operación
+        :param coro_fn: Función sin argumentos que devuelve una corutina
+        :return: Resultado de la corutina (compartido entre las llamadas agrupadas)
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        call = self._calls.get(flight_key)
+        if call is not None:
+            self.coalesced += 1
+        else:
+            call = _AsyncCall(loop.create_task(coro_fn()))
+            self._calls[flight_key] = call
+            call.task.add_done_callback(lambda task: self._finished(flight_key, call))
+        call.waiters += 1
+        try:
+            # shield: cancelar a quien espera no cancela la ejecución compartida
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def _finished(self, flight_key, call):
+        if self._calls.get(flight_key) is call:
+            del self._calls[flight_key]
+        # Evita el aviso "exception was never retrieved" si nadie esperaba el resultado
+        if not call.task.cancelled():
+            call.task.exception()
@@ -0,0 +1,193 @@
+"""
+Construcción compacta del contexto de prestadores para el prompt RAG.
+"""
+import re
+from .text_utils import estimate_tokens, fold_accents
+
+MISSING_VALUE = "-"
+# Combinaciones de columnas recordadas por CompactContextBuilder (chunks parciales generan otras)
+_MAX_LAYOUTS = 256
+
+def parse_page_content(page_content):
+    """
+    Convierte el contenido de un documento ("col: val | col: val ...") en un diccionario.
+
+    :param page_content: Texto del documento generado por DocumentLoader
+    :return: Diccionario columna -> valor
+    """
+    fields = {}
+    for part in page_content.split(" | "):
+        if ": " not in part:
+            continue
+        column, value = part.split(": ", 1)
+        fields[column.strip()] = value.strip()
+    return fields
+
+def _fold_key(text):
+    """
+    Normaliza un texto para comparaciones (minúsculas, sin tildes ni signos).
+
+    :param text: Texto de entrada
+    :return: Texto normalizado
+    """
+    return re.sub(r"[^a-z0-9@]+", "", fold_accents(text).lower())
+
+class CompactContextBuilder:
+    """
+    Arma el contexto del prompt con solo las columnas que usa la respuesta,
+    en formato tabular y sin filas casi idénticas.
+
+    :param fields: Lista de columnas a conservar, en orden de salida
+    """
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self._folded_fields = [_fold_key(field) for field in self.fields]
+        # Columnas de un documento -> campo de cada una (los documentos de un dataset comparten columnas)
+        self._layouts = {}
+
+    def _match_field(self, column, exact):
+        """
+        Asocia una columna del dataset a uno de los campos configurados.
+
+        :param column: Nombre de columna del documento
+        :param exact: True para igualdad sin tildes ni mayúsculas; False para
+            coincidencia parcial (p. ej. "Telefono de contacto" -> "Teléfono")
+        :return: Índice del campo o None si no corresponde a ninguno
+        """
+        folded = _fold_key(column)
+        for index, field in enumerate(self._folded_fields):
+            if folded == field if exact else (field and field in folded):
+                return index
+        return None
+
+    def _layout(self, columns):
+        """
+        Asigna a cada campo configurado una columna del documento.
+
+        Las columnas con el nombre exacto del campo tienen prioridad; la
+        coincidencia parcial solo completa los campos que quedaron sin columna
+        ("Nombre del centro" no reemplaza a "Nombre", ni "Subespecialidad" a
+        "Especialidad").
+
+        :param columns: Tupla de nombres de columna, en el orden del documento
+        :return: Lista de tuplas (columna, índice del campo)
+        """
+        layout = self._layouts.get(columns)
+        if layout is None:
+            assigned = {}
+            for exact in (True, False):
+                for column in columns:
+                    if column in assigned.values():
+                        continue
+                    index = self._match_field(column, exact)
+                    if index is not None and index not in assigned:
+                        assigned[index] = column
+            layout = [(column, index) for index, column in assigned.items()]
+            if len(self._layouts) < _MAX_LAYOUTS:
+                self._layouts[columns] = layout
+        return layout
+
+    def _row_values(self, doc):
+        """
+        Extrae los valores de los campos configurados de un documento.
+
+        :param doc: Document con contenido "col: val | ..."
+        :return: Lista de valores (MISSING_VALUE si falta) o None si no hay ningún campo
+        """
+        row = parse_page_content(doc.page_content)
+        layout = self._layout(tuple(row))
+        if not layout:
+            return None
+        values = [MISSING_VALUE] * len(self.fields)
+        for column, index in layout:
+            values[index] = row[column].replace("|", "/") or MISSING_VALUE
+        return values
+
+    def row(self, doc):
+        """
+        Fila compacta de un documento, tal como se incluye en el contexto.
+
+        :param doc: Document con contenido "col: val | ..."
+        :return: Tupla (línea, clave de deduplicación o None si se conserva el texto original)
+        """
+        values = self._row_values(doc)
+        if values is None:
+            return doc.page_content, None
+        return " | ".join(values), self._dedup_key(values)
+
+    def header(self):
+        """
+        Fila de encabezados del contexto.
+
+        :return: Texto con los campos separados por " | "
+        """
+        return " | ".join(self.fields)
+
+    @staticmethod
+    def _dedup_key(values):
+        """
+        Clave de deduplicación: valores normalizados (los teléfonos solo por dígitos).
+
+        :param values: Lista de valores de la fila
+        :return: Tupla normalizada
+        """
+        return tuple(
+            re.sub(r"\D", "", value) if re.fullmatch(r"[\d\s()+\-./]+", value) else _fold_key(value)
+            for value in values
+        )
+
+    def build(self, documents):
+        """
+        Construye el contexto compacto y reporta el ahorro de tokens.
+
+        :param documents: Lista de Document a incluir (en orden de relevancia)
+        :return: Tupla (contexto, estadísticas) con tokens antes/después y filas descartadas
+        """
+        original = "\n\n".join(doc.page_content for doc in documents)
+        lines = [self.header()]
+        seen = set()
+        duplicates = 0
+        for doc in documents:
+            # Un chunk sin columnas reconocibles conserva su texto original (clave None)
+            line, key = self.row(doc)
+            if key is not None:
+                if key in seen:
+                    duplicates += 1
+                    continue
+                seen.add(key)
+            lines.append(line)
+        context = "\n".join(lines)
+        stats = {
+            "documents": len(documents),
+            "rows": len(lines) - 1,
+            "duplicates": duplicates,
+            "tokens_before": estimate_tokens(original),
+            "tokens_after": estimate_tokens(context),
+        }
+        return context, stats
+
+    def render(self, documents):
+        """
+        Arma la respuesta final sin LLM, con el mismo formato de viñetas que pide el prompt.
+
+        Se usa como alternativa degradada cuando no alcanza el presupuesto de latencia.
+
+        :param documents: Lista de Document (en orden de relevancia)
+        :return: Texto en markdown o mensaje de sin resultados
+        """
+        blocks = []
+        seen = set()
+        for doc in documents:
+            values = self._row_values(doc)
+            if values is None:
+                continue
+            key = self._dedup_key(values)
+            if key in seen:
+                continue
+            seen.add(key)
+            blocks.append("\n".join(
+                f"• **{field}:** {value}  " for field, value in zip(self.fields, values)
+            ))
+        if not blocks:
+            return "No se encontraron resultados para esta búsqueda."
+        return "\n\n".join(blocks)
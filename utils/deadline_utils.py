@@ -0,0 +1,96 @@
+"""
+Presupuestos de latencia por solicitud.
+
+El orquestador abre un `deadline_scope` con el presupuesto total; el plazo se
+propaga implícitamente (contextvars) a las etapas y a los clientes de red, que
+ajustan sus timeouts al tiempo restante con `timeout_for`.
+"""
+import time
+import contextvars
+from contextlib import contextmanager
+
+_current_deadline = contextvars.ContextVar("deadline", default=None)
+
+class Deadline:
+    """
+    Plazo absoluto de una solicitud.
+
+    :param budget_seconds: Presupuesto total en segundos
+    """
+    def __init__(self, budget_seconds):
+        self.budget_seconds = budget_seconds
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + budget_seconds
+
+    def remaining(self):
+        """
+        Segundos restantes (0 si ya venció).
+
+        :return: Flotante
+        """
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    def expired(self):
+        return self.remaining() <= 0
+
+@contextmanager
+def deadline_scope(budget_seconds):
+    """
+    Establece el plazo de la solicitud actual. Si ya hay uno más estricto, se conserva.
+
+    :param budget_seconds: Presupuesto en segundos (None desactiva el plazo)
+    :return: Context manager que entrega el Deadline activo (o None)
+    """
+    outer = _current_deadline.get()
+    deadline = outer
+    if budget_seconds is not None:
+        candidate = Deadline(budget_seconds)
+        if outer is None or candidate.expires_at < outer.expires_at:
+            deadline = candidate
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+def current_deadline():
+    """
+    Devuelve el plazo activo en el contexto actual.
+
+    :return: Instancia de Deadline o None
+    """
+    return _current_deadline.get()
+
+def remaining_seconds():
+    """
+    Segundos restantes del plazo activo.
+
+    :return: Flotante o None si no hay plazo
+    """
+    deadline = _current_deadline.get()
+    return deadline.remaining() if deadline is not None else None
+
+def deadline_expired():
+    """
+    Indica si el plazo activo ya venció.
+
+    :return: True si hay plazo y no queda tiempo
+    """
+    deadline = _current_deadline.get()
+    return deadline is not None and deadline.expired()
+
+def timeout_for(default_seconds, floor_seconds=1.0):
+    """
+    Timeout para una llamada de red acotado por el plazo activo.
+
+    :param default_seconds: Timeout habitual de la llamada
+    :param floor_seconds: Mínimo para no enviar timeouts nulos
+    :return: Segundos
+    """
+    remaining = remaining_seconds()
+    if remaining is None:
+        return default_seconds
+    return max(floor_seconds, min(default_seconds, remaining))
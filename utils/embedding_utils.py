@@ -0,0 +1,306 @@
+"""
+Utilidades para generar embeddings por lotes durante la construcción del índice.
+
+Permite embeber lotes en paralelo, respetar los límites de tasa del proveedor
+(token bucket) y guardar en disco los lotes completados para reanudar una
+construcción interrumpida.
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .text_utils import estimate_tokens
+from .usage_utils import model_call
+
+class TokenBucket:
+    """
+    Limitador de tasa tipo token bucket, seguro para múltiples hilos.
+
+    :param rate_per_minute: Capacidad que se repone por minuto
+    :param capacity: Capacidad máxima acumulable (por defecto igual a la tasa)
+    """
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = float(capacity or rate_per_minute)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate_per_second)
+        self._last = now
+
+    def acquire(self, amount=1):
+        """
+        Bloquea hasta que haya capacidad suficiente y la consume.
+
+        :param amount: Cantidad a consumir (se recorta a la capacidad máxima)
+        :return: Segundos esperados
+        """
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                missing = amount - self._tokens
+                delay = missing / self.rate_per_second
+            time.sleep(delay)
+            waited += delay
+
+class EmbeddingCheckpoint:
+    """
+    Persiste en disco los lotes de embeddings completados.
+
+    Cada lote se guarda en un archivo propio junto con una huella de sus textos,
+    de modo que un lote solo se reutiliza si el contenido no cambió.
+
+    :param directory: Directorio donde se guardan los lotes
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def fingerprint(texts, model):
+        """
+        Calcula la huella de un lote de textos para un modelo dado.
+
+        :param texts: Lista de textos del lote
+        :param model: Identificador del modelo de embeddings
+        :return: Hash sha256 en hexadecimal
+        """
+        digest = hashlib.sha256(str(model).encode("utf-8"))
+        for text in texts:
+            digest.update(b"\x1f")
+            digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, batch_index):
+        return os.path.join(self.directory, f"batch_{batch_index:05d}.json")
+
+    def load(self, batch_index, fingerprint):
+        """
+        Recupera los vectores de un lote si existe y su huella coincide.
+
+        :param batch_index: Índice del lote
+        :param fingerprint: Huella esperada del lote
+        :return: Lista de vectores o None si no hay checkpoint válido
+        """
+        path = self._path(batch_index)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("fingerprint") != fingerprint:
+            return None
+        return data.get("vectors")
+
+    def save(self, batch_index, fingerprint, vectors):
+        """
+        Guarda de forma atómica los vectores de un lote.
+
+        :param batch_index: Índice del lote
+        :param fingerprint: Huella del lote
+        :param vectors: Lista de vectores calculados
+        :return: None
+        """
+        path = self._path(batch_index)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": fingerprint, "vectors": vectors}, f)
+        os.replace(tmp_path, path)
+
+    def clear(self):
+        """
+        Elimina todos los lotes guardados.
+
+        :return: None
+        """
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.startswith("batch_"):
+                os.remove(os.path.join(self.directory, name))
+        try:
+            os.rmdir(self.directory)
+        except OSError:
+            pass
+
+# Estados HTTP transitorios: timeout, conflicto y límite de tasa (además de los 5xx)
+_RETRYABLE_STATUS = {408, 409, 429}
+# Excepciones de red de openai/httpx/requests, reconocidas por nombre para no depender de esos paquetes
+_NETWORK_ERROR_NAMES = {
+    "APITimeoutError", "APIConnectionError", "TimeoutException", "NetworkError", "RemoteProtocolError",
+    "Timeout", "ReadTimeout", "ConnectTimeout", "ConnectionError",
+}
+
+def _status_code(error):
+    """
+    Obtiene el estado HTTP de una excepción, si lo tiene.
+
+    :param error: Excepción capturada
+    :return: Código de estado o None
+    """
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+def _is_rate_limit_error(error):
+    """
+    Indica si una excepción corresponde a un límite de tasa (HTTP 429).
+
+    :param error: Excepción capturada
+    :return: True si es un error de límite de tasa
+    """
+    status = _status_code(error)
+    if status is not None:
+        return status == 429
+    text = str(error).lower()
+    return "429" in text or "rate limit" in text
+
+def _is_retryable_error(error):
+    """
+    Indica si vale la pena reintentar un lote: límite de tasa, timeout, error de
+    red o 5xx. Los errores de la solicitud (400, 401, 404...) fallan de inmediato.
+
+    :param error: Excepción capturada
+    :return: True si el error es transitorio
+    """
+    status = _status_code(error)
+    if status is not None:
+        return status in _RETRYABLE_STATUS or status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if any(cls.__name__ in _NETWORK_ERROR_NAMES for cls in type(error).__mro__):
+        return True
+    return _is_rate_limit_error(error)
+
+def _retry_after_seconds(error):
+    """
+    Obtiene el valor de la cabecera Retry-After de una excepción HTTP, si existe.
+
+    :param error: Excepción capturada
+    :return: Segundos a esperar o None
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+class ConcurrentEmbeddingBuilder:
+    """
+    Genera embeddings por lotes en paralelo, con límite de tasa y checkpoints.
+
+    :param embeddings: Objeto con método embed_documents(textos) (p. ej. OpenAIEmbeddings)
+    :param model_name: Identificador del modelo (forma parte de la huella de cada lote)
+    :param batch_size: Cantidad de textos por lote
+    :param max_concurrency: Cantidad máxima de lotes en vuelo simultáneamente
+    :param requests_per_minute: Límite de solicitudes por minuto del proveedor
+    :param tokens_per_minute: Límite de tokens por minuto del proveedor
+    :param checkpoint_dir: Directorio de checkpoints (opcional; sin él no se reanuda)
+    :param max_retries: Reintentos por lote ante errores transitorios (429, timeouts, red, 5xx)
+    """
+    def __init__(self, embeddings, model_name, batch_size, max_concurrency,
+                 requests_per_minute, tokens_per_minute,
+                 checkpoint_dir=None, max_retries=5):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.batch_size = max(1, int(batch_size))
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.checkpoint = EmbeddingCheckpoint(checkpoint_dir) if checkpoint_dir else None
+        self.max_retries = max_retries
+
+    def _embed_batch(self, batch_index, texts):
+        """
+        Embebe un lote respetando los límites de tasa y reintentando ante fallos
+        transitorios (ver _is_retryable_error).
+
+        :param batch_index: Índice del lote
+        :param texts: Textos del lote
+        :return: Lista de vectores del lote
+        """
+        fingerprint = EmbeddingCheckpoint.fingerprint(texts, self.model_name)
+        if self.checkpoint is not None:
+            cached = self.checkpoint.load(batch_index, fingerprint)
+            if cached is not None and len(cached) == len(texts):
+                return cached
+
+        tokens = sum(estimate_tokens(text) for text in texts)
+        attempt = 0
+        while True:
+            self.request_bucket.acquire(1)
+            self.token_bucket.acquire(tokens)
+            try:
+                with model_call("embedding", self.model_name) as usage:
+                    usage.update(prompt_tokens=tokens, estimated=True)
+                    vectors = self.embeddings.embed_documents(texts)
+                break
+            except Exception as e:
+                if not _is_retryable_error(e):
+                    raise Exception(f"Error embebiendo lote {batch_index}: {str(e)}")
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise Exception(f"Error embebiendo lote {batch_index} tras {self.max_retries} reintentos: {str(e)}")
+                delay = _retry_after_seconds(e)
+                if delay is None:
+                    base = 2.0 if _is_rate_limit_error(e) else 0.5
+                    delay = base * (2 ** (attempt - 1)) + random.uniform(0, 0.5)
+                print(f"Lote {batch_index}: reintento {attempt}/{self.max_retries} en {delay:.1f}s ({e})")
+                time.sleep(delay)
+
+        vectors = [list(map(float, vector)) for vector in vectors]
+        if self.checkpoint is not None:
+            self.checkpoint.save(batch_index, fingerprint, vectors)
+        return vectors
+
+    def embed_documents(self, texts):
+        """
+        Calcula los embeddings de todos los textos, preservando el orden.
+
+        Si algún lote falla definitivamente se propaga la excepción; los lotes ya
+        completados quedan en el checkpoint y no se vuelven a pedir al reanudar.
+
+        :param texts: Lista de textos a embeber
+        :return: Lista de vectores (uno por texto)
+        """
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        results = [None] * len(batches)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            futures = {
+                executor.submit(self._embed_batch, index, batch): index
+                for index, batch in enumerate(batches)
+            }
+            for completed, future in enumerate(as_completed(futures), start=1):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception:
+                    # Cancelar lotes pendientes; los que están en vuelo terminan y quedan en checkpoint
+                    for pending in futures:
+                        pending.cancel()
+                    raise
+                print(f"Embeddings: {completed}/{len(batches)} lotes completados")
+        return [vector for batch in results for vector in batch]
+
+    def clear_checkpoint(self):
+        """
+        Elimina los checkpoints una vez que el índice quedó construido.
+
+        :return: None
+        """
+        if self.checkpoint is not None:
+            self.checkpoint.clear()
@@ -0,0 +1,176 @@
+"""
+Índice espacial de prestadores para búsquedas de los k más cercanos.
+
+Las coordenadas provienen de una tabla de geocodificación fuera de línea
+(CSV con columnas row_index, lat, lon) que se precalcula una sola vez y se
+copia en cada snapshot del índice, junto con un gazetteer opcional de
+localidades (CSV con columnas localidad, lat, lon) para ubicar localidades
+sin prestadores geocodificados. La búsqueda usa un KD-tree sobre una
+proyección equirectangular en kilómetros, suficiente para distancias urbanas
+y provinciales.
+"""
+import csv
+import math
+import heapq
+
+EARTH_RADIUS_KM = 6371.0
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Distancia de círculo máximo entre dos puntos.
+
+    :return: Distancia en kilómetros
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def load_locality_coordinates(path, normalize):
+    """
+    Carga el gazetteer de coordenadas de localidades.
+
+    :param path: Ruta del CSV con columnas localidad, lat, lon
+    :param normalize: Función que normaliza el nombre de la localidad
+    :return: Diccionario localidad normalizada -> (lat, lon)
+    """
+    coordinates = {}
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            try:
+                coordinates[normalize(row["localidad"])] = (float(row["lat"]), float(row["lon"]))
+            except KeyError as e:
+                raise ValueError(f"Gazetteer de localidades inválido, falta la columna {e}")
+    return coordinates
+
+class _KDNode:
+    __slots__ = ("point", "index", "axis", "left", "right")
+
+    def __init__(self, point, index, axis, left, right):
+        self.point = point
+        self.index = index
+        self.axis = axis
+        self.left = left
+        self.right = right
+
+def _build_kdtree(items, depth=0):
+    """
+    Construye recursivamente un KD-tree 2D.
+
+    :param items: Lista de tuplas ((x, y), índice)
+    :param depth: Profundidad actual
+    :return: Nodo raíz o None
+    """
+    if not items:
+        return None
+    axis = depth % 2
+    items.sort(key=lambda item: item[0][axis])
+    median = len(items) // 2
+    point, index = items[median]
+    return _KDNode(
+        point, index, axis,
+        _build_kdtree(items[:median], depth + 1),
+        _build_kdtree(items[median + 1:], depth + 1)
+    )
+
+class ProviderSpatialIndex:
+    """
+    Índice espacial (KD-tree) sobre prestadores geocodificados.
+
+    :param points: Lista de diccionarios con claves row_index, lat y lon
+    """
+    def __init__(self, points):
+        self.points = [
+            {"row_index": int(p["row_index"]), "lat": float(p["lat"]), "lon": float(p["lon"])}
+            for p in points
+        ]
+        self._by_row = {p["row_index"]: p for p in self.points}
+        lat0 = sum(p["lat"] for p in self.points) / len(self.points) if self.points else 0.0
+        self._cos_lat0 = math.cos(math.radians(lat0))
+        self._root = _build_kdtree([
+            (self._project(p["lat"], p["lon"]), i) for i, p in enumerate(self.points)
+        ])
+
+    def _project(self, lat, lon):
+        """
+        Proyecta coordenadas geográficas a un plano en kilómetros.
+
+        :return: Tupla (x, y)
+        """
+        return (
+            math.radians(lon) * self._cos_lat0 * EARTH_RADIUS_KM,
+            math.radians(lat) * EARTH_RADIUS_KM
+        )
+
+    @classmethod
+    def from_csv(cls, path):
+        """
+        Carga la tabla de geocodificación fuera de línea.
+
+        :param path: Ruta del CSV con columnas row_index, lat, lon
+        :return: Instancia de ProviderSpatialIndex
+        """
+        points = []
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                try:
+                    points.append({"row_index": row["row_index"], "lat": row["lat"], "lon": row["lon"]})
+                except KeyError as e:
+                    raise ValueError(f"Tabla de geocodificación inválida, falta la columna {e}")
+        return cls(points)
+
+    def __len__(self):
+        return len(self.points)
+
+    def nearest(self, lat, lon, k=10):
+        """
+        Devuelve los k prestadores más cercanos a un punto.
+
+        :param lat: Latitud del punto de referencia
+        :param lon: Longitud del punto de referencia
+        :param k: Cantidad de vecinos a devolver
+        :return: Lista de tuplas (row_index, distancia_km) ordenada por distancia
+        """
+        if self._root is None or k <= 0:
+            return []
+        target = self._project(lat, lon)
+        heap = []  # max-heap por distancia al cuadrado: (-d2, índice)
+
+        def visit(node):
+            if node is None:
+                return
+            dx = node.point[0] - target[0]
+            dy = node.point[1] - target[1]
+            d2 = dx * dx + dy * dy
+            if len(heap) < k:
+                heapq.heappush(heap, (-d2, node.index))
+            elif d2 < -heap[0][0]:
+                heapq.heapreplace(heap, (-d2, node.index))
+            diff = target[node.axis] - node.point[node.axis]
+            near, far = (node.left, node.right) if diff < 0 else (node.right, node.left)
+            visit(near)
+            if len(heap) < k or diff * diff < -heap[0][0]:
+                visit(far)
+
+        visit(self._root)
+        results = []
+        for _, index in sorted(heap, key=lambda item: -item[0]):
+            point = self.points[index]
+            results.append((point["row_index"], haversine_km(lat, lon, point["lat"], point["lon"])))
+        return results
+
+    def centroid(self, row_indices):
+        """
+        Calcula el centroide de un conjunto de prestadores geocodificados.
+
+        :param row_indices: Filas del dataset (p. ej. las de una localidad)
+        :return: Tupla (lat, lon) o None si ninguna fila está geocodificada
+        """
+        located = [self._by_row[row] for row in row_indices if row in self._by_row]
+        if not located:
+            return None
+        return (
+            sum(p["lat"] for p in located) / len(located),
+            sum(p["lon"] for p in located) / len(located)
+        )
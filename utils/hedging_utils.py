@@ -0,0 +1,235 @@
+"""
+Solicitudes con cobertura (hedging) para recortar la latencia de cola.
+
+Si una llamada remota no respondió dentro de su percentil observado (p95 por
+defecto), se lanza un duplicado al mismo backend o a uno alternativo, se usa la
+primera respuesta exitosa y se cancela la otra. La proporción de duplicados
+está acotada por `HEDGE_MAX_RATIO` y las métricas se exponen con `hedging_stats`.
+"""
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .metrics_utils import get_metrics_registry
+
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "true").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", "0.1"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WINDOW = 200
+HEDGE_WORKERS = 32
+
+# Hilos para las llamadas sincrónicas cubiertas (la original y su duplicado)
+_hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+
+class LatencyTracker:
+    """
+    Ventana deslizante de latencias exitosas para estimar percentiles.
+
+    :param window: Cantidad de muestras recientes que se conservan
+    """
+    def __init__(self, window=HEDGE_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q):
+        """
+        Percentil de las muestras actuales.
+
+        :param q: Percentil entre 0 y 1 (p. ej. 0.95)
+        :return: Segundos o None si no hay muestras
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(q * len(samples)))
+        return samples[index]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._samples)
+
+class Hedger:
+    """
+    Aplica hedging a las llamadas de un backend remoto.
+
+    :param name: Nombre del backend (aparece en las métricas)
+    :param percentile: Percentil de latencia a partir del cual se lanza el duplicado
+    :param max_hedge_ratio: Proporción máxima de llamadas duplicadas
+    :param min_samples: Muestras necesarias antes de empezar a duplicar
+    :param enabled: False ejecuta las llamadas sin duplicar (solo mide)
+    """
+    def __init__(self, name, percentile=HEDGE_PERCENTILE, max_hedge_ratio=HEDGE_MAX_RATIO,
+                 min_samples=HEDGE_MIN_SAMPLES, enabled=HEDGING_ENABLED):
+        self.name = name
+        self.percentile = percentile
+        self.max_hedge_ratio = max_hedge_ratio
+        self.min_samples = min_samples
+        self.enabled = enabled
+        self.latencies = LatencyTracker()
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "hedged": 0, "capped": 0, "hedge_wins": 0, "primary_wins": 0, "errors": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def hedge_delay(self):
+        """
+        Espera antes de lanzar el duplicado (percentil observado).
+
+        :return: Segundos o None si el hedging no aplica todavía
+        """
+        if not self.enabled or len(self.latencies) < self.min_samples:
+            return None
+        return self.latencies.percentile(self.percentile)
+
+    def _allow_hedge(self):
+        with self._lock:
+            if self._counters["hedged"] + 1 > self.max_hedge_ratio * self._counters["calls"]:
+                self._counters["capped"] += 1
+                return False
+            self._counters["hedged"] += 1
+            return True
+
+    def _timed(self, fn):
+        start = time.perf_counter()
+        result = fn()
+        self.latencies.record(time.perf_counter() - start)
+        return result
+
+    async def _atimed(self, coro_fn):
+        start = time.perf_counter()
+        result = await coro_fn()
+        self.latencies.record(time.perf_counter() - start)
+        return result
+
+    def _submit(self, fn):
+        # Cada hilo recibe su propia copia del contexto (p. ej. el plazo de la solicitud)
+        return _hedge_executor.submit(contextvars.copy_context().run, self._timed, fn)
+
+    def _settle(self, winner, primary):
+        self._count("primary_wins" if winner is primary else "hedge_wins")
+
+    def call(self, primary, alternate=None):
+        """
+        Ejecuta una llamada sincrónica con hedging.
+
+        El perdedor se cancela si todavía no empezó; si ya está en curso termina en
+        segundo plano (acotado por su timeout) y su resultado se descarta.
+
+        :param primary: Función sin argumentos que hace la llamada
+        :param alternate: Función para el duplicado (por defecto, la misma llamada)
+        :return: Resultado de la primera llamada exitosa
+        """
+        self._count("calls")
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._timed(primary)
+        first = self._submit(primary)
+        done, _ = wait([first], timeout=delay)
+        if done or not self._allow_hedge():
+            return first.result()
+        second = self._submit(alternate or primary)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                    self._settle(future, first)
+                    return future.result()
+                error = future.exception()
+        self._count("errors")
+        raise error
+
+    async def acall(self, primary, alternate=None):
+        """
+        Ejecuta una llamada asíncrona con hedging; el perdedor se cancela.
+
+        :param primary: Función sin argumentos que devuelve la corrutina de la llamada
+        :param alternate: Función para el duplicado (por defecto, la misma llamada)
+        :return: Resultado de la primera llamada exitosa
+        """
+        self._count("calls")
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self._atimed(primary)
+        first = asyncio.ensure_future(self._atimed(primary))
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done or not self._allow_hedge():
+                return await first
+            pending.add(asyncio.ensure_future(self._atimed(alternate or primary)))
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._settle(task, first)
+                        return task.result()
+                    error = task.exception()
+            self._count("errors")
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        """
+        Métricas del backend.
+
+        :return: Diccionario con contadores, tasa de hedging y percentil actual
+        """
+        with self._lock:
+            counters = dict(self._counters)
+        counters["hedge_rate"] = round(counters["hedged"] / counters["calls"], 4) if counters["calls"] else 0.0
+        counters["samples"] = len(self.latencies)
+        counters["hedge_delay_seconds"] = self.hedge_delay()
+        return counters
+
+_hedgers = {}
+_hedgers_lock = threading.Lock()
+
+def get_hedger(name):
+    """
+    Devuelve el Hedger compartido de un backend (lo crea la primera vez).
+
+    :param name: Nombre del backend (p. ej. "hf_endpoint", "openai_chat")
+    :return: Instancia de Hedger
+    """
+    with _hedgers_lock:
+        if name not in _hedgers:
+            _hedgers[name] = Hedger(name)
+        return _hedgers[name]
+
+def hedging_stats():
+    """
+    Métricas de hedging de todos los backends.
+
+    :return: Diccionario nombre -> métricas
+    """
+    with _hedgers_lock:
+        hedgers = list(_hedgers.values())
+    return {hedger.name: hedger.stats() for hedger in hedgers}
+
+def _hedging_samples():
+    samples = []
+    for name, stats in hedging_stats().items():
+        for key in ("calls", "hedged", "capped", "hedge_wins", "primary_wins"):
+            samples.append((f"hedging_{key}_total", {"backend": name}, stats[key], "counter"))
+        samples.append(("hedging_hedge_rate", {"backend": name}, stats["hedge_rate"], "gauge"))
+    return samples
+
+get_metrics_registry().register_collector(_hedging_samples)
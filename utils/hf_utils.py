@@ -1,9 +1,35 @@
 import os
+import copy
+import json
+import queue
+import asyncio
+import threading
+import weakref
 import importlib
+import contextvars
 import requests
 import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from .deadline_utils import timeout_for, current_deadline
+from .hedging_utils import get_hedger
+from .metrics_utils import span
+from .text_utils import estimate_tokens
+from .usage_utils import model_call
+from .memory_utils import profile_memory
+from . import model_client
+
+MODEL_ID = "somosnlp/Sam_Diagnostic"
+# Espera máxima entre fragmentos del streaming local (acotada además por el plazo de la solicitud)
+STREAM_FRAGMENT_TIMEOUT_SECONDS = float(os.getenv("HF_STREAM_FRAGMENT_TIMEOUT_SECONDS", "120"))
+
+# Cliente httpx del endpoint por event loop: reutiliza las conexiones (TLS) entre llamadas
+_async_clients = weakref.WeakKeyDictionary()
+
+# Protege el cambio temporal de padding_side del tokenizador compartido (generación por lotes)
+_tokenizer_lock = threading.Lock()
 
 @st.cache_resource
+@profile_memory("load.sam_diagnostic")
 def load_model():
     """
     Carga y prepara el modelo y tokenizer de Hugging Face para generación local.
@@ -33,7 +59,7 @@ def load_model():
                         return True
             return False
 
-    model_id = "somosnlp/Sam_Diagnostic"
+    model_id = MODEL_ID
     
     tokenizer = AutoTokenizer.from_pretrained(model_id, max_length = 2048)
     stopping_criteria = ListOfTokensStoppingCriteria(tokenizer, ["<end_of_turn>"])
@@ -64,16 +90,29 @@ def _remote_mode_enabled():
     return os.getenv("HF_ENDPOINT_URL")
 
 
-# Cargar el modelo solo si NO estamos en modo remoto 
-# Esto evita descargas innecesarias
-if _remote_mode_enabled():
-    tokenizer = None
-    model = None
-    generation_config = None
-    stopping_criteria = None
-    stopping_criteria_list = None
-else:
-    tokenizer, model, generation_config, stopping_criteria, stopping_criteria_list = load_model()
+def _generation_mode():
+    """
+    Dónde se ejecuta la generación: endpoint remoto, servidor de modelos compartido o proceso actual.
+
+    :return: "remote", "shared" o "local"
+    """
+    if _remote_mode_enabled():
+        return "remote"
+    return "shared" if model_client.enabled() else "local"
+
+
+def preload_model():
+    """
+    Carga el modelo local por adelantado (solo si NO estamos en modo remoto
+    ni se usa el servidor de modelos compartido).
+
+    La carga es diferida para que herramientas como la construcción del índice
+    puedan importar `utils` sin descargar ni cargar el modelo.
+
+    :return: None
+    """
+    if _generation_mode() == "local":
+        load_model()
 
 def cut_model_response(response_text):
     """
@@ -86,18 +125,19 @@ def cut_model_response(response_text):
     final = response_text.find("<end_of_turn>")
     return response_text[:final]
 
-def generate_with_hf_endpoint(input_text):
+def _endpoint_request(input_text, url=None):
     """
-    Llama a un Endpoint de Hugging Face Inference para generar texto.
+    Arma la solicitud al Endpoint de Hugging Face Inference.
 
     Requiere variables de entorno:
     - HF_ENDPOINT_URL: URL del endpoint de HF
     - HF_TOKEN: Token de acceso a HF
 
     :param input_text: Prompt ya formateado que se enviará al endpoint
-    :return: Texto generado por el endpoint
+    :param url: URL alternativa (por defecto HF_ENDPOINT_URL)
+    :return: Tupla (url, headers, payload)
     """
-    url = os.getenv("HF_ENDPOINT_URL")
+    url = url or os.getenv("HF_ENDPOINT_URL")
     token = os.getenv("HF_TOKEN")
     if not url:
         raise RuntimeError("HF_ENDPOINT_URL no está definido en el entorno.")
@@ -113,6 +153,7 @@ def generate_with_hf_endpoint(input_text):
         "do_sample": True,
         "return_full_text": True,
         "stop": ["<end_of_turn>"], # Reemplazo del stopping_criteria_list local
+        "details": True, # Incluye generated_tokens para el registro de uso
     }
 
     headers = {
@@ -124,11 +165,15 @@ def generate_with_hf_endpoint(input_text):
         "inputs": input_text,
         "parameters": params,
     }
+    return url, headers, payload
 
-    resp = requests.post(url, headers=headers, json=payload, timeout=120)
-    resp.raise_for_status()
-    data = resp.json()
+def _parse_endpoint_response(data):
+    """
+    Extrae el texto generado de la respuesta del endpoint.
 
+    :param data: JSON devuelto por el endpoint
+    :return: Texto generado
+    """
     # TGI/Endpoints suelen devolver una lista con generated_text
     generated = None
     if isinstance(data, list) and data:
@@ -142,17 +187,113 @@ def generate_with_hf_endpoint(input_text):
 
     return generated
 
-def generate_with_hugging_face(prompt, input_lang_code, output_lang_code):
+def _endpoint_usage(data, input_text, usage):
     """
-    Genera una respuesta con el modelo de HF local o remoto según configuración.
+    Completa el registro de uso con los tokens de una respuesta del endpoint.
 
-    :param prompt: Contenido a insertar en el prompt de sistema/usuario
+    TGI informa los tokens generados (details.generated_tokens); los de entrada
+    se estiman localmente.
+
+    :param data: JSON devuelto por el endpoint
+    :param input_text: Prompt enviado
+    :param usage: Diccionario de model_call
+    :return: None
+    """
+    item = data[0] if isinstance(data, list) and data else data if isinstance(data, dict) else {}
+    generated_tokens = (item.get("details") or {}).get("generated_tokens")
+    usage["prompt_tokens"] = estimate_tokens(input_text)
+    usage["estimated"] = True
+    if generated_tokens is not None:
+        usage["completion_tokens"] = generated_tokens
+    else:
+        generated = item.get("generated_text") or ""
+        usage["completion_tokens"] = estimate_tokens(generated[len(input_text):] if generated.startswith(input_text) else generated)
+
+def _post_endpoint(input_text, url=None):
+    url, headers, payload = _endpoint_request(input_text, url)
+    with model_call("hf_endpoint", MODEL_ID) as usage:
+        resp = requests.post(url, headers=headers, json=payload, timeout=timeout_for(120))
+        resp.raise_for_status()
+        data = resp.json()
+        _endpoint_usage(data, input_text, usage)
+    return _parse_endpoint_response(data)
+
+def _async_client():
+    """
+    Devuelve el httpx.AsyncClient compartido del event loop actual.
+
+    Un AsyncClient solo puede usarse desde el loop en el que abrió sus
+    conexiones; se descarta junto con el loop.
+
+    :return: Instancia de httpx.AsyncClient
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        httpx = importlib.import_module("httpx")
+        client = httpx.AsyncClient(timeout=120)
+        _async_clients[loop] = client
+    return client
+
+async def aclose_endpoint_client():
+    """
+    Cierra el cliente del endpoint del event loop actual (p. ej. antes de cerrar el loop).
+
+    :return: None
+    """
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+async def _apost_endpoint(input_text, url=None):
+    url, headers, payload = _endpoint_request(input_text, url)
+    with model_call("hf_endpoint", MODEL_ID) as usage:
+        resp = await _async_client().post(url, headers=headers, json=payload, timeout=timeout_for(120))
+        resp.raise_for_status()
+        data = resp.json()
+        _endpoint_usage(data, input_text, usage)
+    return _parse_endpoint_response(data)
+
+def generate_with_hf_endpoint(input_text):
+    """
+    Llama a un Endpoint de Hugging Face Inference para generar texto.
+
+    Si la respuesta tarda más que el p95 observado se envía un duplicado
+    (a HF_ENDPOINT_URL_FALLBACK si está definido) y se usa la primera respuesta.
+
+    :param input_text: Prompt ya formateado que se enviará al endpoint
+    :return: Texto generado por el endpoint
+    """
+    fallback_url = os.getenv("HF_ENDPOINT_URL_FALLBACK")
+    return get_hedger("hf_endpoint").call(
+        lambda: _post_endpoint(input_text),
+        lambda: _post_endpoint(input_text, fallback_url)
+    )
+
+async def agenerate_with_hf_endpoint(input_text):
+    """
+    Versión asíncrona de generate_with_hf_endpoint (no bloquea el event loop).
+
+    :param input_text: Prompt ya formateado que se enviará al endpoint
+    :return: Texto generado por el endpoint
+    """
+    fallback_url = os.getenv("HF_ENDPOINT_URL_FALLBACK")
+    return await get_hedger("hf_endpoint").acall(
+        lambda: _apost_endpoint(input_text),
+        lambda: _apost_endpoint(input_text, fallback_url)
+    )
+
+def build_prompt(prompt, input_lang_code, output_lang_code):
+    """
+    Arma el prompt con el formato de chat del modelo fine-tuneado.
+
+    :param prompt: Contenido a insertar en el turno del usuario
     :param input_lang_code: Código de idioma de entrada (por ejemplo, "es")
     :param output_lang_code: Código de idioma de salida (por ejemplo, "en")
-    :return: Texto de salida generado por el modelo
+    :return: Prompt formateado
     """
     # Fine-tunning
-    input_text = f'''<bos>
+    return f'''<bos>
     <start_of_turn>system
     You are a helpful AI assistant.
     Responde en formato JSON.
@@ -162,21 +303,367 @@ def generate_with_hugging_face(prompt, input_lang_code, output_lang_code):
     <start_of_turn>user {prompt}<end_of_turn>
     <start_of_turn>model
     '''
-    # Modo remoto (HF Inference Endpoint)
-    response = None
-    if _remote_mode_enabled():
-        response = generate_with_hf_endpoint(input_text)
-    else:
-        # Modo local (transformers)
-        # Tokenizacion
-        inputs = tokenizer.encode(input_text, return_tensors="pt", add_special_tokens=False)
-        # Salidas codificadas
+
+def _with_deadline(stopping_criteria_list, deadline):
+    """
+    Agrega a los criterios de parada uno que corta la generación al vencer el plazo.
+
+    :param stopping_criteria_list: Criterios de parada del modelo
+    :param deadline: Plazo de la solicitud (o None)
+    :return: StoppingCriteriaList
+    """
+    if deadline is None:
+        return stopping_criteria_list
+    transformers = importlib.import_module("transformers")
+
+    class DeadlineStoppingCriteria(transformers.StoppingCriteria):
+        """Detiene la generación cuando vence el plazo de la solicitud."""
+        def __call__(self, input_ids, scores, **kwargs):
+            return deadline.expired()
+
+    return transformers.StoppingCriteriaList(list(stopping_criteria_list) + [DeadlineStoppingCriteria()])
+
+def _with_cancel(stopping_criteria_list, cancelled):
+    """
+    Agrega a los criterios de parada uno que corta la generación al cancelarla.
+
+    :param stopping_criteria_list: Criterios de parada del modelo
+    :param cancelled: threading.Event que se activa cuando el consumidor deja de leer
+    :return: StoppingCriteriaList
+    """
+    transformers = importlib.import_module("transformers")
+
+    class CancelStoppingCriteria(transformers.StoppingCriteria):
+        """Detiene la generación cuando se activa el evento de cancelación."""
+        def __call__(self, input_ids, scores, **kwargs):
+            return cancelled.is_set()
+
+    return transformers.StoppingCriteriaList(list(stopping_criteria_list) + [CancelStoppingCriteria()])
+
+def _generate_locally(input_text):
+    """
+    Genera con el modelo local (transformers). Es CPU/GPU-bound y bloqueante.
+
+    :param input_text: Prompt ya formateado
+    :return: Texto completo generado (incluye el prompt)
+    """
+    tokenizer, model, generation_config, _, stopping_criteria_list = load_model()
+    deadline = current_deadline()
+    # Tokenizacion
+    inputs = tokenizer.encode(input_text, return_tensors="pt", add_special_tokens=False)
+    # Salidas codificadas
+    with model_call("hf_local", MODEL_ID) as usage:
         outputs = model.generate(
             generation_config=generation_config,
             input_ids=inputs,
-            stopping_criteria=stopping_criteria_list,
+            stopping_criteria=_with_deadline(stopping_criteria_list, deadline),
         )
-        # Decodificacion
-        response = tokenizer.decode(outputs[0], skip_special_tokens=False)
+        usage["prompt_tokens"] = inputs.shape[-1]
+        usage["completion_tokens"] = outputs.shape[-1] - inputs.shape[-1]
+    if deadline is not None and deadline.expired():
+        raise TimeoutError("Generación local interrumpida por vencimiento del plazo")
+    # Decodificacion
+    return tokenizer.decode(outputs[0], skip_special_tokens=False)
+
+def _generate_shared(input_text):
+    """
+    Genera con el servidor de modelos compartido (model_server.py).
+
+    :param input_text: Prompt ya formateado
+    :return: Texto completo generado (incluye el prompt)
+    """
+    with model_call("model_server", MODEL_ID) as usage:
+        response = model_client.request("generate", input_text=input_text)
+        usage.update(response["usage"])
+    return response["result"]
+
+def generate_with_hugging_face(prompt, input_lang_code, output_lang_code):
+    """
+    Genera una respuesta con el modelo de HF local o remoto según configuración.
+
+    :param prompt: Contenido a insertar en el prompt de sistema/usuario
+    :param input_lang_code: Código de idioma de entrada (por ejemplo, "es")
+    :param output_lang_code: Código de idioma de salida (por ejemplo, "en")
+    :return: Texto de salida generado por el modelo
+    """
+    input_text = build_prompt(prompt, input_lang_code, output_lang_code)
+    mode = _generation_mode()
+    with span("hf_generate", mode=mode, langs=f"{input_lang_code}->{output_lang_code}"):
+        if mode == "remote":
+            # Modo remoto (HF Inference Endpoint)
+            response = generate_with_hf_endpoint(input_text)
+        elif mode == "shared":
+            # Servidor de modelos compartido entre procesos
+            response = _generate_shared(input_text)
+        else:
+            # Modo local (transformers)
+            response = _generate_locally(input_text)
     # Formateo de respuesta
+    return cut_model_response(response)
+
+def _generate_batch_locally(input_texts):
+    """
+    Genera con el modelo local para varios prompts en una sola llamada a generate.
+
+    Los prompts se rellenan a la izquierda y cada secuencia termina en su propio
+    "<end_of_turn>" (eos de la generación): el criterio de parada por lista de
+    tokens solo mira la primera fila, por eso no se usa aquí.
+
+    :param input_texts: Lista de prompts ya formateados
+    :return: Lista de textos completos generados (incluyen el prompt), en el mismo orden
+    """
+    transformers = importlib.import_module("transformers")
+    tokenizer, model, generation_config, _, _ = load_model()
+    deadline = current_deadline()
+    with _tokenizer_lock:
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        padding_side = tokenizer.padding_side
+        tokenizer.padding_side = "left"
+        try:
+            inputs = tokenizer(input_texts, return_tensors="pt", padding=True, add_special_tokens=False)
+        finally:
+            tokenizer.padding_side = padding_side
+    batch_config = copy.deepcopy(generation_config)
+    batch_config.eos_token_id = [tokenizer.convert_tokens_to_ids("<end_of_turn>"), tokenizer.eos_token_id]
+    batch_config.pad_token_id = tokenizer.pad_token_id
+    with model_call("hf_local", MODEL_ID) as usage:
+        outputs = model.generate(
+            generation_config=batch_config,
+            input_ids=inputs["input_ids"],
+            attention_mask=inputs["attention_mask"],
+            stopping_criteria=_with_deadline(transformers.StoppingCriteriaList(), deadline),
+        )
+        generated = outputs[:, inputs["input_ids"].shape[-1]:]
+        usage["prompt_tokens"] = int(inputs["attention_mask"].sum())
+        usage["completion_tokens"] = int((generated != tokenizer.pad_token_id).sum())
+    if deadline is not None and deadline.expired():
+        raise TimeoutError("Generación local interrumpida por vencimiento del plazo")
+    return [tokenizer.decode(row, skip_special_tokens=False) for row in outputs]
+
+def _generate_batch_shared(input_texts):
+    """
+    Genera un lote con el servidor de modelos compartido (una sola llamada al modelo).
+
+    :param input_texts: Lista de prompts ya formateados
+    :return: Lista de textos completos generados, en el mismo orden
+    """
+    with model_call("model_server", MODEL_ID) as usage:
+        response = model_client.request("generate_batch", input_texts=input_texts)
+        usage.update(response["usage"])
+    return response["result"]
+
+def _generate_batch_with_hf_endpoint(input_texts, max_workers):
+    """
+    Envía varios prompts al endpoint en paralelo (TGI los agrupa en el servidor).
+
+    :param input_texts: Lista de prompts ya formateados
+    :param max_workers: Solicitudes simultáneas al endpoint
+    :return: Lista de textos generados, en el mismo orden
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(input_texts)))) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, generate_with_hf_endpoint, input_text)
+            for input_text in input_texts
+        ]
+        return [future.result() for future in futures]
+
+def generate_batch_with_hugging_face(prompts, input_lang_code, output_lang_code, max_workers=8):
+    """
+    Versión por lotes de generate_with_hugging_face (procesamiento fuera de línea).
+
+    En modo local genera todo el lote en una llamada al modelo; en modo remoto
+    envía los prompts en paralelo al endpoint.
+
+    :param prompts: Lista de contenidos a insertar en el prompt
+    :param input_lang_code: Código de idioma de entrada (por ejemplo, "es")
+    :param output_lang_code: Código de idioma de salida (por ejemplo, "en")
+    :param max_workers: Solicitudes simultáneas en modo remoto
+    :return: Lista de textos de salida, en el mismo orden que prompts
+    """
+    if not prompts:
+        return []
+    input_texts = [build_prompt(prompt, input_lang_code, output_lang_code) for prompt in prompts]
+    mode = _generation_mode()
+    with span("hf_generate_batch", mode=mode, size=len(prompts), langs=f"{input_lang_code}->{output_lang_code}"):
+        if mode == "remote":
+            responses = _generate_batch_with_hf_endpoint(input_texts, max_workers)
+        elif mode == "shared":
+            responses = _generate_batch_shared(input_texts)
+        else:
+            responses = _generate_batch_locally(input_texts)
+    return [cut_model_response(response) for response in responses]
+
+def _stream_locally(input_text):
+    """
+    Genera con el modelo local entregando el texto a medida que se produce.
+
+    :param input_text: Prompt ya formateado
+    :return: Generador de fragmentos de texto (sin el prompt)
+    """
+    transformers = importlib.import_module("transformers")
+    tokenizer, model, generation_config, _, stopping_criteria_list = load_model()
+    deadline = current_deadline()
+    streamer = transformers.TextIteratorStreamer(
+        tokenizer, skip_prompt=True, skip_special_tokens=False,
+        timeout=timeout_for(STREAM_FRAGMENT_TIMEOUT_SECONDS)
+    )
+    inputs = tokenizer.encode(input_text, return_tensors="pt", add_special_tokens=False)
+    errors = []
+    cancelled = threading.Event()
+
+    def run_generation():
+        # Si generate falla, el consumidor no debe quedar esperando fragmentos que no llegarán
+        try:
+            model.generate(
+                generation_config=generation_config,
+                input_ids=inputs,
+                stopping_criteria=_with_cancel(_with_deadline(stopping_criteria_list, deadline), cancelled),
+                streamer=streamer,
+            )
+        except BaseException as e:
+            errors.append(e)
+            streamer.end()
+
+    thread = threading.Thread(target=run_generation, daemon=True)
+    thread.start()
+    try:
+        with model_call("hf_local", MODEL_ID) as usage:
+            usage["prompt_tokens"] = inputs.shape[-1]
+            try:
+                for fragment in streamer:
+                    # Se acumula a medida que se emite: el consumidor puede dejar de leer antes del final
+                    usage["completion_tokens"] += len(tokenizer.encode(fragment, add_special_tokens=False))
+                    yield fragment
+            except queue.Empty:
+                raise TimeoutError("El modelo local no produjo texto a tiempo") from None
+            thread.join()
+            if errors:
+                raise errors[0]
+    finally:
+        # Si el consumidor deja de leer (close) o falla, la generación se detiene en el
+        # siguiente token y se espera al hilo: al volver, el modelo quedó libre
+        cancelled.set()
+        thread.join()
+    if deadline is not None and deadline.expired():
+        raise TimeoutError("Generación local interrumpida por vencimiento del plazo")
+
+def _stream_shared(input_text):
+    """
+    Genera en streaming con el servidor de modelos compartido.
+
+    :param input_text: Prompt ya formateado
+    :return: Generador de fragmentos de texto (sin el prompt)
+    """
+    with model_call("model_server", MODEL_ID) as usage:
+        # Estimación mientras llegan fragmentos; el mensaje final trae los tokens del servidor
+        usage["prompt_tokens"] = estimate_tokens(input_text)
+        usage["estimated"] = True
+        for message in model_client.stream("stream", input_text=input_text):
+            if message.get("done"):
+                usage.update(message["usage"], estimated=False)
+            else:
+                usage["completion_tokens"] += estimate_tokens(message["fragment"])
+                yield message["fragment"]
+
+def _stream_hf_endpoint(input_text):
+    """
+    Genera con el endpoint remoto usando streaming SSE de Text Generation Inference.
+
+    :param input_text: Prompt ya formateado
+    :return: Generador de fragmentos de texto (sin el prompt)
+    """
+    url, headers, payload = _endpoint_request(input_text)
+    payload = dict(payload, stream=True)
+    payload["parameters"] = dict(payload["parameters"], return_full_text=False)
+    with model_call("hf_endpoint", MODEL_ID) as usage, \
+            requests.post(url, headers=headers, json=payload, timeout=timeout_for(120), stream=True) as resp:
+        usage["prompt_tokens"] = estimate_tokens(input_text)
+        usage["estimated"] = True
+        resp.raise_for_status()
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            event = json.loads(line[len("data:"):])
+            token = event.get("token") or {}
+            # Cada evento es un token generado (incluidos los especiales)
+            usage["completion_tokens"] += 1
+            if token.get("special"):
+                continue
+            if token.get("text"):
+                yield token["text"]
+
+def stream_with_hugging_face(prompt, input_lang_code, output_lang_code):
+    """
+    Genera una respuesta en streaming con el modelo de HF local o remoto.
+
+    El generador se detiene al encontrar "<end_of_turn>"; el texto acumulado
+    equivale a la salida de generate_with_hugging_face.
+
+    :param prompt: Contenido a insertar en el prompt de sistema/usuario
+    :param input_lang_code: Código de idioma de entrada (por ejemplo, "es")
+    :param output_lang_code: Código de idioma de salida (por ejemplo, "en")
+    :return: Generador de fragmentos de texto de la respuesta
+    """
+    input_text = build_prompt(prompt, input_lang_code, output_lang_code)
+    mode = _generation_mode()
+    if mode == "remote":
+        fragments = _stream_hf_endpoint(input_text)
+    elif mode == "shared":
+        fragments = _stream_shared(input_text)
+    else:
+        fragments = _stream_locally(input_text)
+    stop = "<end_of_turn>"
+    generated = ""
+    emitted = 0
+    with span("hf_stream", mode=mode, langs=f"{input_lang_code}->{output_lang_code}"):
+        try:
+            for fragment in fragments:
+                generated += fragment
+                end = generated.find(stop)
+                if end >= 0:
+                    if end > emitted:
+                        yield generated[emitted:end]
+                    return
+                # Retener un posible comienzo del marcador de fin partido entre fragmentos
+                safe = len(generated)
+                for size in range(min(len(stop) - 1, len(generated)), 0, -1):
+                    if stop.startswith(generated[-size:]):
+                        safe -= size
+                        break
+                if safe > emitted:
+                    yield generated[emitted:safe]
+                    emitted = safe
+            if len(generated) > emitted:
+                yield generated[emitted:]
+        finally:
+            # Cierra la generación dentro del span (registra su uso aunque se corte en <end_of_turn>)
+            fragments.close()
+
+async def agenerate_with_hugging_face(prompt, input_lang_code, output_lang_code, executor=None):
+    """
+    Versión asíncrona de generate_with_hugging_face.
+
+    En modo remoto usa un cliente HTTP asíncrono; en modo local (o con el
+    servidor de modelos compartido) la generación se delega a un executor para
+    no bloquear el event loop.
+
+    :param prompt: Contenido a insertar en el prompt de sistema/usuario
+    :param input_lang_code: Código de idioma de entrada (por ejemplo, "es")
+    :param output_lang_code: Código de idioma de salida (por ejemplo, "en")
+    :param executor: Executor para la generación local (por defecto el del event loop)
+    :return: Texto de salida generado por el modelo
+    """
+    input_text = build_prompt(prompt, input_lang_code, output_lang_code)
+    mode = _generation_mode()
+    with span("hf_generate", mode=mode, langs=f"{input_lang_code}->{output_lang_code}"):
+        if mode == "remote":
+            response = await agenerate_with_hf_endpoint(input_text)
+        else:
+            loop = asyncio.get_running_loop()
+            # copy_context: el plazo de la solicitud (contextvar) debe llegar al hilo del executor
+            response = await loop.run_in_executor(
+                executor, contextvars.copy_context().run,
+                _generate_shared if mode == "shared" else _generate_locally, input_text
+            )
     return cut_model_response(response)
\ No newline at end of file
@@ -0,0 +1,318 @@
+"""
+Utilidades para snapshots versionados del índice RAG.
+
+Un snapshot es un directorio inmutable con la siguiente estructura:
+
+    <raiz>/<version>/
+    ├── chroma/            # Persistencia de ChromaDB (vectores)
+    ├── specialties.json   # Mapas especialidad/localidad -> filas del dataset
+    ├── dataset.xlsx       # Copia del dataset usado para construir el índice
+    ├── geocoding.csv      # Tabla de geocodificación fuera de línea (opcional)
+    ├── localities.csv     # Coordenadas de localidades (opcional)
+    └── manifest.json      # Metadatos; se escribe al final y marca el snapshot como completo
+
+Las réplicas solo leen snapshots completos; la construcción se hace fuera de línea
+(ver tools/build_index.py).
+"""
+import os
+import json
+import time
+import socket
+import shutil
+import hashlib
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+MANIFEST_FILENAME = "manifest.json"
+SPECIALTIES_FILENAME = "specialties.json"
+DATASET_FILENAME = "dataset.xlsx"
+GEOCODING_FILENAME = "geocoding.csv"
+LOCALITIES_FILENAME = "localities.csv"
+CHROMA_DIRNAME = "chroma"
+BUILDING_PREFIX = ".building-"
+FORMAT_VERSION = 1
+# Lock de construcción: se renueva periódicamente; uno sin renovar se considera abandonado
+BUILD_LOCK_HEARTBEAT_SECONDS = 30
+BUILD_LOCK_STALE_SECONDS = 600
+# Snapshots que se conservan siempre: el vigente y el anterior (réplicas que aún no cambiaron)
+MIN_SNAPSHOTS_TO_KEEP = 2
+
+class BuildInProgress(Exception):
+    pass
+
+def file_fingerprint(path):
+    """
+    Calcula el hash sha256 de un archivo.
+
+    :param path: Ruta del archivo
+    :return: Hash en hexadecimal
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def new_version(fingerprint):
+    """
+    Genera un identificador de versión ordenable cronológicamente.
+
+    :param fingerprint: Hash del dataset (se usan los primeros caracteres)
+    :return: Cadena del tipo "20250101T120000Z-abcdef123456"
+    """
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return f"{timestamp}-{fingerprint[:12]}"
+
+def build_specialty_map(documents):
+    """
+    Construye los mapas especialidad -> filas y localidad -> filas a partir de la metadata.
+
+    :param documents: Lista de Document con metadata "row_index", "especialidad" y "localidad"
+    :return: Diccionario con claves "especialidades" y "localidades"
+    """
+    especialidades = {}
+    localidades = {}
+    for doc in documents:
+        row_index = doc.metadata.get("row_index")
+        especialidad = doc.metadata.get("especialidad")
+        localidad = doc.metadata.get("localidad")
+        if especialidad:
+            rows = especialidades.setdefault(especialidad, [])
+            if row_index not in rows:
+                rows.append(row_index)
+        if localidad:
+            rows = localidades.setdefault(localidad, [])
+            if row_index not in rows:
+                rows.append(row_index)
+    return {"especialidades": especialidades, "localidades": localidades}
+
+def building_directory(root, fingerprint):
+    """
+    Devuelve el directorio temporal de construcción para un dataset.
+
+    Se deriva del hash del dataset para que una construcción interrumpida
+    reutilice sus checkpoints de embeddings al reintentarse.
+
+    :param root: Directorio raíz de snapshots
+    :param fingerprint: Hash del dataset
+    :return: Ruta del directorio temporal
+    """
+    return os.path.join(root, f"{BUILDING_PREFIX}{fingerprint[:12]}")
+
+class BuildLock:
+    """
+    Lock exclusivo de la construcción de un dataset entre procesos y réplicas
+    que comparten el directorio de snapshots (archivo creado con O_EXCL).
+
+    Mientras está tomado, un hilo renueva su fecha de modificación; un lock sin
+    renovar durante BUILD_LOCK_STALE_SECONDS (proceso terminado) se reemplaza.
+
+    :param root: Directorio raíz de snapshots
+    :param fingerprint: Hash del dataset
+    """
+    def __init__(self, root, fingerprint):
+        self.path = f"{building_directory(root, fingerprint)}.lock"
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def _create(self):
+        fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"host": socket.gethostname(), "pid": os.getpid(), "started_at": time.time()}, f)
+
+    def acquire(self):
+        """
+        Toma el lock.
+
+        :return: None
+        :raises BuildInProgress: Si otro proceso está construyendo el mismo dataset
+        """
+        try:
+            self._create()
+        except FileExistsError:
+            try:
+                age = time.time() - os.path.getmtime(self.path)
+            except OSError:
+                age = 0.0
+            if age < BUILD_LOCK_STALE_SECONDS:
+                raise BuildInProgress(f"Otro proceso está construyendo este índice ({self.path})")
+            print(f"Lock de construcción abandonado ({age:.0f}s sin renovar): se reemplaza")
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            try:
+                self._create()
+            except FileExistsError:
+                raise BuildInProgress(f"Otro proceso está construyendo este índice ({self.path})")
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._renew, name="build-lock", daemon=True)
+        self._heartbeat.start()
+
+    def _renew(self):
+        while not self._stop.wait(BUILD_LOCK_HEARTBEAT_SECONDS):
+            try:
+                os.utime(self.path)
+            except OSError:
+                return
+
+    def release(self):
+        self._stop.set()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+        return False
+
+def write_json(path, data):
+    """
+    Escribe un JSON de forma atómica (archivo temporal + reemplazo).
+
+    :param path: Ruta destino
+    :param data: Datos serializables
+    :return: None
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def finalize_snapshot(build_dir, root, version, manifest):
+    """
+    Escribe el manifest y publica el snapshot con un renombrado atómico.
+
+    :param build_dir: Directorio temporal con el snapshot construido
+    :param root: Directorio raíz de snapshots
+    :param version: Versión del snapshot
+    :param manifest: Diccionario de metadatos (se completa con estado y formato)
+    :return: Ruta final del snapshot
+    """
+    manifest = dict(manifest, version=version, status="complete", format_version=FORMAT_VERSION)
+    write_json(os.path.join(build_dir, MANIFEST_FILENAME), manifest)
+    final_dir = os.path.join(root, version)
+    os.rename(build_dir, final_dir)
+    return final_dir
+
+def read_manifest(snapshot_dir):
+    """
+    Lee el manifest de un snapshot.
+
+    :param snapshot_dir: Directorio del snapshot
+    :return: Diccionario del manifest o None si falta o está incompleto
+    """
+    path = os.path.join(snapshot_dir, MANIFEST_FILENAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("status") != "complete":
+        return None
+    return manifest
+
+def list_snapshots(root):
+    """
+    Lista los snapshots completos de un directorio, del más antiguo al más nuevo
+    según el `created_at` del manifest (el nombre del directorio puede ser una
+    versión arbitraria, p. ej. `--version` de tools/build_index.py).
+
+    :param root: Directorio raíz de snapshots
+    :return: Lista de tuplas (ruta, manifest)
+    """
+    if not os.path.isdir(root):
+        return []
+    snapshots = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if name.startswith(".") or not os.path.isdir(path):
+            continue
+        manifest = read_manifest(path)
+        if manifest is not None:
+            snapshots.append((path, manifest))
+    snapshots.sort(key=lambda item: (_created_at(item[1]), os.path.basename(item[0])))
+    return snapshots
+
+def _created_at(manifest):
+    """
+    Instante de creación de un snapshot para ordenarlo.
+
+    :param manifest: Diccionario del manifest
+    :return: Timestamp en segundos (0 si falta o no es válido)
+    """
+    try:
+        return datetime.fromisoformat(manifest["created_at"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return 0.0
+
+def prune_snapshots(root, keep):
+    """
+    Elimina los snapshots completos más antiguos, conservando los últimos `keep`
+    (nunca menos de MIN_SNAPSHOTS_TO_KEEP: otras réplicas pueden seguir usando el
+    anterior hasta su próximo sondeo).
+
+    :param root: Directorio raíz de snapshots
+    :param keep: Cantidad de snapshots a conservar
+    :return: Lista de rutas eliminadas
+    """
+    keep = max(keep, MIN_SNAPSHOTS_TO_KEEP)
+    snapshots = list_snapshots(root)
+    removed = []
+    for path, _ in snapshots[:max(0, len(snapshots) - keep)]:
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(path)
+    return removed
+
+class IndexSnapshot:
+    """
+    Snapshot de índice completo, abierto en modo solo lectura (ver working_copy).
+
+    :param path: Directorio del snapshot
+    :param manifest: Diccionario del manifest ya validado
+    """
+    def __init__(self, path, manifest):
+        self.path = path
+        self.manifest = manifest
+        self.version = manifest["version"]
+        self.chroma_path = os.path.join(path, CHROMA_DIRNAME)
+        self.dataset_path = os.path.join(path, DATASET_FILENAME)
+        geocoding_path = os.path.join(path, GEOCODING_FILENAME)
+        self.geocoding_path = geocoding_path if os.path.exists(geocoding_path) else None
+        localities_path = os.path.join(path, LOCALITIES_FILENAME)
+        self.localities_path = localities_path if os.path.exists(localities_path) else None
+        with open(os.path.join(path, SPECIALTIES_FILENAME), "r", encoding="utf-8") as f:
+            self.specialty_map = json.load(f)
+
+    def working_copy(self):
+        """
+        Copia la persistencia de Chroma a un directorio temporal del proceso.
+
+        Chroma abre su base SQLite en lectura y escritura; trabajar sobre una copia
+        mantiene el snapshot inmutable y permite montarlo en solo lectura.
+
+        :return: Ruta de la copia (el llamador la elimina cuando deja de usarla)
+        """
+        directory = tempfile.mkdtemp(prefix=f"chroma-{self.version}-")
+        copy_path = os.path.join(directory, CHROMA_DIRNAME)
+        shutil.copytree(self.chroma_path, copy_path)
+        return copy_path
+
+def load_latest_snapshot(root):
+    """
+    Abre el snapshot completo más reciente de un directorio.
+
+    :param root: Directorio raíz de snapshots
+    :return: Instancia de IndexSnapshot o None si no hay snapshots completos
+    """
+    snapshots = list_snapshots(root)
+    if not snapshots:
+        return None
+    path, manifest = snapshots[-1]
+    return IndexSnapshot(path, manifest)
@@ -0,0 +1,230 @@
+"""
+Modo de perfilado de memoria (opcional, MEMORY_PROFILING=true).
+
+Registra el RSS del proceso y la memoria rastreada por tracemalloc antes y
+después de cada carga de modelo, de la construcción/apertura del índice y de
+cada etapa del pipeline. El reporte JSON (MEMORY_REPORT_PATH) tiene claves
+estables por etiqueta para compararlo entre versiones con `tools/memory_report.py`.
+
+tracemalloc solo ve asignaciones de Python; los tensores de torch y la memoria
+nativa de Chroma/spaCy aparecen en el RSS.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import platform
+import threading
+import tracemalloc
+from functools import wraps
+from contextlib import contextmanager
+
+MEMORY_PROFILING = os.getenv("MEMORY_PROFILING", "false").lower() in ("1", "true", "yes")
+MEMORY_REPORT_PATH = os.getenv("MEMORY_REPORT_PATH", ".cache/memory/memory_report.json")
+TOP_ALLOCATIONS = 15
+# Las mediciones de etapas reescriben el reporte como máximo cada tantos segundos
+REPORT_INTERVAL_SECONDS = 30
+MB = 1024 * 1024
+
+def rss_bytes():
+    """
+    Memoria residente actual del proceso.
+
+    Lee /proc/self/statm en Linux; en otros sistemas usa el pico de `resource`.
+
+    :return: Bytes (int) o None si no se puede medir
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss está en KB en Linux y en bytes en macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    except Exception:
+        return None
+
+def _to_mb(value):
+    return round(value / MB, 2) if value is not None else None
+
+def _max(current, value):
+    return value if current is None else max(current, value)
+
+class MemoryProfiler:
+    """
+    Acumula mediciones de memoria por etiqueta y escribe el reporte.
+
+    :param report_path: Ruta del reporte JSON
+    """
+    def __init__(self, report_path=MEMORY_REPORT_PATH):
+        self.report_path = report_path
+        self.started_at = time.time()
+        self.checkpoints = []
+        self.labels = {}
+        self.top_allocations = {}
+        self._last_write = time.monotonic()
+        self._lock = threading.Lock()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _sample(self):
+        traced, traced_peak = tracemalloc.get_traced_memory()
+        return {"rss_mb": _to_mb(rss_bytes()), "traced_mb": _to_mb(traced), "traced_peak_mb": _to_mb(traced_peak)}
+
+    @staticmethod
+    def _top_allocations():
+        statistics = tracemalloc.take_snapshot().statistics("filename")[:TOP_ALLOCATIONS]
+        return [
+            {"file": str(stat.traceback[0].filename), "size_mb": _to_mb(stat.size), "blocks": stat.count}
+            for stat in statistics
+        ]
+
+    @contextmanager
+    def measure(self, label, kind="stage"):
+        """
+        Mide la memoria antes y después del bloque.
+
+        Las cargas ("load") y el índice ("index") se guardan como checkpoints
+        individuales con las mayores asignaciones; las etapas ("stage") se
+        agregan por etiqueta (cantidad, delta máximo y medio).
+
+        :param label: Etiqueta estable (p. ej. "load.sam_diagnostic", "stage.extraction")
+        :param kind: "load", "index" o "stage"
+        :return: Context manager
+        """
+        before = self._sample()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            after = self._sample()
+            self._record(label, kind, before, after, time.perf_counter() - start)
+
+    def _record(self, label, kind, before, after, seconds):
+        delta = None
+        if before["rss_mb"] is not None and after["rss_mb"] is not None:
+            delta = round(after["rss_mb"] - before["rss_mb"], 2)
+        with self._lock:
+            summary = self.labels.setdefault(label, {
+                "kind": kind, "count": 0, "rss_delta_mb_total": 0.0, "rss_delta_mb_max": None,
+                "rss_after_mb_last": None, "traced_delta_mb_max": None
+            })
+            summary["count"] += 1
+            if delta is not None:
+                summary["rss_delta_mb_total"] = round(summary["rss_delta_mb_total"] + delta, 2)
+                summary["rss_delta_mb_max"] = _max(summary["rss_delta_mb_max"], delta)
+            summary["rss_after_mb_last"] = after["rss_mb"]
+            traced_delta = round(after["traced_mb"] - before["traced_mb"], 2)
+            summary["traced_delta_mb_max"] = _max(summary["traced_delta_mb_max"], traced_delta)
+            if kind != "stage":
+                self.checkpoints.append({
+                    "label": label, "kind": kind, "seconds": round(seconds, 3),
+                    "before": before, "after": after, "rss_delta_mb": delta,
+                })
+        if kind != "stage":
+            top_allocations = self._top_allocations()
+            with self._lock:
+                self.top_allocations[label] = top_allocations
+            self.write_report()
+        elif time.monotonic() - self._last_write >= REPORT_INTERVAL_SECONDS:
+            self.write_report()
+        print(f"[MEMORIA] {label}: RSS {before['rss_mb']} -> {after['rss_mb']} MB (delta {delta} MB)")
+
+    def report(self):
+        """
+        Reporte serializable: entorno, checkpoints, resumen por etiqueta y mayores asignaciones.
+
+        :return: Diccionario
+        """
+        with self._lock:
+            labels = {label: dict(summary) for label, summary in sorted(self.labels.items())}
+            checkpoints = list(self.checkpoints)
+            top_allocations = dict(self.top_allocations)
+        for summary in labels.values():
+            summary["rss_delta_mb_mean"] = round(summary["rss_delta_mb_total"] / summary["count"], 2)
+        return {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(self.started_at)),
+            "release": os.getenv("APP_RELEASE"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pid": os.getpid(),
+            "current": self._sample(),
+            "labels": labels,
+            "checkpoints": checkpoints,
+            "top_allocations": top_allocations,
+        }
+
+    def write_report(self, path=None):
+        """
+        Escribe el reporte JSON (de forma atómica).
+
+        :param path: Ruta destino (por defecto la del perfilador)
+        :return: Ruta escrita
+        """
+        path = path or self.report_path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        self._last_write = time.monotonic()
+        return path
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+def get_memory_profiler():
+    """
+    Devuelve el perfilador del proceso si MEMORY_PROFILING está activo.
+
+    :return: Instancia de MemoryProfiler o None
+    """
+    global _profiler
+    if not MEMORY_PROFILING:
+        return None
+    if _profiler is None:
+        with _profiler_lock:
+            if _profiler is None:
+                _profiler = MemoryProfiler()
+                atexit.register(_profiler.write_report)
+    return _profiler
+
+@contextmanager
+def memory_checkpoint(label, kind="stage"):
+    """
+    Mide la memoria del bloque si el perfilado está activo (no hace nada si no).
+
+    :param label: Etiqueta estable
+    :param kind: "load", "index" o "stage"
+    :return: Context manager
+    """
+    profiler = get_memory_profiler()
+    if profiler is None:
+        yield
+        return
+    with profiler.measure(label, kind):
+        yield
+
+def profile_memory(label, kind="load"):
+    """
+    Decorador equivalente a memory_checkpoint para funciones de carga.
+
+    :param label: Etiqueta estable
+    :param kind: "load" o "index"
+    :return: Decorador
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with memory_checkpoint(label, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
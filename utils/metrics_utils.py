@@ -0,0 +1,306 @@
+"""
+Trazas por solicitud e histogramas de latencia en el proceso.
+
+`span(nombre)` mide un tramo (una etapa, una llamada a Whisper, al modelo, a
+spaCy, al retriever o a GPT): su duración se acumula en un histograma y, si hay
+una traza activa (`trace_scope`, propagada con contextvars), se agrega a la
+cascada de la solicitud. Las métricas se exportan en formato Prometheus
+(`export_prometheus`) o JSON (`export_json`).
+"""
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+METRICS_PREFIX = "buscador"
+# Límites superiores (segundos) de los buckets de latencia
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+
+class Histogram:
+    """
+    Histograma acumulativo (compatible con el tipo histogram de Prometheus).
+
+    :param buckets: Límites superiores de los buckets, en orden creciente
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, upper in enumerate(self.buckets):
+            if value <= upper:
+                self._counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Conteos acumulados por bucket, incluido +Inf.
+
+        :return: Lista de tuplas (límite como texto, conteo)
+        """
+        total = 0
+        result = []
+        for upper, count in zip(self.buckets, self._counts):
+            total += count
+            result.append((f"{upper:g}", total))
+        result.append(("+Inf", self.count))
+        return result
+
+    def quantile(self, q):
+        """
+        Estimación del percentil a partir de los buckets (límite superior del bucket).
+
+        :param q: Percentil entre 0 y 1
+        :return: Segundos o None si no hay observaciones
+        """
+        if not self.count:
+            return None
+        target = q * self.count
+        total = 0
+        for upper, count in zip(self.buckets, self._counts):
+            total += count
+            if total >= target:
+                return upper
+        return float("inf")
+
+class MetricsRegistry:
+    """
+    Registro de histogramas y contadores con etiquetas, más colectores externos.
+    """
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def observe(self, name, value, **labels):
+        """
+        Registra una observación en el histograma `name` con las etiquetas dadas.
+
+        :param name: Nombre de la métrica (sin prefijo)
+        :param value: Valor observado
+        :param labels: Etiquetas (baja cardinalidad)
+        :return: None
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        """
+        Incrementa el contador `name` con las etiquetas dadas.
+
+        :param name: Nombre de la métrica (sin prefijo)
+        :param amount: Incremento
+        :param labels: Etiquetas (baja cardinalidad)
+        :return: None
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def register_collector(self, collector):
+        """
+        Agrega una función que aporta métricas calculadas al exportar (p. ej. hedging).
+
+        :param collector: Función sin argumentos que devuelve una lista de (nombre, etiquetas, valor)
+            o (nombre, etiquetas, valor, tipo), con tipo "gauge" (por defecto) o "counter"
+        :return: None
+        """
+        self._collectors.append(collector)
+
+    def _collected(self):
+        samples = []
+        for collector in list(self._collectors):
+            try:
+                for sample in collector():
+                    name, labels, value = sample[:3]
+                    kind = sample[3] if len(sample) > 3 else "gauge"
+                    samples.append((name, labels, value, kind))
+            except Exception as e:
+                print(f"[METRICAS] Error en colector: {e}")
+        return samples
+
+    def to_json(self):
+        """
+        Exporta las métricas como diccionario serializable.
+
+        :return: Diccionario con histograms, counters y gauges
+        """
+        with self._lock:
+            histograms = [
+                {
+                    "name": name, "labels": dict(labels), "count": histogram.count,
+                    "sum": round(histogram.sum, 6),
+                    "p50": histogram.quantile(0.5), "p95": histogram.quantile(0.95),
+                    "buckets": dict(histogram.cumulative()),
+                }
+                for (name, labels), histogram in sorted(self._histograms.items())
+            ]
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+        gauges = []
+        for name, labels, value, kind in self._collected():
+            (counters if kind == "counter" else gauges).append({"name": name, "labels": labels, "value": value})
+        return {"histograms": histograms, "counters": counters, "gauges": gauges}
+
+    def to_prometheus(self):
+        """
+        Exporta las métricas en el formato de texto de Prometheus.
+
+        :return: Cadena lista para servir en /metrics
+        """
+        lines = []
+        typed = set()
+
+        def header(name, kind):
+            full = f"{METRICS_PREFIX}_{name}"
+            if full not in typed:
+                typed.add(full)
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} {kind}")
+            return full
+
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            snapshots = [(key, histogram.cumulative(), histogram.sum, histogram.count) for key, histogram in histograms]
+        for (name, labels), buckets, total, count in snapshots:
+            full = header(name, "histogram")
+            for upper, cumulative in buckets:
+                lines.append(f"{full}_bucket{_labels(labels + (('le', upper),))} {cumulative}")
+            lines.append(f"{full}_sum{_labels(labels)} {total:.6f}")
+            lines.append(f"{full}_count{_labels(labels)} {count}")
+        # Cada familia (nombre) se exporta junta, con un único TYPE, como exige el formato
+        families = {}
+        for (name, labels), value in counters:
+            families.setdefault(name, ("counter", []))[1].append((labels, value))
+        for name, labels, value, kind in self._collected():
+            families.setdefault(name, (kind, []))[1].append((tuple(sorted(labels.items())), value))
+        for name, (kind, samples) in sorted(families.items()):
+            full = header(name, kind)
+            for labels, value in sorted(samples):
+                lines.append(f"{full}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+_registry = MetricsRegistry()
+_registry.describe("span_duration_seconds", "Duración de etapas y llamadas a modelos/servicios")
+
+def get_metrics_registry():
+    """
+    Devuelve el registro de métricas del proceso.
+
+    :return: Instancia de MetricsRegistry
+    """
+    return _registry
+
+def export_prometheus():
+    return _registry.to_prometheus()
+
+def export_json():
+    return json.dumps(_registry.to_json(), ensure_ascii=False, indent=2)
+
+class Trace:
+    """
+    Cascada de spans de una solicitud.
+
+    :param name: Nombre del flujo (p. ej. "texto", "audio")
+    """
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name, start, duration, attributes):
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "start_ms": round((start - self.started_at) * 1000, 1),
+                "duration_ms": round(duration * 1000, 1),
+                "thread": threading.current_thread().name,
+                "attributes": attributes,
+            })
+
+    def waterfall(self):
+        """
+        Spans ordenados por inicio, con desplazamiento y duración en milisegundos.
+
+        :return: Lista de diccionarios
+        """
+        with self._lock:
+            return sorted(self.spans, key=lambda item: item["start_ms"])
+
+@contextmanager
+def trace_scope(name):
+    """
+    Abre la traza de una solicitud. Si ya hay una activa, se reutiliza.
+
+    :param name: Nombre del flujo
+    :return: Context manager que entrega la Trace activa
+    """
+    outer = _current_trace.get()
+    if outer is not None:
+        yield outer
+        return
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def current_trace():
+    return _current_trace.get()
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Mide un tramo: lo agrega al histograma `span_duration_seconds{span=name}` y a la traza activa.
+
+    :param name: Nombre del span (baja cardinalidad, p. ej. "whisper", "retriever.vector")
+    :param attributes: Atributos informativos (solo en la traza; el bloque puede agregar más)
+    :return: Context manager que entrega el diccionario de atributos
+    """
+    start = time.perf_counter()
+    try:
+        yield attributes
+    except Exception as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _registry.observe("span_duration_seconds", duration, span=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, start, duration, attributes)
@@ -0,0 +1,292 @@
+"""
+Cliente del servidor de modelos compartido (model_server.py).
+
+Con MODEL_SERVER_ADDRESS configurado, la generación local de Sam_Diagnostic y
+el NER de scispaCy no cargan los modelos en el proceso: se envían a un único
+servidor que los mantiene en memoria, de modo que varias réplicas de la app o
+del worker comparten los pesos. La comunicación usa `multiprocessing.connection`
+(socket Unix si la dirección es una ruta, TCP si es "host:puerto"), con
+MODEL_SERVER_AUTHKEY como clave compartida. Los mensajes se envían como JSON
+(`send_bytes`/`recv_bytes`), nunca con pickle: un mensaje no puede ejecutar
+código en el servidor.
+"""
+import os
+import json
+import time
+import socket
+import ipaddress
+import threading
+from multiprocessing.connection import Client
+from .deadline_utils import remaining_seconds, timeout_for
+
+MODEL_SERVER_ADDRESS = os.getenv("MODEL_SERVER_ADDRESS")
+MODEL_SERVER_AUTHKEY = os.getenv("MODEL_SERVER_AUTHKEY")
+MODEL_SERVER_TIMEOUT_SECONDS = float(os.getenv("MODEL_SERVER_TIMEOUT_SECONDS", "300"))
+# Margen para recibir la respuesta de una generación que el servidor cortó al vencer el plazo
+_DEADLINE_GRACE_SECONDS = 5.0
+# Espera del final de un streaming que el consumidor dejó de leer, para reutilizar la conexión
+_STREAM_DRAIN_SECONDS = 2.0
+
+class ModelServerError(RuntimeError):
+    pass
+
+def parse_address(address):
+    """
+    Dirección de multiprocessing.connection a partir de la configuración.
+
+    :param address: "host:puerto" o ruta de un socket Unix
+    :return: Tupla (host, puerto) o ruta
+    """
+    host, separator, port = address.rpartition(":")
+    if separator and port.isdigit() and "/" not in address:
+        return host or "127.0.0.1", int(port)
+    return address
+
+def is_local_address(address):
+    """
+    Indica si la dirección solo es accesible desde la misma máquina.
+
+    :param address: "host:puerto" o ruta de un socket Unix
+    :return: True para sockets Unix y direcciones de loopback
+    """
+    parsed = parse_address(address)
+    if isinstance(parsed, str):
+        return True
+    host = parsed[0]
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        try:
+            return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+        except (OSError, ValueError):
+            return False
+
+def send_message(connection, message):
+    """
+    Envía un mensaje como JSON.
+
+    :param connection: Conexión de multiprocessing.connection
+    :param message: Diccionario serializable en JSON
+    :return: None
+    """
+    connection.send_bytes(json.dumps(message, ensure_ascii=False).encode("utf-8"))
+
+def recv_message(connection):
+    """
+    Recibe un mensaje JSON.
+
+    :param connection: Conexión de multiprocessing.connection
+    :return: Diccionario del mensaje
+    :raises ValueError: Si el mensaje no es un objeto JSON
+    """
+    message = json.loads(connection.recv_bytes().decode("utf-8"))
+    if not isinstance(message, dict):
+        raise ValueError("Se esperaba un objeto JSON")
+    return message
+
+def authkey():
+    """
+    Clave compartida entre el servidor y los clientes (None si no se configuró).
+
+    :return: bytes o None
+    """
+    return MODEL_SERVER_AUTHKEY.encode("utf-8") if MODEL_SERVER_AUTHKEY else None
+
+def enabled():
+    """
+    Indica si los modelos locales se consultan al servidor compartido.
+
+    :return: True si MODEL_SERVER_ADDRESS está configurado
+    """
+    return bool(MODEL_SERVER_ADDRESS)
+
+class _ConnectionPool:
+    """
+    Conexiones abiertas al servidor; cada solicitud usa una conexión exclusiva.
+    """
+    def __init__(self, address):
+        self.address = address
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Conexión libre o una nueva.
+
+        :return: Tupla (conexión, True si se reutilizó)
+        """
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        try:
+            return Client(parse_address(self.address), authkey=authkey()), False
+        except OSError as e:
+            raise ModelServerError(f"No se pudo conectar al servidor de modelos en {self.address}: {e}") from e
+
+    def release(self, connection):
+        with self._lock:
+            self._idle.append(connection)
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except OSError:
+            pass
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = _ConnectionPool(MODEL_SERVER_ADDRESS)
+    return _pool
+
+def _receive(connection):
+    """
+    Espera un mensaje del servidor acotado por el plazo de la solicitud.
+
+    :return: Diccionario del mensaje
+    :raises TimeoutError: Si no llega a tiempo
+    """
+    timeout = timeout_for(MODEL_SERVER_TIMEOUT_SECONDS) + _DEADLINE_GRACE_SECONDS
+    if not connection.poll(timeout):
+        raise TimeoutError("El servidor de modelos no respondió a tiempo")
+    return recv_message(connection)
+
+def _check(message):
+    """
+    Traduce un mensaje de error del servidor a la excepción equivalente.
+
+    :param message: Mensaje recibido
+    :return: El mismo mensaje si no es un error
+    """
+    if "error" in message:
+        if message.get("timeout"):
+            raise TimeoutError(message["error"])
+        raise ModelServerError(f"Error en el servidor de modelos: {message['error']}")
+    return message
+
+def _open(op, payload):
+    """
+    Envía una solicitud; si una conexión reutilizada quedó cerrada, reintenta con una nueva.
+
+    :return: Conexión con la solicitud enviada
+    """
+    pool = _get_pool()
+    request = dict(payload, op=op, deadline=remaining_seconds())
+    connection, reused = pool.acquire()
+    try:
+        send_message(connection, request)
+    except OSError:
+        pool.discard(connection)
+        if not reused:
+            raise ModelServerError(f"Se perdió la conexión con el servidor de modelos en {pool.address}")
+        connection, _ = pool.acquire()
+        try:
+            send_message(connection, request)
+        except OSError as e:
+            pool.discard(connection)
+            raise ModelServerError(f"Se perdió la conexión con el servidor de modelos en {pool.address}: {e}") from e
+    return connection
+
+def request(op, **payload):
+    """
+    Ejecuta una operación en el servidor de modelos.
+
+    :param op: Operación ("ping", "generate", "generate_batch", "entities", "entities_batch")
+    :param payload: Argumentos de la operación
+    :return: Diccionario de respuesta con result y, para generación, usage
+    :raises TimeoutError: Si vence el plazo de la solicitud
+    :raises ModelServerError: Si el servidor no está disponible o la operación falla
+    """
+    pool = _get_pool()
+    connection = _open(op, payload)
+    try:
+        message = _receive(connection)
+    except (OSError, EOFError, ValueError) as e:
+        pool.discard(connection)
+        raise ModelServerError(f"Se perdió la conexión con el servidor de modelos: {e}") from e
+    except BaseException:
+        # La respuesta pendiente desincronizaría la conexión: no se reutiliza
+        pool.discard(connection)
+        raise
+    pool.release(connection)
+    return _check(message)
+
+def _drain(connection):
+    """
+    Descarta los mensajes restantes de un streaming hasta el final.
+
+    :param connection: Conexión con un streaming en curso
+    :return: True si llegó el final dentro de _STREAM_DRAIN_SECONDS
+    """
+    limit = time.monotonic() + _STREAM_DRAIN_SECONDS
+    try:
+        while True:
+            if not connection.poll(max(0.0, limit - time.monotonic())):
+                return False
+            message = recv_message(connection)
+            if message.get("done") or "error" in message:
+                return True
+    except (OSError, EOFError, ValueError):
+        return False
+
+def stream(op, **payload):
+    """
+    Ejecuta una operación con respuesta en streaming.
+
+    Si el consumidor deja de leer antes del final (p. ej. al encontrar
+    "<end_of_turn>", justo antes de que el servidor termine), se esperan los
+    mensajes restantes hasta _STREAM_DRAIN_SECONDS para reutilizar la conexión;
+    si no llegan, la conexión se cierra (el servidor deja de enviar fragmentos).
+
+    :param op: Operación ("stream")
+    :param payload: Argumentos de la operación
+    :return: Generador de mensajes con fragment; el último tiene done y usage
+    """
+    pool = _get_pool()
+    connection = _open(op, payload)
+    finished = False
+    try:
+        while True:
+            try:
+                message = _check(_receive(connection))
+            except (OSError, EOFError, ValueError) as e:
+                raise ModelServerError(f"Se perdió la conexión con el servidor de modelos: {e}") from e
+            if message.get("done"):
+                finished = True
+                yield message
+                return
+            yield message
+    except GeneratorExit:
+        finished = _drain(connection)
+        raise
+    finally:
+        if finished:
+            pool.release(connection)
+        else:
+            pool.discard(connection)
+
+def ping(address=None, timeout=5.0):
+    """
+    Verifica que el servidor responde.
+
+    :param address: Dirección del servidor (por defecto MODEL_SERVER_ADDRESS)
+    :param timeout: Segundos de espera de la respuesta
+    :return: Diccionario con los modelos cargados, el pid del servidor y la duración
+    """
+    start = time.perf_counter()
+    connection = Client(parse_address(address or MODEL_SERVER_ADDRESS), authkey=authkey())
+    try:
+        send_message(connection, {"op": "ping", "deadline": None})
+        if not connection.poll(timeout):
+            raise TimeoutError("El servidor de modelos no respondió a tiempo")
+        result = _check(recv_message(connection))["result"]
+    finally:
+        connection.close()
+    return dict(result, seconds=round(time.perf_counter() - start, 4))
@@ -8,6 +8,28 @@ from langchain.chains import RetrievalQA
 from langchain.schema import Document
 from langchain.prompts import PromptTemplate
 from chromadb import PersistentClient
+import time
+import shutil
+import weakref
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timezone
+from .embedding_utils import ConcurrentEmbeddingBuilder
+from .text_utils import fold_accents, estimate_tokens, normalize_text
+from .geo_utils import ProviderSpatialIndex, load_locality_coordinates
+from .specialty_utils import SpecialtyNormalizer
+from .cache_utils import TTLLRUCache
+from .concurrency_utils import SingleFlight, AsyncSingleFlight
+from .context_utils import CompactContextBuilder
+from .deadline_utils import timeout_for, deadline_expired
+from .hedging_utils import get_hedger
+from .metrics_utils import span
+from .usage_utils import model_call, chat_usage
+from .memory_utils import profile_memory
+from .capture_utils import capture_value
+from . import index_utils
 
 # Cargar variables de entorno
 dotenv.load_dotenv()
@@ -21,8 +43,45 @@ class Config:
     CHUNK_SIZE = 1000
     CHUNK_OVERLAP = 100
     DEFAULT_SEARCH_K = 10
+    # Selección de contexto: umbral de relevancia y presupuesto de tokens del prompt
+    MIN_RELEVANCE_SCORE = float(os.getenv("MIN_RELEVANCE_SCORE", "0.3"))
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+    # Columnas que necesita la plantilla de respuesta (contexto compacto)
+    CONTEXT_FIELDS = ["Nombre", "Especialidad", "Teléfono", "Dirección", "Email", "Localidad"]
     DEFAULT_TEMPERATURE = 0.3
     LLM_MODEL = "gpt-3.5-turbo"
+    # Modelo alternativo para el duplicado de las llamadas lentas (hedging); por defecto el mismo
+    LLM_HEDGE_MODEL = os.getenv("LLM_HEDGE_MODEL") or LLM_MODEL
+    # Construcción del índice: lotes concurrentes con límite de tasa y checkpoints
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+    EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+    EMBEDDING_REQUESTS_PER_MINUTE = int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "3000"))
+    EMBEDDING_TOKENS_PER_MINUTE = int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000"))
+    EMBEDDING_MAX_RETRIES = 5
+    EMBEDDING_CHECKPOINT_DIRNAME = "embedding_checkpoints"
+    # Snapshots versionados del índice (ver tools/build_index.py)
+    INDEX_SNAPSHOTS_DIR = os.getenv("INDEX_SNAPSHOTS_DIR", "./indexes")
+    ALLOW_RUNTIME_INDEX_BUILD = os.getenv("ALLOW_RUNTIME_INDEX_BUILD", "false").lower() in ("1", "true", "yes")
+    SNAPSHOTS_TO_KEEP = 3
+    # Recarga en caliente del dataset (ver utils/reload_utils.py)
+    DATASET_HOT_RELOAD = os.getenv("DATASET_HOT_RELOAD", "true").lower() in ("1", "true", "yes")
+    DATASET_POLL_SECONDS = float(os.getenv("DATASET_POLL_SECONDS", "30"))
+    # Columnas del dataset que se copian a la metadata de cada documento
+    SPECIALTY_COLUMN = "Especialidad"
+    LOCALITY_COLUMN = "Localidad"
+    # Búsqueda por ubicación: tabla de geocodificación fuera de línea (row_index, lat, lon)
+    GEOCODING_TABLE_PATH = os.getenv("GEOCODING_TABLE_PATH", "datasets/geocodificacion.csv")
+    # Coordenadas de localidades (localidad, lat, lon) para las que no tienen prestadores geocodificados
+    LOCALITY_GAZETTEER_PATH = os.getenv("LOCALITY_GAZETTEER_PATH", "datasets/localidades.csv")
+    NEAREST_PROVIDERS_K = 10
+    # Máximo de documentos por especialidad canónica (coincidencia exacta de metadata)
+    EXACT_MATCH_LIMIT = 30
+    # Recuperaciones especulativas no confirmadas se descartan pasado este tiempo
+    PREFETCH_TTL_SECONDS = 30
+    PREFETCH_WORKERS = 4
+    # Caché de respuestas por conjunto de especialidades canónicas (+ localidad) y versión del índice
+    ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "256"))
 
 class DocumentLoader:
     """
@@ -30,6 +89,21 @@ class DocumentLoader:
 
     :return: Lista de objetos Document de LangChain al usar los métodos de carga
     """
+    @staticmethod
+    def _find_column(columns, name):
+        """
+        Busca una columna por nombre sin distinguir mayúsculas ni tildes.
+
+        :param columns: Columnas del DataFrame
+        :param name: Nombre de la columna buscada
+        :return: Nombre real de la columna o None si no existe
+        """
+        target = fold_accents(name).strip().lower()
+        for col in columns:
+            if fold_accents(col).strip().lower() == target:
+                return col
+        return None
+
     @staticmethod
     def load_excel_documents(excel_path):
         """
@@ -40,6 +114,8 @@ class DocumentLoader:
         """
         try:
             df = pd.read_excel(excel_path)
+            specialty_col = DocumentLoader._find_column(df.columns, Config.SPECIALTY_COLUMN)
+            locality_col = DocumentLoader._find_column(df.columns, Config.LOCALITY_COLUMN)
             documents = []
             for idx, row in df.iterrows():
                 text_content = " | ".join([
@@ -47,13 +123,19 @@ class DocumentLoader:
                     for col, val in row.items() 
                     if pd.notna(val)
                 ])  
+                metadata = {
+                    "source": excel_path,
+                    "row_index": idx,
+                    "file_type": "excel"
+                }
+                if specialty_col is not None and pd.notna(row[specialty_col]):
+                    metadata["especialidad"] = str(row[specialty_col]).strip()
+                if locality_col is not None and pd.notna(row[locality_col]):
+                    metadata["localidad"] = str(row[locality_col]).strip()
+                    metadata["localidad_norm"] = normalize_text(row[locality_col])
                 doc = Document(
                     page_content=text_content,
-                    metadata={
-                        "source": excel_path,
-                        "row_index": idx,
-                        "file_type": "excel"
-                    }
+                    metadata=metadata
                 )
                 documents.append(doc)   
             return documents
@@ -76,17 +158,49 @@ class VectorStoreManager:
         """
         Crea un vectorstore con ChromaDB a partir de chunks de documentos.
 
+        Los embeddings se calculan por lotes concurrentes con límite de tasa y se
+        guardan en checkpoints, por lo que una construcción interrumpida (429,
+        error de red) se reanuda desde el último lote completado.
+
         :param chunks: Lista de Document ya segmentados
         :return: Instancia de Chroma inicializada con embeddings
         """
         try:
             os.makedirs(self.persist_directory, exist_ok=True)
+            builder = ConcurrentEmbeddingBuilder(
+                embeddings=self.embeddings,
+                model_name=Config.EMBEDDING_MODEL,
+                batch_size=Config.EMBEDDING_BATCH_SIZE,
+                max_concurrency=Config.EMBEDDING_MAX_CONCURRENCY,
+                requests_per_minute=Config.EMBEDDING_REQUESTS_PER_MINUTE,
+                tokens_per_minute=Config.EMBEDDING_TOKENS_PER_MINUTE,
+                checkpoint_dir=os.path.join(self.persist_directory, Config.EMBEDDING_CHECKPOINT_DIRNAME),
+                max_retries=Config.EMBEDDING_MAX_RETRIES,
+            )
+            texts = [chunk.page_content for chunk in chunks]
+            vectors = builder.embed_documents(texts)
+
             client = PersistentClient(path=self.persist_directory)
-            return Chroma.from_documents(
-                documents=chunks,
-                embedding=self.embeddings,
+            # Recrear la colección para no acumular duplicados entre construcciones
+            try:
+                client.delete_collection(self.collection_name)
+            except Exception:
+                pass
+            collection = client.get_or_create_collection(self.collection_name)
+            step = Config.EMBEDDING_BATCH_SIZE * 16
+            for start in range(0, len(chunks), step):
+                end = start + step
+                collection.upsert(
+                    ids=[f"doc-{i}" for i in range(start, min(end, len(chunks)))],
+                    embeddings=vectors[start:end],
+                    documents=texts[start:end],
+                    metadatas=[chunk.metadata for chunk in chunks[start:end]],
+                )
+            builder.clear_checkpoint()
+            return Chroma(
                 client=client,
                 collection_name=self.collection_name,
+                embedding_function=self.embeddings,
             )
         except Exception as e:
             raise Exception(f"Error creando vectorstore: {str(e)}")
@@ -98,7 +212,8 @@ class VectorStoreManager:
         :return: Instancia de Chroma conectada a la colección persistida
         """
         try:
-            os.makedirs(self.persist_directory, exist_ok=True)
+            if not os.path.isdir(self.persist_directory):
+                raise FileNotFoundError(f"No existe {self.persist_directory}")
             client = PersistentClient(path=self.persist_directory)
             return Chroma(
                 client=client,
@@ -122,7 +237,7 @@ class PromptBuilder:
         template = """
         Eres un sistema de búsqueda de prestadores de salud.
 
-        CONTEXTO DE PRESTADORES DISPONIBLES:
+        CONTEXTO DE PRESTADORES DISPONIBLES (tabla separada por "|"; la primera fila son los encabezados, "-" indica dato faltante):
         {context}
 
         CONSULTA JSON: {question}
@@ -155,6 +270,34 @@ class PromptBuilder:
             input_variables=["context", "question"]
         )
 
+def _chat_model(model):
+    """
+    Crea el cliente de chat con el timeout acotado por el plazo de la solicitud.
+
+    :param model: Nombre del modelo de OpenAI
+    :return: Instancia de ChatOpenAI
+    """
+    return ChatOpenAI(model=model, temperature=Config.DEFAULT_TEMPERATURE, timeout=timeout_for(60))
+
+def _invoke_chat(model, prompt):
+    """
+    Invoca el chat y registra los tokens usados.
+
+    :param model: Nombre del modelo de OpenAI
+    :param prompt: Prompt ya formateado
+    :return: AIMessage de LangChain
+    """
+    with model_call("chat", model) as usage:
+        response = _chat_model(model).invoke(prompt)
+        chat_usage(response, prompt, usage)
+    return response
+
+async def _ainvoke_chat(model, prompt):
+    with model_call("chat", model) as usage:
+        response = await _chat_model(model).ainvoke(prompt)
+        chat_usage(response, prompt, usage)
+    return response
+
 class RAGProcessor:
     def __init__(self, persist_directory,
                  chunk_size = None, 
@@ -255,7 +398,13 @@ class RAGProcessor:
                     "answer": "No se encontraron resultados para esta búsqueda.",
                     "source_documents": []
                 }
-            result = self.qa_chain.invoke({"query": question})
+            with span("qa_chain", model=Config.LLM_MODEL), model_call("chat", Config.LLM_MODEL) as usage:
+                result = self.qa_chain.invoke({"query": question})
+                # RetrievalQA no expone el uso del proveedor: se estima con la consulta, el contexto y la respuesta
+                context = "".join(doc.page_content for doc in result.get("source_documents", []))
+                usage["prompt_tokens"] = estimate_tokens(str(question)) + estimate_tokens(context)
+                usage["completion_tokens"] = estimate_tokens(result["result"])
+                usage["estimated"] = True
             return {
                 "answer": result["result"],
                 "source_documents": result.get("source_documents", [])
@@ -270,25 +419,68 @@ class RAGProcessor:
 
         :param question: Consulta en formato texto o JSON
         :param specific_docs: Lista de Document relevantes (opcional)
-        :return: Diccionario con 'answer' y 'source_documents'
+        :return: Diccionario con 'answer', 'source_documents' y 'context_stats' (tokens antes/después)
         """
         if specific_docs:
-            # Usar documentos específicos con el prompt existente
-            context = "\n\n".join([doc.page_content for doc in specific_docs])
-            prompt = PromptBuilder.get_search_prompt()
-            formatted_prompt = prompt.format(context=context, question=question)
+            formatted_prompt, context_stats = self._specific_docs_prompt(question, specific_docs)
             
-            # Usar solo el LLM sin retriever
-            llm = ChatOpenAI(model=Config.LLM_MODEL, temperature=Config.DEFAULT_TEMPERATURE)
-            response = llm.invoke(formatted_prompt)
+            # Usar solo el LLM sin retriever (con hedging si la respuesta tarda más que el p95)
+            with span("gpt", model=Config.LLM_MODEL, documents=len(specific_docs)):
+                response = get_hedger("openai_chat").call(
+                    lambda: _invoke_chat(Config.LLM_MODEL, formatted_prompt),
+                    lambda: _invoke_chat(Config.LLM_HEDGE_MODEL, formatted_prompt)
+                )
             return {
                 "answer": response.content,
-                "source_documents": specific_docs
+                "source_documents": specific_docs,
+                "context_stats": context_stats
             }
         else:
             # Usar flujo normal con retriever
             return self.query(question)
     
+    async def aquery_with_specific_docs(self, question, specific_docs=None):
+        """
+        Versión asíncrona de query_with_specific_docs (usa ainvoke del LLM).
+
+        :param question: Consulta en formato texto o JSON
+        :param specific_docs: Lista de Document relevantes (opcional)
+        :return: Diccionario con 'answer', 'source_documents' y 'context_stats'
+        """
+        if not specific_docs:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, contextvars.copy_context().run, self.query, question)
+        formatted_prompt, context_stats = self._specific_docs_prompt(question, specific_docs)
+        with span("gpt", model=Config.LLM_MODEL, documents=len(specific_docs)):
+            response = await get_hedger("openai_chat").acall(
+                lambda: _ainvoke_chat(Config.LLM_MODEL, formatted_prompt),
+                lambda: _ainvoke_chat(Config.LLM_HEDGE_MODEL, formatted_prompt)
+            )
+        return {
+            "answer": response.content,
+            "source_documents": specific_docs,
+            "context_stats": context_stats
+        }
+    
+    @staticmethod
+    def _specific_docs_prompt(question, specific_docs):
+        """
+        Arma el prompt con el contexto compacto de los documentos indicados.
+
+        :param question: Consulta en formato texto o JSON
+        :param specific_docs: Lista de Document relevantes
+        :return: Tupla (prompt formateado, estadísticas del contexto)
+        """
+        # Usar documentos específicos con el prompt existente, en formato compacto
+        context, context_stats = _context_builder.build(specific_docs)
+        print(
+            f"Contexto compacto: {context_stats['rows']} filas "
+            f"({context_stats['duplicates']} duplicadas descartadas), "
+            f"tokens {context_stats['tokens_before']} -> {context_stats['tokens_after']}"
+        )
+        prompt = PromptBuilder.get_search_prompt()
+        return prompt.format(context=context, question=question), context_stats
+    
     def _get_relevant_documents(self, question):
         """
         Obtiene documentos relevantes usando el retriever configurado.
@@ -297,13 +489,16 @@ class RAGProcessor:
         :return: Lista de Document relevantes o vacía si falla
         """
         try:
-            return self.retriever.invoke(question)
+            with span("retriever", kind="default"), model_call("embedding", Config.EMBEDDING_MODEL) as usage:
+                usage.update(prompt_tokens=estimate_tokens(str(question)), estimated=True)
+                return self.retriever.invoke(question)
         except Exception:
             try:
                 return self.retriever.get_relevant_documents(question)
             except Exception:
                 return []
 
+@profile_memory("index.setup_from_excel", kind="index")
 def setup_rag_from_excel(excel_path, persist_directory,force_reload= False):
     """
     Configura el sistema RAG a partir de un archivo Excel y un directorio de persistencia.
@@ -324,76 +519,569 @@ def setup_rag_from_excel(excel_path, persist_directory,force_reload= False):
     processor.setup_qa_chain()
     return processor
 
+@profile_memory("index.open_snapshot", kind="index")
+def setup_rag_from_snapshot(snapshot):
+    """
+    Configura el sistema RAG sobre un snapshot de índice ya construido.
+
+    No crea ni modifica vectores ni escribe en el snapshot: abre una copia local
+    de la colección, que se elimina cuando el procesador deja de usarse.
+
+    :param snapshot: Instancia de index_utils.IndexSnapshot
+    :return: Instancia de RAGProcessor inicializada
+    """
+    chroma_path = snapshot.working_copy()
+    processor = RAGProcessor(persist_directory=chroma_path)
+    weakref.finalize(processor, shutil.rmtree, os.path.dirname(chroma_path), True)
+    processor.vectorstore = processor.vectorstore_manager.load_existing_vectorstore()
+    processor.setup_retriever()
+    processor.setup_qa_chain()
+    return processor
+
+@profile_memory("index.build", kind="index")
+def build_index_snapshot(excel_path, snapshots_dir, version=None):
+    """
+    Construye un snapshot versionado del índice (vectores, mapas de especialidades
+    y copia del dataset) y lo publica de forma atómica. Un lock por dataset evita
+    que dos procesos construyan a la vez en el mismo directorio.
+
+    :param excel_path: Ruta al .xlsx de prestadores
+    :param snapshots_dir: Directorio raíz donde se publican los snapshots
+    :param version: Versión a asignar (opcional; por defecto fecha + hash del dataset)
+    :return: Ruta del snapshot publicado
+    :raises index_utils.BuildInProgress: Si otro proceso está construyendo el mismo dataset
+    """
+    os.makedirs(snapshots_dir, exist_ok=True)
+    fingerprint = index_utils.file_fingerprint(excel_path)
+    version = version or index_utils.new_version(fingerprint)
+    if os.path.exists(os.path.join(snapshots_dir, version)):
+        raise ValueError(f"Ya existe un snapshot con la versión {version}")
+    with index_utils.BuildLock(snapshots_dir, fingerprint):
+        return _build_locked_snapshot(excel_path, snapshots_dir, version, fingerprint)
+
+def _build_locked_snapshot(excel_path, snapshots_dir, version, fingerprint):
+    """
+    Construye y publica el snapshot (con el lock de construcción tomado).
+
+    :return: Ruta del snapshot publicado
+    """
+    # El directorio de construcción depende del dataset: si una construcción
+    # previa se interrumpió, se reanuda desde sus checkpoints de embeddings.
+    build_dir = index_utils.building_directory(snapshots_dir, fingerprint)
+    os.makedirs(build_dir, exist_ok=True)
+    dataset_copy = os.path.join(build_dir, index_utils.DATASET_FILENAME)
+    shutil.copy2(excel_path, dataset_copy)
+
+    if os.path.exists(Config.GEOCODING_TABLE_PATH):
+        shutil.copy2(Config.GEOCODING_TABLE_PATH, os.path.join(build_dir, index_utils.GEOCODING_FILENAME))
+    if os.path.exists(Config.LOCALITY_GAZETTEER_PATH):
+        shutil.copy2(Config.LOCALITY_GAZETTEER_PATH, os.path.join(build_dir, index_utils.LOCALITIES_FILENAME))
+
+    documents = DocumentLoader.load_excel_documents(dataset_copy)
+    processor = RAGProcessor(persist_directory=os.path.join(build_dir, index_utils.CHROMA_DIRNAME))
+    chunks = processor.split_documents(documents)
+    processor.vectorstore = processor.vectorstore_manager.create_vectorstore(chunks)
+
+    index_utils.write_json(
+        os.path.join(build_dir, index_utils.SPECIALTIES_FILENAME),
+        index_utils.build_specialty_map(documents)
+    )
+    manifest = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "dataset": {
+            "filename": os.path.basename(excel_path),
+            "sha256": fingerprint,
+            "rows": len(documents),
+        },
+        "index": {
+            "collection": processor.vectorstore_manager.collection_name,
+            "embedding_model": Config.EMBEDDING_MODEL,
+            "chunks": len(chunks),
+            "chunk_size": processor.chunk_size,
+            "chunk_overlap": processor.chunk_overlap,
+        },
+    }
+    return index_utils.finalize_snapshot(build_dir, snapshots_dir, version, manifest)
+
 class SearchService:
     """
     Servicio principal para búsquedas.
+
+    Si existe un snapshot completo en `snapshots_dir`, lo abre en modo solo
+    lectura; si no, y la construcción en tiempo de ejecución está habilitada,
+    construye el índice desde el Excel (comportamiento de desarrollo).
     
     :param excel_path: Ruta al .xlsx de datos (opcional)
     :param persist_directory: Directorio de persistencia de ChromaDB (opcional)
+    :param snapshots_dir: Directorio raíz de snapshots versionados (opcional)
     """
-    def __init__(self, excel_path = None, persist_directory = None):
+    def __init__(self, excel_path = None, persist_directory = None, snapshots_dir = None):
         self.excel_path = excel_path or Config.EXCEL_PATH
         self.persist_directory = persist_directory or Config.CHROMA_DB_PATH
+        self.snapshots_dir = snapshots_dir or Config.INDEX_SNAPSHOTS_DIR
         self.processor = None
+        self.index_version = None
+        self.specialty_map = {"especialidades": {}, "localidades": {}}
+        self.spatial_index = None
+        self.locality_coordinates = {}
+        self.specialty_normalizer = None
+        # Recuperaciones especulativas en curso: clave de recuperación -> (instante, Future)
+        self._prefetched = {}
+        self._prefetch_lock = threading.Lock()
+        self.speculation_stats = {"started": 0, "used": 0, "discarded": 0, "expired": 0}
         self._initialize()
+        # Normalizador armado a partir de las especialidades distintas del índice
+        self.specialty_normalizer = SpecialtyNormalizer(self.specialty_map.get("especialidades", {}).keys())
     
     def _initialize(self):
         """
-        Inicializa el procesador RAG.
+        Inicializa el procesador RAG desde el snapshot más reciente o, si no hay,
+        construyendo el índice desde el Excel.
 
         :return: None
         """
-        self.processor = setup_rag_from_excel(
-            excel_path=self.excel_path,
-            persist_directory=self.persist_directory,
-            force_reload=True
-        )
+        snapshot = index_utils.load_latest_snapshot(self.snapshots_dir)
+        if snapshot is not None:
+            print(f"Cargando snapshot de índice {snapshot.version}")
+            self.processor = setup_rag_from_snapshot(snapshot)
+            self.index_version = snapshot.version
+            self.specialty_map = snapshot.specialty_map
+            self.spatial_index = self._load_spatial_index(snapshot.geocoding_path)
+            self.locality_coordinates = self._load_locality_coordinates(snapshot.localities_path)
+            return
+        if not Config.ALLOW_RUNTIME_INDEX_BUILD:
+            raise Exception(
+                f"No hay snapshots de índice completos en {self.snapshots_dir}. "
+                "Ejecute: python -m tools.build_index"
+            )
+        documents = DocumentLoader.load_excel_documents(self.excel_path)
+        self.processor = RAGProcessor(persist_directory=self.persist_directory)
+        self.processor.setup_vectorstore(documents, force_reload=True)
+        self.processor.setup_retriever()
+        self.processor.setup_qa_chain()
+        self.index_version = f"runtime-{index_utils.file_fingerprint(self.excel_path)[:12]}"
+        self.specialty_map = index_utils.build_specialty_map(documents)
+        self.spatial_index = self._load_spatial_index(Config.GEOCODING_TABLE_PATH)
+        self.locality_coordinates = self._load_locality_coordinates(Config.LOCALITY_GAZETTEER_PATH)
+    
+    @staticmethod
+    def _load_spatial_index(path):
+        """
+        Carga el índice espacial de prestadores si existe la tabla de geocodificación.
+
+        :param path: Ruta del CSV de geocodificación (o None)
+        :return: Instancia de ProviderSpatialIndex o None
+        """
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            spatial_index = ProviderSpatialIndex.from_csv(path)
+            print(f"Índice espacial cargado con {len(spatial_index)} prestadores geocodificados")
+            return spatial_index
+        except Exception as e:
+            print(f"Error cargando tabla de geocodificación: {e}")
+            return None
+
+    @staticmethod
+    def _load_locality_coordinates(path):
+        """
+        Carga el gazetteer de coordenadas de localidades si existe.
+
+        :param path: Ruta del CSV de localidades (o None)
+        :return: Diccionario localidad normalizada -> (lat, lon); vacío si no hay gazetteer
+        """
+        if not path or not os.path.exists(path):
+            return {}
+        try:
+            coordinates = load_locality_coordinates(path, normalize_text)
+            print(f"Gazetteer de localidades cargado con {len(coordinates)} localidades")
+            return coordinates
+        except Exception as e:
+            print(f"Error cargando gazetteer de localidades: {e}")
+            return {}
+    
+    def nearest_providers(self, lat, lon, k=None):
+        """
+        Devuelve los prestadores geocodificados más cercanos a un punto.
+
+        :param lat: Latitud
+        :param lon: Longitud
+        :param k: Cantidad de prestadores (por defecto Config.NEAREST_PROVIDERS_K)
+        :return: Lista de tuplas (row_index, distancia_km); vacía si no hay índice espacial
+        """
+        if self.spatial_index is None:
+            return []
+        return self.spatial_index.nearest(lat, lon, k or Config.NEAREST_PROVIDERS_K)
+    
+    def _location_filter(self, locality):
+        """
+        Construye el filtro de metadata para restringir la búsqueda a una localidad.
+
+        Incluye los prestadores de la localidad y, si hay índice espacial, los k
+        más cercanos a su centroide (cubre localidades con pocos prestadores).
+        Si la localidad no tiene prestadores geocodificados, se usan sus
+        coordenadas del gazetteer de localidades.
+
+        :param locality: Localidad indicada por el usuario
+        :return: Filtro de Chroma (dict) o None si no hay localidad
+        """
+        locality_key = normalize_text(locality or "")
+        if not locality_key:
+            return None
+        clauses = [{"localidad_norm": locality_key}]
+        if self.spatial_index is not None:
+            rows = []
+            for name, name_rows in self.specialty_map.get("localidades", {}).items():
+                if normalize_text(name) == locality_key:
+                    rows.extend(name_rows)
+            center = self.spatial_index.centroid(rows) or self.locality_coordinates.get(locality_key)
+            if center is not None:
+                nearest_rows = [row for row, _ in self.nearest_providers(*center)]
+                if nearest_rows:
+                    clauses.append({"row_index": {"$in": nearest_rows}})
+        return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+    
+    def warmup(self):
+        """
+        Ejecuta una consulta de prueba para cargar el índice en memoria antes de
+        recibir tráfico (evita picos de latencia tras un cambio de índice).
+
+        :return: None
+        """
+        try:
+            self.processor.retriever.invoke("prestadores de salud")
+        except Exception as e:
+            print(f"Error en precalentamiento del índice: {e}")
     
-    def search(self, query):
+    def search(self, query, locality=None, render="llm"):
         """
         Busca prestadores de salud basado en JSON con el campo medical_specialty.
 
         :param query: String o dict con la consulta (incluye medical_specialty)
+        :param locality: Localidad para restringir la búsqueda (opcional)
+        :param render: "llm" (respuesta generada por GPT) o "template" (plantilla sin LLM, modo degradado)
         :return: Texto con la respuesta formateada o mensaje de error
         """
         try:
-            print(f"Consulta recibida: {query}")
+            print(f"Consulta recibida: {query} (localidad: {locality})")
+            self.expire_prefetched()
             
             # Extraer especialidad del JSON para hacer búsquedas más específicas
-            specialty_queries = self._extract_specialty_queries(query)
-            print(f"Consultas por especialidad: {specialty_queries}")
-            
-            # Recopilar documentos basados en especialidades
-            all_docs = self._collect_documents_by_specialty(specialty_queries)
-            print(f"Documentos encontrados: {len(all_docs)}")
-            
-            # Si no se encontraron documentos específicos, usar búsqueda general
-            if not all_docs:
-                print("No se encontraron documentos específicos, usando búsqueda general...")
-                all_docs = self._general_search()
+            canonical_specialties, specialty_queries = self._extract_specialty_queries(query)
+            print(f"Especialidades canónicas: {canonical_specialties}; consultas vectoriales: {specialty_queries}")
+            capture_value("rag.specialties", canonical_specialties)
+            capture_value("rag.index_version", self.index_version)
             
-            if not all_docs:
-                return "No se encontraron resultados para esta búsqueda."
+            # Respuesta en caché para el mismo conjunto de especialidades, localidad e índice
+            # (las respuestas por plantilla no se cachean: son la versión degradada)
+            retrieval_key = self.retrieval_key(canonical_specialties, specialty_queries, locality)
+            cache_key = retrieval_key if canonical_specialties else None
+            if cache_key is not None:
+                cached_answer = _answer_cache.get(cache_key)
+                if cached_answer is not None:
+                    print(f"Respuesta obtenida de caché: {cache_key}")
+                    capture_value("rag.answer_cache", "hit")
+                    return cached_answer
+            if render != "llm":
+                cache_key = None
             
+            # Consultas idénticas simultáneas comparten una única recuperación y llamada al LLM
+            return _search_flight.do(
+                (retrieval_key, render),
+                lambda: self._answer(
+                    query, locality, canonical_specialties, specialty_queries, retrieval_key, cache_key, render
+                )
+            )
+        except Exception as e:
+            if deadline_expired():
+                # Con el plazo vencido el error se propaga: la etapa usa su variante degradada (DeadlineHook)
+                raise
+            print(f"Error en búsqueda: {e}")
+            return f"Error en búsqueda: {str(e)}"
+    
+    def _answer(self, query, locality, canonical_specialties, specialty_queries, retrieval_key, cache_key,
+                render="llm"):
+        """
+        Recupera documentos (o toma los de una recuperación especulativa) y genera la respuesta.
+
+        :param query: Consulta original (JSON con medical_specialty)
+        :param locality: Localidad para restringir la búsqueda (opcional)
+        :param canonical_specialties: Especialidades canónicas reconocidas
+        :param specialty_queries: Consultas vectoriales de especialidades no reconocidas
+        :param retrieval_key: Clave de recuperación (ver retrieval_key)
+        :param cache_key: Clave del caché de respuestas o None si no es cacheable
+        :param render: "llm" o "template"
+        :return: Texto con la respuesta formateada
+        """
+        all_docs = self._take_prefetched(retrieval_key)
+        if all_docs is None:
+            all_docs = self._retrieve_documents(locality, canonical_specialties, specialty_queries)
+        else:
+            capture_value("rag.prefetched", True)
+        capture_value("rag.rows", [doc.metadata.get("row_index") for doc in all_docs])
+        
+        if not all_docs:
+            answer = "No se encontraron resultados para esta búsqueda."
+        elif render == "template":
+            answer = _context_builder.render(all_docs)
+        else:
             # Usar el processor con documentos específicos
             result = self.processor.query_with_specific_docs(query, all_docs)
-            return result["answer"]
+            answer = result["answer"]
+        
+        if cache_key is not None:
+            _answer_cache.set(cache_key, answer)
+        return answer
+    
+    def _retrieve_documents(self, locality, canonical_specialties, specialty_queries):
+        """
+        Recupera los documentos de contexto para un conjunto de especialidades.
+
+        :param locality: Localidad para restringir la búsqueda (opcional)
+        :param canonical_specialties: Especialidades canónicas reconocidas
+        :param specialty_queries: Consultas vectoriales de especialidades no reconocidas
+        :return: Lista de Document relevantes
+        """
+        # Pre-filtro por ubicación: reduce los candidatos antes de la búsqueda vectorial
+        where = self._location_filter(locality)
+        
+        # Recopilar documentos basados en especialidades
+        all_docs = self._collect_documents_by_specialty(specialty_queries, where, canonical_specialties)
+        if not all_docs and where is not None:
+            print("Sin resultados en la localidad indicada, ampliando la búsqueda...")
+            all_docs = self._collect_documents_by_specialty(specialty_queries, None, canonical_specialties)
+        print(f"Documentos encontrados: {len(all_docs)}")
+        
+        # Si no se encontraron documentos específicos, usar búsqueda general
+        if not all_docs:
+            print("No se encontraron documentos específicos, usando búsqueda general...")
+            all_docs = self._general_search(where)
+            if not all_docs and where is not None:
+                all_docs = self._general_search()
+        return all_docs
+    
+    def retrieval_key(self, canonical_specialties, specialty_queries, locality):
+        """
+        Clave que identifica una recuperación: versión del índice, especialidades y localidad.
+
+        :param canonical_specialties: Especialidades canónicas
+        :param specialty_queries: Consultas vectoriales de especialidades no reconocidas
+        :param locality: Localidad de la consulta (opcional)
+        :return: Tupla hashable
+        """
+        return (
+            self.index_version,
+            tuple(sorted(canonical_specialties)),
+            tuple(sorted(specialty_queries)),
+            normalize_text(locality or ""),
+        )
+    
+    def retrieval_key_for(self, query, locality=None):
+        """
+        Calcula la clave de recuperación de una consulta sin ejecutarla.
+
+        :param query: Cadena o dict con la consulta (incluye medical_specialty)
+        :param locality: Localidad (opcional)
+        :return: Tupla hashable
+        """
+        canonical_specialties, specialty_queries = self._extract_specialty_queries(query)
+        return self.retrieval_key(canonical_specialties, specialty_queries, locality)
+    
+    def prefetch(self, query, locality=None):
+        """
+        Inicia en segundo plano la recuperación de documentos para una consulta probable.
+
+        Si luego llega una búsqueda con la misma clave de recuperación, usa estos
+        documentos en lugar de volver a buscarlos.
+
+        :param query: Cadena o dict con la consulta especulada (incluye medical_specialty)
+        :param locality: Localidad (opcional)
+        :return: Clave de recuperación de la consulta especulada
+        """
+        canonical_specialties, specialty_queries = self._extract_specialty_queries(query)
+        key = self.retrieval_key(canonical_specialties, specialty_queries, locality)
+        with self._prefetch_lock:
+            self._expire_prefetched()
+            if key not in self._prefetched:
+                future = _prefetch_executor.submit(
+                    contextvars.copy_context().run,
+                    self._retrieve_documents, locality, canonical_specialties, specialty_queries
+                )
+                self._prefetched[key] = (time.monotonic(), future)
+                self.speculation_stats["started"] += 1
+        return key
+    
+    def discard_prefetch(self, key):
+        """
+        Descarta una recuperación especulativa que no se confirmó.
+
+        :param key: Clave devuelta por prefetch
+        :return: None
+        """
+        with self._prefetch_lock:
+            entry = self._prefetched.pop(key, None)
+            if entry is not None:
+                entry[1].cancel()
+                self.speculation_stats["discarded"] += 1
+    
+    def expire_prefetched(self):
+        """
+        Descarta las recuperaciones especulativas vencidas (se llama en cada búsqueda,
+        para que las abandonadas no retengan sus documentos en memoria).
+
+        :return: None
+        """
+        with self._prefetch_lock:
+            self._expire_prefetched()
+
+    def _expire_prefetched(self):
+        # Debe llamarse con _prefetch_lock tomado
+        now = time.monotonic()
+        for key, (started_at, future) in list(self._prefetched.items()):
+            if now - started_at > Config.PREFETCH_TTL_SECONDS:
+                future.cancel()
+                del self._prefetched[key]
+                self.speculation_stats["expired"] += 1
+    
+    def _take_prefetched(self, key):
+        """
+        Toma los documentos de una recuperación especulativa con la misma clave, si existe.
+
+        :param key: Clave de recuperación
+        :return: Lista de Document o None si no hay (o falló)
+        """
+        with self._prefetch_lock:
+            self._expire_prefetched()
+            entry = self._prefetched.pop(key, None)
+        if entry is None:
+            return None
+        try:
+            # Acotado por el plazo de la solicitud: una recuperación colgada no retiene la búsqueda
+            docs = entry[1].result(timeout=timeout_for(Config.PREFETCH_TTL_SECONDS, floor_seconds=0))
+        except FutureTimeoutError:
+            entry[1].cancel()
+            print("Recuperación especulativa sin terminar dentro del plazo, se repite")
+            return None
+        except Exception as e:
+            print(f"Recuperación especulativa fallida, se repite: {e}")
+            return None
+        with self._prefetch_lock:
+            self.speculation_stats["used"] += 1
+        print(f"Usando recuperación especulativa: {len(docs)} documentos")
+        return docs
+    
+    async def asearch(self, query, locality=None):
+        """
+        Versión asíncrona de search.
+
+        Las búsquedas de cada especialidad corren en paralelo en el executor del
+        event loop (Chroma es bloqueante) y la respuesta se genera con ainvoke.
+
+        :param query: String o dict con la consulta (incluye medical_specialty)
+        :param locality: Localidad para restringir la búsqueda (opcional)
+        :return: Texto con la respuesta formateada o mensaje de error
+        """
+        try:
+            self.expire_prefetched()
+            canonical_specialties, specialty_queries = self._extract_specialty_queries(query)
+            capture_value("rag.specialties", canonical_specialties)
+            capture_value("rag.index_version", self.index_version)
+            retrieval_key = self.retrieval_key(canonical_specialties, specialty_queries, locality)
+            cache_key = retrieval_key if canonical_specialties else None
+            if cache_key is not None:
+                cached_answer = _answer_cache.get(cache_key)
+                if cached_answer is not None:
+                    capture_value("rag.answer_cache", "hit")
+                    return cached_answer
+            
+            return await _async_search_flight.do(
+                retrieval_key,
+                lambda: self._aanswer(query, locality, canonical_specialties, specialty_queries, cache_key)
+            )
         except Exception as e:
+            if deadline_expired():
+                # Con el plazo vencido el error se propaga: la etapa usa su variante degradada (DeadlineHook)
+                raise
             print(f"Error en búsqueda: {e}")
             return f"Error en búsqueda: {str(e)}"
     
-    def _extract_specialty_queries(self, query):
+    async def _aanswer(self, query, locality, canonical_specialties, specialty_queries, cache_key):
+        """
+        Versión asíncrona de _answer.
+
+        :param query: Consulta original (JSON con medical_specialty)
+        :param locality: Localidad para restringir la búsqueda (opcional)
+        :param canonical_specialties: Especialidades canónicas reconocidas
+        :param specialty_queries: Consultas vectoriales de especialidades no reconocidas
+        :param cache_key: Clave del caché de respuestas o None si no es cacheable
+        :return: Texto con la respuesta formateada
+        """
+        loop = asyncio.get_running_loop()
+        where = self._location_filter(locality)
+        
+        all_docs = await self._acollect_documents_by_specialty(specialty_queries, where, canonical_specialties)
+        if not all_docs and where is not None:
+            all_docs = await self._acollect_documents_by_specialty(specialty_queries, None, canonical_specialties)
+        
+        if not all_docs:
+            all_docs = await loop.run_in_executor(None, contextvars.copy_context().run, self._general_search, where)
+            if not all_docs and where is not None:
+                all_docs = await loop.run_in_executor(None, contextvars.copy_context().run, self._general_search)
+        capture_value("rag.rows", [doc.metadata.get("row_index") for doc in all_docs])
+        
+        if not all_docs:
+            answer = "No se encontraron resultados para esta búsqueda."
+        else:
+            result = await self.processor.aquery_with_specific_docs(query, all_docs)
+            answer = result["answer"]
+        
+        if cache_key is not None:
+            _answer_cache.set(cache_key, answer)
+        return answer
+    
+    async def _acollect_documents_by_specialty(self, specialty_queries, where=None, canonical_specialties=()):
         """
-        Extrae especialidades del JSON de entrada y crea consultas específicas.
+        Versión asíncrona de _collect_documents_by_specialty: una tarea por especialidad.
+
+        :param specialty_queries: Lista de términos de búsqueda por especialidad
+        :param where: Filtro de metadata aplicado antes de la búsqueda (opcional)
+        :param canonical_specialties: Especialidades ya normalizadas (opcional)
+        :return: Lista de Document relevantes, ordenada por puntaje y acotada por presupuesto de tokens
+        """
+        loop = asyncio.get_running_loop()
+        
+        def canonical_lookup(specialty):
+            return self._exact_specialty_documents(specialty, where) or self._scored_search(specialty, where)
+        
+        # copy_context: el plazo y la traza de la solicitud deben llegar a los hilos del executor
+        tasks = [
+            loop.run_in_executor(None, contextvars.copy_context().run, canonical_lookup, specialty)
+            for specialty in canonical_specialties
+        ]
+        tasks += [
+            loop.run_in_executor(None, contextvars.copy_context().run, self._scored_search, query, where)
+            for query in specialty_queries
+        ]
+        
+        best = {}
+        for outcome in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(outcome, Exception):
+                print(f"Error buscando especialidad: {outcome}")
+                continue
+            self._merge_scored(outcome, best)
+        return self._select_by_budget(list(best.values()))
+    
+    @staticmethod
+    def _parse_specialties(query):
+        """
+        Extrae la lista de especialidades del campo medical_specialty de la consulta.
 
         :param query: Cadena o dict con la consulta original
-        :return: Lista de términos de búsqueda por especialidad
+        :return: Lista de especialidades (vacía si no hay) o None si la consulta no pudo procesarse
         """
         import json
         import re
         
-        specialty_queries = []
-        
         try:
             # Intentar parsear como JSON
             if isinstance(query, str):
@@ -411,65 +1099,190 @@ class SearchService:
             else:
                 json_data = query if isinstance(query, dict) else {}
             
-            # Extraer especialidades
-            if "medical_specialty" in json_data:
-                specialty = json_data["medical_specialty"]
-                if isinstance(specialty, str):
-                    specialties = [s.strip().upper() for s in specialty.split(',')]
-                elif isinstance(specialty, list):
-                    specialties = [s.strip().upper() for s in specialty]
-                else:
-                    specialties = [str(specialty).strip().upper()]
-                
-                # Crear consultas específicas por especialidad
-                for spec in specialties:
-                    if spec:
-                        specialty_queries.append(spec)
-                        specialty_queries.append(f"especialidad {spec}")
-                        specialty_queries.append(f"prestadores {spec}")
-            
+            if "medical_specialty" not in json_data:
+                return []
+            specialty = json_data["medical_specialty"]
+            if isinstance(specialty, str):
+                specialties = specialty.split(',')
+            elif isinstance(specialty, list):
+                specialties = specialty
+            else:
+                specialties = [specialty]
+            return [str(s).strip() for s in specialties if str(s).strip()]
         except (json.JSONDecodeError, Exception) as e:
             print(f"Error procesando JSON: {e}")
+            return None
+    
+    def _extract_specialty_queries(self, query):
+        """
+        Extrae especialidades del JSON de entrada, las normaliza a los valores
+        canónicos del dataset y crea consultas específicas para las no reconocidas.
+
+        :param query: Cadena o dict con la consulta original
+        :return: Tupla (especialidades canónicas, lista de términos de búsqueda para las no reconocidas)
+        """
+        specialties = self._parse_specialties(query)
+        if specialties is None:
             # Si falla el parsing, usar la consulta original
-            specialty_queries.append(str(query))
+            return [], [str(query)]
+        
+        canonical, unresolved = self.specialty_normalizer.normalize_many(specialties)
+        specialty_queries = []
+        
+        # Crear consultas específicas por especialidad no reconocida
+        for spec in unresolved:
+            spec = spec.upper()
+            specialty_queries.append(spec)
+            specialty_queries.append(f"especialidad {spec}")
+            specialty_queries.append(f"prestadores {spec}")
         
         # Si no se encontraron especialidades, usar consulta original
-        if not specialty_queries:
+        if not canonical and not specialty_queries:
             specialty_queries.append(str(query))
         
-        return specialty_queries
+        return canonical, specialty_queries
+    
+    @staticmethod
+    def _combine_filters(*clauses):
+        """
+        Combina filtros de metadata de Chroma con $and, ignorando los vacíos.
+
+        :param clauses: Filtros (dict o None)
+        :return: Filtro combinado o None
+        """
+        clauses = [clause for clause in clauses if clause]
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
     
-    def _collect_documents_by_specialty(self, specialty_queries):
+    def _exact_specialty_documents(self, specialty, where=None):
+        """
+        Obtiene los documentos de una especialidad canónica por filtro de metadata,
+        sin calcular embeddings ni búsqueda vectorial.
+
+        :param specialty: Valor canónico de la especialidad
+        :param where: Filtro adicional (p. ej. localidad) (opcional)
+        :return: Lista de tuplas (Document, 1.0)
+        """
+        with span("retriever.exact", specialty=specialty):
+            result = self.processor.vectorstore.get(
+                where=self._combine_filters({"especialidad": specialty}, where),
+                limit=Config.EXACT_MATCH_LIMIT,
+                include=["documents", "metadatas"]
+            )
+        return [
+            (Document(page_content=content, metadata=metadata or {}), 1.0)
+            for content, metadata in zip(result.get("documents") or [], result.get("metadatas") or [])
+        ]
+    
+    def _scored_search(self, query, where=None):
+        """
+        Ejecuta una búsqueda por similitud devolviendo documentos con su puntaje.
+
+        :param query: Texto de búsqueda
+        :param where: Filtro de metadata de Chroma aplicado antes de la búsqueda (opcional)
+        :return: Lista de tuplas (Document, puntaje de relevancia en [0, 1])
+        """
+        # El registro de uso del embedding de la consulta incluye el tiempo de la búsqueda en Chroma
+        with span("retriever.vector", query=query), model_call("embedding", Config.EMBEDDING_MODEL) as usage:
+            usage.update(prompt_tokens=estimate_tokens(query), estimated=True)
+            return self.processor.vectorstore.similarity_search_with_relevance_scores(
+                query, k=self.processor.search_k, filter=where
+            )
+
+    @staticmethod
+    def _merge_scored(scored_docs, best):
+        """
+        Acumula documentos puntuados conservando el mejor puntaje por documento.
+
+        :param scored_docs: Iterable de tuplas (Document, puntaje)
+        :param best: Diccionario doc_id -> (Document, puntaje) a actualizar
+        :return: None
+        """
+        for doc, score in scored_docs:
+            doc_id = f"{doc.metadata.get('row_index', '')}-{doc.page_content[:100]}"
+            if doc_id not in best or score > best[doc_id][1]:
+                best[doc_id] = (doc, score)
+
+    @staticmethod
+    def _select_by_budget(scored_docs, min_score=None, token_budget=None):
+        """
+        Filtra por umbral de relevancia, ordena por puntaje y recorta por presupuesto de tokens.
+
+        Siempre se conserva al menos el documento mejor puntuado que supere el umbral.
+
+        :param scored_docs: Lista de tuplas (Document, puntaje)
+        :param min_score: Puntaje mínimo (por defecto Config.MIN_RELEVANCE_SCORE)
+        :param token_budget: Tokens máximos del contexto (por defecto Config.CONTEXT_TOKEN_BUDGET)
+        :return: Lista de Document ordenada por relevancia (puntaje en metadata["relevance_score"])
+        """
+        min_score = Config.MIN_RELEVANCE_SCORE if min_score is None else min_score
+        token_budget = token_budget or Config.CONTEXT_TOKEN_BUDGET
+        ranked = sorted(
+            (item for item in scored_docs if item[1] >= min_score),
+            key=lambda item: item[1],
+            reverse=True
+        )
+        # Se mide el contexto que realmente se envía: filas compactas, encabezado una vez y sin duplicados
+        selected = []
+        seen = set()
+        used_tokens = estimate_tokens(_context_builder.header())
+        for doc, score in ranked:
+            line, key = _context_builder.row(doc)
+            tokens = 0 if key is not None and key in seen else estimate_tokens(line)
+            if selected and used_tokens + tokens > token_budget:
+                break
+            if key is not None:
+                seen.add(key)
+            doc.metadata["relevance_score"] = round(float(score), 4)
+            selected.append(doc)
+            used_tokens += tokens
+        return selected
+
+    def _collect_documents_by_specialty(self, specialty_queries, where=None, canonical_specialties=()):
         """
         Recopila documentos basados en las especialidades extraídas.
 
+        Las especialidades canónicas se resuelven por coincidencia exacta de
+        metadata; solo las no reconocidas pasan por búsqueda vectorial.
+
         :param specialty_queries: Lista de términos de búsqueda por especialidad
-        :return: Lista de Document relevantes (máx. 15)
+        :param where: Filtro de metadata (p. ej. localidad) aplicado antes de la búsqueda (opcional)
+        :param canonical_specialties: Especialidades ya normalizadas a valores del dataset (opcional)
+        :return: Lista de Document relevantes, ordenada por puntaje y acotada por presupuesto de tokens
         """
-        all_docs = []
-        seen_docs = set()
+        best = {}
+        
+        for specialty in canonical_specialties:
+            try:
+                exact_docs = self._exact_specialty_documents(specialty, where)
+                if not exact_docs:
+                    # Índices sin metadata de especialidad: recurrir a la búsqueda vectorial
+                    exact_docs = self._scored_search(specialty, where)
+                print(f"Especialidad canónica '{specialty}': {len(exact_docs)} documentos")
+                self._merge_scored(exact_docs, best)
+            except Exception as e:
+                print(f"Error buscando especialidad canónica '{specialty}': {e}")
         
         for query in specialty_queries:
             try:
-                docs = self.processor.retriever.invoke(query)
-                print(f"Especialidad '{query}': {len(docs)} documentos")
-                
-                for doc in docs:
-                    doc_id = f"{doc.metadata.get('row_index', '')}-{doc.page_content[:100]}"
-                    if doc_id not in seen_docs:
-                        all_docs.append(doc)
-                        seen_docs.add(doc_id)
-                        
+                scored_docs = self._scored_search(query, where)
+                print(f"Especialidad '{query}': {len(scored_docs)} documentos")
+                self._merge_scored(scored_docs, best)
             except Exception as e:
                 print(f"Error buscando especialidad '{query}': {e}")
         
-        return all_docs[:15]  # Limitar a 15 documentos
+        return self._select_by_budget(list(best.values()))
     
-    def _general_search(self):
+    def _general_search(self, where=None):
         """
         Ejecuta una búsqueda general cuando no hay especialidades específicas.
 
-        :return: Lista de Document relevantes (máx. 15)
+        No aplica umbral de relevancia (es el último recurso), pero sí ordena
+        por puntaje y acota por presupuesto de tokens.
+
+        :param where: Filtro de metadata aplicado antes de la búsqueda (opcional)
+        :return: Lista de Document relevantes
         """
         general_queries = [
             "prestadores de salud",
@@ -478,31 +1291,42 @@ class SearchService:
             "doctores"
         ]
         
-        all_docs = []
-        seen_docs = set()
+        best = {}
         
         for query in general_queries:
             try:
-                docs = self.processor.retriever.invoke(query)
-                print(f"Búsqueda general '{query}': {len(docs)} documentos")
-                
-                for doc in docs:
-                    doc_id = f"{doc.metadata.get('row_index', '')}-{doc.page_content[:100]}"
-                    if doc_id not in seen_docs:
-                        all_docs.append(doc)
-                        seen_docs.add(doc_id)
+                scored_docs = self._scored_search(query, where)
+                print(f"Búsqueda general '{query}': {len(scored_docs)} documentos")
+                self._merge_scored(scored_docs, best)
                 
                 # Si encontramos documentos, salir del bucle
-                if all_docs:
+                if best:
                     break
                     
             except Exception as e:
                 print(f"Error en búsqueda general '{query}': {e}")
         
-        return all_docs[:15]
+        return self._select_by_budget(list(best.values()), min_score=0.0)
 
 # Instancia global del servicio
 _health_service = None
+_health_service_lock = threading.Lock()
+
+# Caché de respuestas compartido entre instancias; se vacía al reemplazar el índice
+_answer_cache = TTLLRUCache(
+    max_entries=Config.ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=Config.ANSWER_CACHE_TTL_SECONDS
+)
+
+# Agrupa búsquedas idénticas en curso (ver SearchService.search y asearch)
+_search_flight = SingleFlight()
+_async_search_flight = AsyncSingleFlight()
+
+# Contexto compacto del prompt; también mide el presupuesto de tokens (ver _select_by_budget)
+_context_builder = CompactContextBuilder(Config.CONTEXT_FIELDS)
+
+# Hilos para recuperaciones especulativas (ver SearchService.prefetch)
+_prefetch_executor = ThreadPoolExecutor(max_workers=Config.PREFETCH_WORKERS, thread_name_prefix="prefetch")
 
 def get_health_service():
     """
@@ -512,15 +1336,45 @@ def get_health_service():
     """
     global _health_service
     if _health_service is None:
-        _health_service = SearchService()
+        with _health_service_lock:
+            if _health_service is None:
+                _health_service = SearchService()
     return _health_service
 
-def query_contacts_with_langchain(input_text):
+def set_health_service(service):
+    """
+    Reemplaza atómicamente la instancia singleton del servicio de salud.
+
+    Las consultas en curso conservan su referencia al servicio anterior y
+    terminan sobre el índice anterior; las nuevas usan el servicio recibido,
+    que debe estar completamente inicializado.
+
+    :param service: Instancia de SearchService ya inicializada
+    :return: Instancia anterior (o None)
+    """
+    global _health_service
+    with _health_service_lock:
+        previous = _health_service
+        _health_service = service
+    _answer_cache.clear()
+    return previous
+
+def get_answer_cache():
+    """
+    Devuelve el caché de respuestas de búsqueda (para métricas o limpieza manual).
+
+    :return: Instancia de TTLLRUCache
+    """
+    return _answer_cache
+
+def query_contacts_with_langchain(input_text, locality=None, render="llm"):
     """
     Función de compatibilidad para consultar prestadores.
 
     :param input_text: Consulta en formato texto o JSON
+    :param locality: Localidad para restringir la búsqueda (opcional)
+    :param render: "llm" o "template" (respuesta por plantilla, sin GPT)
     :return: Respuesta formateada con la lista de prestadores
     """
     service = get_health_service()
-    return service.search(input_text)
+    return service.search(input_text, locality=locality, render=render)
@@ -0,0 +1,165 @@
+"""
+Recarga en caliente del dataset de prestadores.
+
+Un hilo en segundo plano vigila el archivo del dataset que se indexa
+(Config.EXCEL_PATH) y el directorio de snapshots. Cuando detecta cambios
+construye (o simplemente abre) el nuevo índice, lo precalienta y reemplaza
+atómicamente el SearchService singleton. Las consultas en curso terminan sobre
+el índice anterior. Si varias réplicas detectan el mismo cambio, solo una
+construye (lock por dataset); las demás abren el snapshot cuando se publica.
+"""
+import os
+import glob
+import threading
+from .rag_utils import (
+    Config,
+    SearchService,
+    build_index_snapshot,
+    get_health_service,
+    set_health_service
+)
+from .index_utils import BuildInProgress, file_fingerprint, list_snapshots, prune_snapshots
+
+def dataset_fingerprint(pattern):
+    """
+    Calcula una huella liviana (nombre, tamaño, mtime) de los archivos del dataset.
+
+    :param pattern: Patrón glob de los archivos a vigilar
+    :return: Tupla ordenada con la huella de cada archivo
+    """
+    fingerprint = []
+    for path in sorted(glob.glob(pattern)):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        fingerprint.append((path, stat.st_size, stat.st_mtime_ns))
+    return tuple(fingerprint)
+
+class DatasetWatcher:
+    """
+    Vigila el dataset y los snapshots del índice y reemplaza el servicio al cambiar.
+
+    :param excel_path: Archivo del dataset que se indexa (por defecto Config.EXCEL_PATH)
+    :param poll_seconds: Intervalo de sondeo en segundos
+    :param snapshots_dir: Directorio raíz de snapshots
+    """
+    def __init__(self, excel_path=None, poll_seconds=None, snapshots_dir=None):
+        self.excel_path = excel_path or Config.EXCEL_PATH
+        self.pattern = glob.escape(self.excel_path)
+        self.poll_seconds = poll_seconds or Config.DATASET_POLL_SECONDS
+        self.snapshots_dir = snapshots_dir or Config.INDEX_SNAPSHOTS_DIR
+        self._stop = threading.Event()
+        self._thread = None
+        self._seen = dataset_fingerprint(self.pattern)
+        self._pending = None
+
+    def start(self):
+        """
+        Inicia el hilo de vigilancia (daemon).
+
+        :return: None
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="dataset-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Detiene el hilo de vigilancia.
+
+        :return: None
+        """
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Error en recarga del dataset: {e}")
+
+    def _newest_snapshot(self):
+        snapshots = list_snapshots(self.snapshots_dir)
+        return snapshots[-1][1] if snapshots else None
+
+    def check(self):
+        """
+        Revisa si hay un snapshot más nuevo o un dataset modificado y recarga.
+
+        Un cambio en el dataset solo se procesa cuando su huella se mantiene
+        estable durante dos sondeos consecutivos (archivo terminado de copiar).
+
+        :return: True si se reemplazó el servicio
+        """
+        current = get_health_service()
+
+        # 1) Otro proceso publicó un snapshot más nuevo: solo abrirlo
+        newest = self._newest_snapshot()
+        if newest is not None and newest["version"] != current.index_version:
+            return self._swap()
+
+        # 2) El dataset cambió: construir un snapshot nuevo en segundo plano
+        fingerprint = dataset_fingerprint(self.pattern)
+        if fingerprint == self._seen:
+            self._pending = None
+            return False
+        if fingerprint != self._pending:
+            self._pending = fingerprint
+            return False
+        if not Config.ALLOW_RUNTIME_INDEX_BUILD:
+            print("Dataset modificado, pero la construcción en tiempo de ejecución está deshabilitada")
+            self._seen = fingerprint
+            return False
+
+        previous, self._seen = self._seen, fingerprint
+        self._pending = None
+        if newest is not None and newest.get("dataset", {}).get("sha256") == file_fingerprint(self.excel_path):
+            # Solo cambió la fecha del archivo, u otra réplica ya publicó este dataset
+            return False
+
+        print("Dataset modificado: construyendo nuevo índice en segundo plano...")
+        try:
+            build_index_snapshot(self.excel_path, self.snapshots_dir)
+        except BuildInProgress as e:
+            # Otra réplica construye el mismo dataset: se abrirá en el paso 1 cuando lo publique
+            print(e)
+            return False
+        except Exception:
+            # Se reintenta en el próximo sondeo
+            self._seen = previous
+            raise
+        swapped = self._swap()
+        prune_snapshots(self.snapshots_dir, Config.SNAPSHOTS_TO_KEEP)
+        return swapped
+
+    def _swap(self):
+        """
+        Abre el snapshot más reciente, lo precalienta y reemplaza el singleton.
+
+        :return: True si se reemplazó el servicio
+        """
+        service = SearchService(snapshots_dir=self.snapshots_dir)
+        service.warmup()
+        previous = set_health_service(service)
+        print(f"Índice reemplazado: {getattr(previous, 'index_version', None)} -> {service.index_version}")
+        return True
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+def start_dataset_watcher():
+    """
+    Inicia (una sola vez por proceso) el vigilante del dataset si está habilitado.
+
+    :return: Instancia de DatasetWatcher o None si la recarga está deshabilitada
+    """
+    global _watcher
+    if not Config.DATASET_HOT_RELOAD:
+        return None
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = DatasetWatcher()
+            _watcher.start()
+    return _watcher
@@ -1,6 +1,9 @@
 import spacy
 import streamlit as st
 import warnings
+from .metrics_utils import span
+from .memory_utils import profile_memory
+from . import model_client
 
 # Silenciar FutureWarning específico de spaCy
 warnings.filterwarnings(
@@ -11,6 +14,7 @@ warnings.filterwarnings(
 )
 
 @st.cache_resource
+@profile_memory("load.scispacy")
 def load_model():
     """
     Carga el modelo NER de SciSpaCy utilizado para extracción de entidades.
@@ -20,16 +24,22 @@ def load_model():
     model = spacy.load("en_core_sci_sm")
     return model
 
-ner_nlp = load_model()
+def preload_model():
+    """
+    Carga el modelo NER por adelantado (salvo que se use el servidor de modelos compartido).
 
-def extract_entities_with_spacy(input_text):
+    :return: None
     """
-    Extrae entidades nombradas del texto usando el modelo NER cargado.
+    if not model_client.enabled():
+        load_model()
 
-    :param input_text: Texto de entrada del cual extraer entidades
-    :return: Cadena con las entidades detectadas separadas por coma o mensaje si no hay
+def _format_entities(doc):
+    """
+    Une las entidades de un documento de spaCy separadas por coma.
+
+    :param doc: Documento procesado por el modelo NER
+    :return: Cadena con las entidades o mensaje si no hay
     """
-    doc = ner_nlp(input_text)
     entidades = ""
     for entity in doc.ents:
         entidades += entity.text + ", "
@@ -37,4 +47,34 @@ def extract_entities_with_spacy(input_text):
         respuesta = "No se detectaron síntomas claros."
     else:
         respuesta = entidades[:-2]
-    return respuesta
\ No newline at end of file
+    return respuesta
+
+def extract_entities_with_spacy(input_text):
+    """
+    Extrae entidades nombradas del texto usando el modelo NER cargado.
+
+    :param input_text: Texto de entrada del cual extraer entidades
+    :return: Cadena con las entidades detectadas separadas por coma o mensaje si no hay
+    """
+    if model_client.enabled():
+        with span("spacy", chars=len(input_text), mode="shared"):
+            return model_client.request("entities", text=input_text)["result"]
+    with span("spacy", chars=len(input_text)):
+        doc = load_model()(input_text)
+    return _format_entities(doc)
+
+def extract_entities_batch_with_spacy(input_texts, batch_size=32):
+    """
+    Versión por lotes de extract_entities_with_spacy (usa nlp.pipe).
+
+    :param input_texts: Lista de textos de entrada
+    :param batch_size: Textos por lote interno de spaCy
+    :return: Lista de cadenas de entidades, en el mismo orden
+    """
+    chars = sum(len(text) for text in input_texts)
+    if model_client.enabled():
+        with span("spacy", texts=len(input_texts), chars=chars, mode="shared"):
+            return model_client.request("entities_batch", texts=input_texts, batch_size=batch_size)["result"]
+    with span("spacy", texts=len(input_texts), chars=chars):
+        docs = list(load_model().pipe(input_texts, batch_size=batch_size))
+    return [_format_entities(doc) for doc in docs]
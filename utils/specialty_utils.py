@@ -0,0 +1,299 @@
+"""
+Normalización de especialidades médicas.
+
+Convierte la especialidad que produce el LLM ("Cardiólogo", "CARDIOLOGY",
+"cardiologia ") en el valor canónico tal como figura en el dataset
+("CARDIOLOGÍA"), usando en orden:
+
+1. coincidencia exacta sin tildes ni mayúsculas,
+2. tabla de sinónimos (profesional/inglés -> especialidad),
+3. reglas morfológicas (-ólogo/-ology -> -ología, -iatra -> -iatría),
+4. forma compuesta del dataset que contiene la especialidad ("GINECOLOGÍA Y
+   OBSTETRICIA"), eligiendo la más cercana,
+5. índice de trigramas (coeficiente de Dice) para errores de tipeo.
+
+Una coincidencia difusa (5) solo se acepta si no es ambigua: supera el umbral
+y aventaja claramente a la segunda candidata. Como especialidades distintas
+comparten casi todo el texto ("hematología"/"hepatología"), la similitud se
+calcula sin el sufijo común; el resto sigue por la búsqueda vectorial.
+
+El índice se arma una sola vez a partir de los valores distintos de la columna
+de especialidad (disponibles en cada snapshot del índice).
+"""
+import re
+import threading
+from .text_utils import normalize_text
+
+# Especialidades resueltas recordadas por instancia (las entradas más antiguas se descartan)
+_MEMO_MAX_ENTRIES = 4096
+
+# Variante (sin tildes, minúsculas) -> especialidad (sin tildes, minúsculas)
+SPECIALTY_SYNONYMS = {
+    "cardiologo": "cardiologia", "cardiology": "cardiologia", "cardiologist": "cardiologia",
+    "neurologo": "neurologia", "neurology": "neurologia", "neurologist": "neurologia",
+    "dermatologo": "dermatologia", "dermatology": "dermatologia", "dermatologist": "dermatologia",
+    "pediatra": "pediatria", "pediatrics": "pediatria", "pediatrician": "pediatria",
+    "traumatologo": "traumatologia", "orthopedics": "traumatologia", "orthopedist": "traumatologia",
+    "traumatology": "traumatologia", "ortopedia": "traumatologia",
+    "ginecologo": "ginecologia", "gynecology": "ginecologia", "gynecologist": "ginecologia",
+    "obstetrics": "obstetricia", "obstetra": "obstetricia",
+    "oftalmologo": "oftalmologia", "ophthalmology": "oftalmologia", "ophthalmologist": "oftalmologia",
+    "oculista": "oftalmologia",
+    "otorrino": "otorrinolaringologia", "otorrinolaringologo": "otorrinolaringologia",
+    "otolaryngology": "otorrinolaringologia", "ent": "otorrinolaringologia",
+    "gastroenterologo": "gastroenterologia", "gastroenterology": "gastroenterologia",
+    "psiquiatra": "psiquiatria", "psychiatry": "psiquiatria", "psychiatrist": "psiquiatria",
+    "psicologo": "psicologia", "psychology": "psicologia", "psychologist": "psicologia",
+    "urologo": "urologia", "urology": "urologia", "urologist": "urologia",
+    "endocrinologo": "endocrinologia", "endocrinology": "endocrinologia",
+    "neumologo": "neumonologia", "neumonologo": "neumonologia", "neumologia": "neumonologia",
+    "pulmonology": "neumonologia", "pulmonologist": "neumonologia",
+    "reumatologo": "reumatologia", "rheumatology": "reumatologia",
+    "nefrologo": "nefrologia", "nephrology": "nefrologia",
+    "oncologo": "oncologia", "oncology": "oncologia",
+    "hematologo": "hematologia", "hematology": "hematologia",
+    "infectologo": "infectologia", "infectious diseases": "infectologia",
+    "kinesiologo": "kinesiologia", "physiotherapy": "kinesiologia", "fisioterapia": "kinesiologia",
+    "nutricionista": "nutricion", "nutrition": "nutricion",
+    "odontologo": "odontologia", "dentista": "odontologia", "dentistry": "odontologia",
+    "alergista": "alergia", "allergy": "alergia", "alergologia": "alergia",
+    "geriatra": "geriatria", "geriatrics": "geriatria",
+    "fonoaudiologo": "fonoaudiologia", "speech therapy": "fonoaudiologia",
+    "cirujano": "cirugia general", "surgery": "cirugia general", "general surgery": "cirugia general",
+    "medico clinico": "clinica medica", "clinico": "clinica medica", "medicina interna": "clinica medica",
+    "internal medicine": "clinica medica", "general practice": "clinica medica",
+    "medicina general": "clinica medica", "medico general": "clinica medica",
+}
+
+# Reglas morfológicas aplicadas cuando no hay sinónimo explícito
+_MORPHOLOGY_RULES = [
+    (re.compile(r"olog[oa]s?$"), "ologia"),
+    (re.compile(r"ology$"), "ologia"),
+    (re.compile(r"ologist$"), "ologia"),
+    (re.compile(r"iatras?$"), "iatria"),
+]
+
+def _strip_common_suffix(first, second):
+    """
+    Quita el sufijo común de dos textos ("-ología" en "hematologia"/"hepatologia").
+
+    :param first: Texto normalizado
+    :param second: Texto normalizado
+    :return: Tupla con los dos textos sin el sufijo común
+    """
+    size = 0
+    limit = min(len(first), len(second))
+    while size < limit and first[-1 - size] == second[-1 - size]:
+        size += 1
+    if size == 0:
+        return first, second
+    return first[:-size], second[:-size]
+
+def _dice(first, second):
+    """
+    Coeficiente de Dice entre los trigramas de dos textos, sin su sufijo común.
+
+    :param first: Texto normalizado
+    :param second: Texto normalizado
+    :return: Flotante entre 0 y 1
+    """
+    first, second = _strip_common_suffix(first, second)
+    if not first and not second:
+        return 1.0
+    first_grams, second_grams = _trigrams(first), _trigrams(second)
+    return 2.0 * len(first_grams & second_grams) / (len(first_grams) + len(second_grams))
+
+def _trigrams(text):
+    """
+    Devuelve el conjunto de trigramas de un texto (con relleno en los bordes).
+
+    :param text: Texto ya normalizado
+    :return: Conjunto de trigramas
+    """
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class SpecialtyNormalizer:
+    """
+    Mapea especialidades arbitrarias a los valores canónicos del dataset.
+
+    :param canonical_values: Valores distintos de la columna de especialidad
+    :param synonyms: Tabla de sinónimos (por defecto SPECIALTY_SYNONYMS)
+    :param min_similarity: Coeficiente de Dice mínimo (sin el sufijo común) para una coincidencia difusa
+    :param min_margin: Ventaja mínima de la mejor candidata difusa sobre la segunda
+    """
+    def __init__(self, canonical_values, synonyms=None, min_similarity=0.7, min_margin=0.1):
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.synonyms = {normalize_text(k): normalize_text(v) for k, v in (synonyms or SPECIALTY_SYNONYMS).items()}
+        self.canonical = {}
+        for value in canonical_values:
+            if value:
+                self.canonical.setdefault(normalize_text(value), value)
+        self._keys = list(self.canonical)
+        self._key_trigrams = [_trigrams(key) for key in self._keys]
+        self._trigram_index = {}
+        for position, grams in enumerate(self._key_trigrams):
+            for gram in grams:
+                self._trigram_index.setdefault(gram, []).append(position)
+        self._memo = {}
+        self._memo_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.canonical)
+
+    def _fuzzy(self, key):
+        """
+        Busca la clave canónica más parecida: el índice de trigramas acota los
+        candidatos y cada uno se compara sin el sufijo común, para que "-ología"
+        no infle la similitud.
+
+        :param key: Texto normalizado
+        :return: Clave canónica o None si ninguna supera el umbral o la coincidencia es ambigua
+        """
+        candidates = set()
+        for gram in _trigrams(key):
+            candidates.update(self._trigram_index.get(gram, ()))
+        best, best_score, runner_up = None, 0.0, 0.0
+        for position in sorted(candidates):
+            score = _dice(key, self._keys[position])
+            if score > best_score:
+                best, best_score, runner_up = position, score, best_score
+            elif score > runner_up:
+                runner_up = score
+        if best is None or best_score < self.min_similarity or best_score - runner_up < self.min_margin:
+            return None
+        return self._keys[best]
+
+    def _resolve_key(self, key):
+        """
+        Resuelve una clave normalizada a una clave canónica.
+
+        :param key: Texto normalizado
+        :return: Clave canónica o None
+        """
+        if key in self.canonical:
+            return key
+        candidates = []
+        if key in self.synonyms:
+            candidates.append(self.synonyms[key])
+        for pattern, replacement in _MORPHOLOGY_RULES:
+            if pattern.search(key):
+                candidates.append(pattern.sub(replacement, key))
+        for candidate in candidates:
+            if candidate in self.canonical:
+                return candidate
+        # El dataset puede usar una forma compuesta ("GINECOLOGÍA Y OBSTETRICIA"):
+        # se elige la más cercana (la que menos texto agrega)
+        for candidate in candidates + [key]:
+            if len(candidate) < 4:
+                continue
+            pattern = re.compile(rf"\b{re.escape(candidate)}\b")
+            compounds = [canonical_key for canonical_key in self._keys if pattern.search(canonical_key)]
+            if compounds:
+                return min(compounds, key=len)
+        for candidate in candidates + [key]:
+            fuzzy = self._fuzzy(candidate)
+            if fuzzy is not None:
+                return fuzzy
+        return None
+
+    def normalize(self, value):
+        """
+        Devuelve el valor canónico del dataset para una especialidad.
+
+        :param value: Especialidad producida por el LLM u otra fuente
+        :return: Valor canónico (tal como figura en el dataset) o None si no se reconoce
+        """
+        key = normalize_text(value)
+        if not key:
+            return None
+        with self._memo_lock:
+            if key in self._memo:
+                return self._memo[key]
+        resolved = self._resolve_key(key)
+        canonical = self.canonical[resolved] if resolved is not None else None
+        with self._memo_lock:
+            if len(self._memo) >= _MEMO_MAX_ENTRIES:
+                self._memo.pop(next(iter(self._memo)))
+            self._memo[key] = canonical
+        return canonical
+
+    def normalize_many(self, values):
+        """
+        Normaliza una lista de especialidades, sin duplicados y preservando el orden.
+
+        :param values: Lista de especialidades
+        :return: Tupla (canónicas reconocidas, valores no reconocidos)
+        """
+        canonical, unresolved = [], []
+        for value in values:
+            resolved = self.normalize(value)
+            if resolved is None:
+                if value and value not in unresolved:
+                    unresolved.append(value)
+            elif resolved not in canonical:
+                canonical.append(resolved)
+        return canonical, unresolved
+
+# Gazetteer de síntomas (sin tildes, minúsculas) -> especialidad, para la extracción
+# degradada sin LLM cuando no alcanza el presupuesto de latencia
+SYMPTOM_GAZETTEER = {
+    "pecho": "Cardiología", "palpitaciones": "Cardiología", "presion alta": "Cardiología",
+    "taquicardia": "Cardiología", "hipertension": "Cardiología",
+    "cabeza": "Neurología", "migrana": "Neurología", "mareo": "Neurología", "convulsion": "Neurología",
+    "hormigueo": "Neurología", "vertigo": "Otorrinolaringología",
+    "piel": "Dermatología", "granos": "Dermatología", "acne": "Dermatología", "sarpullido": "Dermatología",
+    "picazon": "Dermatología", "manchas": "Dermatología", "lunar": "Dermatología",
+    "estomago": "Gastroenterología", "diarrea": "Gastroenterología", "vomito": "Gastroenterología",
+    "nauseas": "Gastroenterología", "acidez": "Gastroenterología", "abdomen": "Gastroenterología",
+    "tos": "Neumología", "falta de aire": "Neumología", "asma": "Neumología", "pulmon": "Neumología",
+    "ojo": "Oftalmología", "ojos": "Oftalmología", "vision": "Oftalmología", "vista": "Oftalmología",
+    "oido": "Otorrinolaringología", "oidos": "Otorrinolaringología", "garganta": "Otorrinolaringología",
+    "nariz": "Otorrinolaringología", "sinusitis": "Otorrinolaringología",
+    "rodilla": "Traumatología", "hueso": "Traumatología", "fractura": "Traumatología",
+    "espalda": "Traumatología", "tobillo": "Traumatología", "hombro": "Traumatología",
+    "articulaciones": "Reumatología", "artritis": "Reumatología",
+    "orina": "Urología", "rinon": "Urología", "prostata": "Urología",
+    "menstruacion": "Ginecología", "embarazo": "Ginecología", "flujo vaginal": "Ginecología",
+    "ansiedad": "Psiquiatría", "depresion": "Psiquiatría", "insomnio": "Psiquiatría",
+    "diabetes": "Endocrinología", "tiroides": "Endocrinología",
+    "muela": "Odontología", "diente": "Odontología", "encias": "Odontología",
+    # "bebe" solo con artículo o posesivo: sin tildes coincide con el verbo ("bebe mucha agua")
+    "mi bebe": "Pediatría", "el bebe": "Pediatría", "lactante": "Pediatría", "recien nacido": "Pediatría",
+    "nino": "Pediatría", "nina": "Pediatría",
+    "alergia": "Alergología", "fiebre": "Clínica Médica",
+}
+
+DEFAULT_SPECIALTY = "Clínica Médica"
+
+def specialties_from_symptoms(text, gazetteer=None, default=DEFAULT_SPECIALTY, normalizer=None):
+    """
+    Asigna especialidades a un texto de síntomas por palabras clave (sin LLM).
+
+    Con un normalizador, cada especialidad se traduce al valor del dataset y se
+    descartan las que el dataset no tiene (sin coincidencias queda `default`).
+
+    :param text: Descripción de síntomas en español
+    :param gazetteer: Diccionario síntoma -> especialidad (por defecto SYMPTOM_GAZETTEER)
+    :param default: Especialidad a devolver si no hay coincidencias (None para ninguna)
+    :param normalizer: SpecialtyNormalizer del índice activo (opcional)
+    :return: Lista de especialidades sin duplicados, en orden de aparición
+    """
+    if normalizer is not None and not len(normalizer):
+        normalizer = None
+    folded = normalize_text(text)
+    matches = []
+    for symptom, specialty in (gazetteer or SYMPTOM_GAZETTEER).items():
+        found = re.search(rf"\b{re.escape(symptom)}\b", folded)
+        if found:
+            matches.append((found.start(), specialty))
+    specialties = []
+    for _, specialty in sorted(matches):
+        if normalizer is not None:
+            specialty = normalizer.normalize(specialty)
+        if specialty and specialty not in specialties:
+            specialties.append(specialty)
+    if not specialties and default:
+        specialties.append((normalizer.normalize(default) if normalizer is not None else None) or default)
+    return specialties
@@ -0,0 +1,71 @@
+"""
+Recuperación especulativa durante la generación de la clasificación.
+
+Mientras el LLM genera el JSON de clasificación, se analiza la salida parcial;
+apenas aparece un valor completo de "medical_specialty" se inicia la recuperación
+de documentos para esa especialidad. Al terminar la generación se confirma (la
+búsqueda reutiliza los documentos) o se descarta si la especialidad final difiere.
+"""
+import re
+import json
+
+# Valor completo de medical_specialty: cadena cerrada o lista cerrada
+SPECIALTY_VALUE_PATTERN = re.compile(r'"medical_specialty"\s*:\s*("(?:[^"\\]|\\.)*"|\[[^\]]*\])')
+
+def parse_partial_specialty(partial_text):
+    """
+    Busca un valor completo de medical_specialty en una salida parcial del LLM.
+
+    :param partial_text: Texto generado hasta el momento
+    :return: Valor (cadena o lista) o None si todavía no está completo
+    """
+    match = SPECIALTY_VALUE_PATTERN.search(partial_text)
+    if not match:
+        return None
+    try:
+        return json.loads(match.group(1))
+    except ValueError:
+        return None
+
+class SpeculativePrefetch:
+    """
+    Dispara y resuelve una recuperación especulativa para una generación en curso.
+
+    :param search_service: Instancia de SearchService
+    :param locality: Localidad de la consulta (opcional)
+    """
+    def __init__(self, search_service, locality=None):
+        self.search_service = search_service
+        self.locality = locality
+        self.key = None
+        self.speculated = None
+
+    def feed(self, partial_text):
+        """
+        Recibe la salida parcial; inicia la recuperación la primera vez que hay especialidad.
+
+        :param partial_text: Texto generado hasta el momento
+        :return: None
+        """
+        if self.key is not None:
+            return
+        value = parse_partial_specialty(partial_text)
+        if value:
+            self.speculated = value
+            self.key = self.search_service.prefetch({"medical_specialty": value}, self.locality)
+            print(f"[ESPECULACION] Recuperación anticipada para: {value}")
+
+    def settle(self, final_text):
+        """
+        Confirma o descarta la recuperación según la salida final.
+
+        :param final_text: Salida completa del LLM (None si la generación falló)
+        :return: True si se confirmó, False si se descartó, None si no hubo especulación
+        """
+        if self.key is None:
+            return None
+        if final_text and self.search_service.retrieval_key_for(final_text, self.locality) == self.key:
+            return True
+        self.search_service.discard_prefetch(self.key)
+        print(f"[ESPECULACION] Descartada (especulado: {self.speculated})")
+        return False
@@ -0,0 +1,55 @@
+"""
+Utilidades de texto compartidas (estimación de tokens y normalización).
+"""
+import importlib
+import unicodedata
+
+def _load_encoding():
+    """
+    Intenta cargar el codificador de tiktoken si está instalado.
+
+    :return: Codificador de tiktoken o None si no está disponible
+    """
+    try:
+        tiktoken = importlib.import_module("tiktoken")
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+_encoding = _load_encoding()
+
+def estimate_tokens(text):
+    """
+    Estima la cantidad de tokens de un texto.
+
+    Usa tiktoken cuando está disponible; en caso contrario aplica la
+    aproximación habitual de ~4 caracteres por token.
+
+    :param text: Texto a evaluar
+    :return: Cantidad estimada de tokens (int)
+    """
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+def fold_accents(text):
+    """
+    Elimina tildes y diacríticos de un texto (p. ej. "Cardiología" -> "Cardiologia").
+
+    :param text: Texto de entrada
+    :return: Texto sin diacríticos
+    """
+    normalized = unicodedata.normalize("NFKD", str(text))
+    return "".join(ch for ch in normalized if not unicodedata.combining(ch))
+
+def normalize_text(text):
+    """
+    Normaliza un texto para usarlo como clave: minúsculas, sin tildes y con
+    espacios colapsados.
+
+    :param text: Texto de entrada
+    :return: Texto normalizado
+    """
+    return " ".join(fold_accents(text).lower().split())
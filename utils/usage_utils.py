@@ -0,0 +1,202 @@
+"""
+Registro de uso (tokens, tiempo y costo) de cada llamada a modelos.
+
+Cada llamada (generación local o remota de HF, chat de OpenAI, embeddings,
+Whisper) se registra con `model_call`: tokens de entrada y salida, duración,
+modelo y etapa del pipeline en curso. Los registros se acumulan en el libro de
+la solicitud activa (`usage_scope`, propagado con contextvars) y en los
+contadores de métricas (`buscador_model_*`).
+"""
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from .metrics_utils import get_metrics_registry
+from .text_utils import estimate_tokens
+
+# Precios de referencia en USD por 1000 tokens (entrada, salida); los modelos sin precio no suman costo
+PRICES_USD_PER_1K_TOKENS = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "text-embedding-3-large": (0.00013, 0.0),
+}
+
+_current_ledger = contextvars.ContextVar("usage_ledger", default=None)
+_current_stage = contextvars.ContextVar("usage_stage", default=None)
+
+def estimate_cost(model, prompt_tokens, completion_tokens):
+    """
+    Costo estimado de una llamada según PRICES_USD_PER_1K_TOKENS.
+
+    :param model: Identificador del modelo
+    :param prompt_tokens: Tokens de entrada
+    :param completion_tokens: Tokens de salida
+    :return: Costo en USD (0.0 si el modelo no tiene precio)
+    """
+    prompt_price, completion_price = PRICES_USD_PER_1K_TOKENS.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+def _empty_totals():
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "seconds": 0.0, "cost_usd": 0.0}
+
+def _accumulate(totals, record):
+    totals["calls"] += 1
+    totals["prompt_tokens"] += record["prompt_tokens"]
+    totals["completion_tokens"] += record["completion_tokens"]
+    totals["seconds"] += record["seconds"]
+    totals["cost_usd"] += record["cost_usd"]
+
+def _rounded(totals):
+    return dict(totals, seconds=round(totals["seconds"], 4), cost_usd=round(totals["cost_usd"], 6))
+
+class UsageLedger:
+    """
+    Libro de uso de una solicitud.
+    """
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def summary(self):
+        """
+        Totales de la solicitud, por etapa y por modelo, con el detalle de cada llamada.
+
+        :return: Diccionario con total, by_stage, by_model y calls
+        """
+        with self._lock:
+            records = list(self.records)
+        total = _empty_totals()
+        by_stage = {}
+        by_model = {}
+        for record in records:
+            _accumulate(total, record)
+            _accumulate(by_stage.setdefault(record["stage"], _empty_totals()), record)
+            _accumulate(by_model.setdefault(record["model"], _empty_totals()), record)
+        return {
+            "total": _rounded(total),
+            "by_stage": {name: _rounded(totals) for name, totals in by_stage.items()},
+            "by_model": {name: _rounded(totals) for name, totals in by_model.items()},
+            "calls": records,
+        }
+
+@contextmanager
+def usage_scope():
+    """
+    Abre el libro de uso de una solicitud. Si ya hay uno activo, se reutiliza.
+
+    :return: Context manager que entrega el UsageLedger activo
+    """
+    outer = _current_ledger.get()
+    if outer is not None:
+        yield outer
+        return
+    ledger = UsageLedger()
+    token = _current_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _current_ledger.reset(token)
+
+@contextmanager
+def stage_scope(name):
+    """
+    Atribuye a la etapa `name` las llamadas registradas dentro del bloque.
+
+    :param name: Nombre de la etapa del pipeline
+    :return: Context manager
+    """
+    token = _current_stage.set(name)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+
+def record_usage(kind, model, prompt_tokens=0, completion_tokens=0, seconds=0.0, estimated=False, error=False):
+    """
+    Registra una llamada en el libro activo y en las métricas.
+
+    :param kind: Tipo de llamada ("hf_local", "hf_endpoint", "model_server", "chat", "embedding", "transcription")
+    :param model: Identificador del modelo
+    :param prompt_tokens: Tokens de entrada
+    :param completion_tokens: Tokens de salida
+    :param seconds: Duración de la llamada
+    :param estimated: True si los tokens son una estimación local (no informados por el proveedor)
+    :param error: True si la llamada falló
+    :return: Diccionario del registro
+    """
+    stage = _current_stage.get() or "none"
+    record = {
+        "kind": kind,
+        "model": model,
+        "stage": stage,
+        "prompt_tokens": int(prompt_tokens or 0),
+        "completion_tokens": int(completion_tokens or 0),
+        "seconds": round(seconds, 4),
+        "cost_usd": round(estimate_cost(model, prompt_tokens or 0, completion_tokens or 0), 6),
+        "estimated": estimated,
+        "error": error,
+    }
+    ledger = _current_ledger.get()
+    if ledger is not None:
+        ledger.add(record)
+    registry = get_metrics_registry()
+    registry.inc("model_calls_total", kind=kind, model=model, stage=stage)
+    registry.inc("model_tokens_total", record["prompt_tokens"], model=model, stage=stage, direction="prompt")
+    registry.inc("model_tokens_total", record["completion_tokens"], model=model, stage=stage, direction="completion")
+    registry.inc("model_seconds_total", seconds, model=model, stage=stage)
+    registry.inc("model_cost_usd_total", record["cost_usd"], model=model, stage=stage)
+    return record
+
+@contextmanager
+def model_call(kind, model):
+    """
+    Mide una llamada a un modelo y la registra al salir del bloque.
+
+    El bloque completa el diccionario entregado con prompt_tokens,
+    completion_tokens y, si corresponde, estimated=True.
+
+    :param kind: Tipo de llamada ("hf_local", "hf_endpoint", "model_server", "chat", "embedding", "transcription")
+    :param model: Identificador del modelo
+    :return: Context manager que entrega el diccionario a completar
+    """
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "estimated": False}
+    start = time.perf_counter()
+    error = False
+    try:
+        yield usage
+    except GeneratorExit:
+        # El consumidor dejó de leer un streaming (p. ej. al ver <end_of_turn>): no es un error
+        raise
+    except BaseException:
+        # Incluye cancelaciones (p. ej. el perdedor de una llamada con hedging)
+        error = True
+        raise
+    finally:
+        record_usage(kind, model, seconds=time.perf_counter() - start, error=error, **usage)
+
+def chat_usage(response, prompt, usage):
+    """
+    Completa `usage` con los tokens informados por un mensaje de chat de LangChain
+    (o los estima si el proveedor no los informa).
+
+    :param response: AIMessage devuelto por invoke/ainvoke
+    :param prompt: Prompt enviado (para estimar si hace falta)
+    :param usage: Diccionario de model_call
+    :return: None
+    """
+    token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+    if token_usage:
+        usage["prompt_tokens"] = token_usage.get("prompt_tokens", 0)
+        usage["completion_tokens"] = token_usage.get("completion_tokens", 0)
+        return
+    metadata = getattr(response, "usage_metadata", None) or {}
+    if metadata:
+        usage["prompt_tokens"] = metadata.get("input_tokens", 0)
+        usage["completion_tokens"] = metadata.get("output_tokens", 0)
+        return
+    usage["prompt_tokens"] = estimate_tokens(str(prompt))
+    usage["completion_tokens"] = estimate_tokens(getattr(response, "content", "") or "")
+    usage["estimated"] = True
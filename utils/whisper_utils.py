@@ -3,12 +3,16 @@ Utilidades para transcripción de audio.
 """
 import dotenv
 import os
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import io
+from .deadline_utils import timeout_for
+from .metrics_utils import span
+from .usage_utils import model_call
 
 # Cargar variables de entorno
 dotenv.load_dotenv() 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 def transcribe_audio_with_whisper(audio_bytes):
     """
@@ -22,11 +26,34 @@ def transcribe_audio_with_whisper(audio_bytes):
     
     try:
         # Llamar a la API para la transcripcion
-        transcript = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file
-        )
+        with span("whisper", bytes=len(audio_bytes)), model_call("transcription", "whisper-1"):
+            transcript = client.audio.transcriptions.create(
+                model="whisper-1",
+                file=audio_file,
+                timeout=timeout_for(60)
+            )
         # La API devuelve un objeto por lo que se debe devolver "text"
         return transcript.text
     except Exception as e:
         raise Exception(f"Error en transcripción con Whisper: {str(e)}")
+
+async def atranscribe_audio_with_whisper(audio_bytes):
+    """
+    Versión asíncrona de transcribe_audio_with_whisper (no bloquea el event loop).
+
+    :param audio_bytes: Bytes con los datos de audio a transcribir
+    :return: Texto obtenido en la transcripción
+    """
+    audio_file = io.BytesIO(audio_bytes)
+    audio_file.name = "audio.wav"
+    
+    try:
+        with span("whisper", bytes=len(audio_bytes)), model_call("transcription", "whisper-1"):
+            transcript = await async_client.audio.transcriptions.create(
+                model="whisper-1",
+                file=audio_file,
+                timeout=timeout_for(60)
+            )
+        return transcript.text
+    except Exception as e:
+        raise Exception(f"Error en transcripción con Whisper: {str(e)}")
@@ -0,0 +1,408 @@
+"""
+Servicio HTTP sin interfaz para el pipeline de búsqueda.
+
+Expone el mismo `HealthOrchestrator` que la app de Streamlit para otros
+sistemas internos, con un único orquestador por proceso (los modelos se cargan
+una sola vez) y un pool acotado de hilos: cuando todos los hilos están ocupados
+y la espera está llena, responde 503 con Retry-After en lugar de acumular
+solicitudes.
+
+Endpoints:
+    POST /v1/search/text   {"text": "...", "locality": "...", "debug": false}
+    POST /v1/search/audio  audio en el cuerpo (?locality=...&debug=1) o JSON {"audio_base64": "...", "locality": "..."}
+    GET  /healthz          el proceso responde
+    GET  /readyz           modelos e índice cargados y con capacidad (503 si no)
+    GET  /metrics          métricas en formato Prometheus
+
+Uso:
+    python worker.py --port 8080
+    WORKER_THREADS=8 WORKER_MAX_QUEUE=32 python worker.py
+"""
+import os
+import sys
+import json
+import time
+import base64
+import signal
+import logging
+import argparse
+import binascii
+import threading
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("worker")
+
+class QueueFull(Exception):
+    pass
+
+class WorkerPool:
+    """
+    Pool de hilos con capacidad acotada: `threads` en ejecución más `max_queue` en espera.
+
+    :param threads: Hilos que procesan solicitudes
+    :param max_queue: Solicitudes que pueden esperar un hilo libre
+    """
+    def __init__(self, threads, max_queue):
+        self.capacity = threads + max_queue
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="worker")
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Encola una tarea si hay capacidad.
+
+        :return: Future de la tarea
+        :raises QueueFull: Si los hilos y la espera están ocupados
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFull()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def saturated(self):
+        with self._lock:
+            return self.in_flight >= self.capacity
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+class WorkerState:
+    """
+    Estado del servicio: configuración, pool y orquestador (cargados en segundo plano) y errores de carga.
+
+    :param threads: Hilos de procesamiento (None = APP_CONFIG["worker"]["hilos"])
+    :param max_queue: Solicitudes en espera (None = APP_CONFIG["worker"]["max_en_espera"])
+    """
+    def __init__(self, threads=None, max_queue=None):
+        self.threads = threads
+        self.max_queue = max_queue
+        self.settings = None
+        self.pool = None
+        self.orchestrator = None
+        self.load_error = None
+        self.started_at = time.time()
+
+    def load(self):
+        """
+        Carga la configuración, los modelos y el índice (importar `application` carga los modelos).
+
+        :return: None
+        """
+        try:
+            from application.config import APP_CONFIG
+            from application.orchestration import HealthOrchestrator
+            from utils.rag_utils import get_health_service
+
+            self.settings = APP_CONFIG["worker"]
+            self.pool = WorkerPool(
+                self.threads or self.settings["hilos"],
+                self.settings["max_en_espera"] if self.max_queue is None else self.max_queue
+            )
+            get_health_service().warmup()
+            self.orchestrator = HealthOrchestrator()
+            logger.info("Modelos e índice cargados; el servicio está listo")
+        except Exception as e:
+            self.load_error = str(e)
+            logger.error(f"Error cargando el orquestador: {e}", exc_info=e)
+
+def response_body(result, debug=False):
+    """
+    Resultado de process_* para la respuesta HTTP.
+
+    :param result: Diccionario de process_text_symptoms o process_audio_symptoms
+    :param debug: True para incluir la traza de spans y el detalle de llamadas a modelos
+    :return: Diccionario serializable
+    """
+    body = dict(result)
+    if not debug:
+        body.pop("trace", None)
+        if body.get("usage"):
+            body["usage"] = body["usage"]["total"]
+    return body
+
+def _is_true(value):
+    return str(value).lower() in ("1", "true", "yes")
+
+def _optional_string(request, key):
+    """
+    Campo de texto opcional de un cuerpo JSON.
+
+    :param request: Diccionario del cuerpo
+    :param key: Nombre del campo
+    :return: Texto sin espacios extremos o None si falta o está vacío
+    :raises ValueError: Si el campo no es texto
+    """
+    value = request.get(key)
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"El campo {key} debe ser texto")
+    return value.strip() or None
+
+def make_handler(state):
+    """
+    Construye la clase manejadora HTTP ligada al estado del servicio.
+
+    :param state: Instancia de WorkerState
+    :return: Subclase de BaseHTTPRequestHandler
+    """
+    class WorkerHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.info(f"{self.address_string()} {format % args}")
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            request_id = self.headers.get("X-Request-Id")
+            if request_id:
+                self.send_header("X-Request-Id", request_id)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_error(self, status, message, headers=None):
+            self._send_json(status, {"error": message}, headers)
+
+        def _read_body(self, limit):
+            """
+            Lee el cuerpo de la solicitud.
+
+            :param limit: Tamaño máximo en bytes
+            :return: Bytes del cuerpo o None si supera el límite
+            :raises ValueError: Si Content-Length no es un entero no negativo
+            """
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                # Sin un largo válido no se puede ubicar el fin del cuerpo en la conexión
+                self.close_connection = True
+                raise ValueError("Content-Length inválido")
+            if length > limit:
+                # Se descarta el cuerpo para poder responder en la misma conexión
+                self.close_connection = True
+                return None
+            return self.rfile.read(length) if length else b""
+
+        def _run(self, fn, *args, **kwargs):
+            """
+            Ejecuta una solicitud en el pool y responde con su resultado.
+
+            La tarea corre con un plazo (deadline_scope) que vence junto con la
+            espera del manejador: tras un 504 las etapas pasan a sus variantes
+            rápidas y los clientes de red acotan sus timeouts, por lo que el hilo
+            y el lugar en el pool se liberan poco después. Si la tarea todavía
+            estaba en espera, se cancela y no llega a ejecutarse.
+
+            :return: None
+            """
+            timeout = state.settings["espera_maxima_segundos"]
+            expires_at = time.monotonic() + timeout
+
+            def task():
+                from utils.deadline_utils import deadline_scope
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0:
+                    # Ya se respondió 504 mientras esperaba un hilo libre
+                    raise FutureTimeoutError()
+                with deadline_scope(remaining):
+                    return fn(*args, **kwargs)
+
+            try:
+                future = state.pool.submit(task)
+            except QueueFull:
+                self._send_error(503, "Servicio saturado, reintente en unos segundos", {"Retry-After": "1"})
+                return
+            try:
+                result, debug = future.result(timeout=timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                self._send_error(504, "Tiempo de espera agotado procesando la solicitud")
+                return
+            except Exception as e:
+                logger.error(f"Error procesando la solicitud: {e}", exc_info=e)
+                self._send_error(500, f"Error procesando la solicitud: {e}")
+                return
+            self._send_json(200, response_body(result, debug))
+
+        def do_GET(self):
+            path = urlparse(self.path).path.rstrip("/")
+            if path == "/healthz":
+                self._send_json(200, {"status": "ok", "uptime_seconds": round(time.time() - state.started_at, 1)})
+            elif path == "/readyz":
+                self._readiness()
+            elif path == "/metrics":
+                from utils.metrics_utils import export_prometheus
+                body = export_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self._send_error(404, "Ruta no encontrada")
+
+        def _readiness(self):
+            if state.load_error:
+                self._send_json(503, {"ready": False, "error": state.load_error})
+            elif state.orchestrator is None:
+                self._send_json(503, {"ready": False, "reason": "cargando modelos e índice"})
+            elif state.pool.saturated():
+                self._send_json(503, {"ready": False, "reason": "saturado", "in_flight": state.pool.in_flight})
+            else:
+                from utils.rag_utils import get_health_service
+                self._send_json(200, {
+                    "ready": True,
+                    "in_flight": state.pool.in_flight,
+                    "capacity": state.pool.capacity,
+                    "index_version": get_health_service().index_version,
+                })
+
+        def do_POST(self):
+            parsed = urlparse(self.path)
+            path = parsed.path.rstrip("/")
+            if path not in ("/v1/search/text", "/v1/search/audio"):
+                self._send_error(404, "Ruta no encontrada")
+                return
+            if state.orchestrator is None:
+                self._send_error(503, "El servicio todavía no está listo", {"Retry-After": "5"})
+                return
+            query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+            if path == "/v1/search/text":
+                self._search_text(query)
+            else:
+                self._search_audio(query)
+
+        def _search_text(self, query):
+            try:
+                raw = self._read_body(64 * 1024)
+            except ValueError as e:
+                self._send_error(400, str(e))
+                return
+            if raw is None:
+                self._send_error(413, "Cuerpo demasiado grande")
+                return
+            try:
+                request = json.loads(raw or b"{}")
+            except ValueError:
+                self._send_error(400, "El cuerpo debe ser JSON")
+                return
+            if not isinstance(request, dict):
+                self._send_error(400, "El cuerpo debe ser un objeto JSON")
+                return
+            try:
+                text = _optional_string(request, "text") or ""
+                locality = _optional_string(request, "locality") or query.get("locality") or None
+            except ValueError as e:
+                self._send_error(400, str(e))
+                return
+            is_valid, message = state.orchestrator.validate_input(text)
+            if not is_valid:
+                self._send_error(400, message)
+                return
+            debug = _is_true(request.get("debug", query.get("debug", False)))
+            self._run(lambda: (state.orchestrator.process_text_symptoms(text, locality=locality), debug))
+
+        def _search_audio(self, query):
+            max_mb = state.settings["max_mb_audio"]
+            max_audio_bytes = int(max_mb * 1024 * 1024)
+            # En JSON el audio viene en base64 (un tercio más grande)
+            try:
+                raw = self._read_body(max_audio_bytes * 2)
+            except ValueError as e:
+                self._send_error(400, str(e))
+                return
+            if raw is None:
+                self._send_error(413, f"El audio supera {max_mb} MB")
+                return
+            locality = query.get("locality") or None
+            debug = _is_true(query.get("debug", False))
+            if (self.headers.get("Content-Type") or "").startswith("application/json"):
+                try:
+                    request = json.loads(raw or b"{}")
+                except ValueError:
+                    self._send_error(400, "El cuerpo debe ser JSON")
+                    return
+                if not isinstance(request, dict):
+                    self._send_error(400, "El cuerpo debe ser un objeto JSON")
+                    return
+                try:
+                    audio_base64 = _optional_string(request, "audio_base64") or ""
+                    locality = _optional_string(request, "locality") or locality
+                    audio_bytes = base64.b64decode(audio_base64, validate=True)
+                except (ValueError, binascii.Error):
+                    self._send_error(400, "Se espera JSON con audio_base64 válido y locality de texto")
+                    return
+                debug = _is_true(request.get("debug", debug))
+            else:
+                audio_bytes = raw
+            if not audio_bytes:
+                self._send_error(400, "No se recibió audio")
+                return
+            if len(audio_bytes) > max_audio_bytes:
+                self._send_error(413, f"El audio supera {max_mb} MB")
+                return
+            self._run(lambda: (state.orchestrator.process_audio_symptoms(audio_bytes, locality=locality), debug))
+
+    return WorkerHandler
+
+def start_server(host="0.0.0.0", port=8080, threads=None, max_queue=None):
+    """
+    Inicia el servicio en un hilo en segundo plano; los modelos se cargan en otro hilo
+    (/healthz responde de inmediato y /readyz cuando terminan de cargarse).
+
+    :return: Tupla (servidor, estado); detener con servidor.shutdown() y estado.pool.shutdown()
+    """
+    state = WorkerState(threads, max_queue)
+    threading.Thread(target=state.load, name="worker-load", daemon=True).start()
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="worker-http", daemon=True).start()
+    return server, state
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio HTTP del buscador de prestadores")
+    parser.add_argument("--host", default=os.getenv("WORKER_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("WORKER_PORT", "8080")))
+    parser.add_argument("--threads", type=int, default=None, help="Hilos de procesamiento (WORKER_THREADS)")
+    parser.add_argument("--max-queue", type=int, default=None, help="Solicitudes en espera (WORKER_MAX_QUEUE)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    server, state = start_server(args.host, args.port, args.threads, args.max_queue)
+    print(f"Servicio escuchando en http://{args.host}:{args.port} (cargando modelos e índice...)", flush=True)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    stop.wait()
+    print("Deteniendo: se terminan las solicitudes en curso...", flush=True)
+    server.shutdown()
+    if state.pool is not None:
+        state.pool.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())